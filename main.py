@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import signal
 import threading
 from contextlib import asynccontextmanager
 
@@ -6,10 +8,15 @@ from fastapi import FastAPI, status
 from fastapi.responses import ORJSONResponse
 from pydantic import ValidationError
 
-from router.route import module_router, sms_router, schedule_router
-from services import scheduler
+from router.route import module_router, sms_router, schedule_router, notification_router, metrics_router, health_router
+from services import scheduler, start_scheduler
 from schemas.schemas import ErrorModel, ErrorDetail
-from services.initialize import sms_listener, initialize_module
+from services.dispatcher import dispatcher
+from services.initialize import sms_listener, initialize_in_background, run_campaign, campaign_stop, restart_stop
+from services.utils.campaigns import campaigns
+from services.utils.command_scheduler import CommandQueueFull, CommandDeadlineExceeded
+from services.utils.config_parser import config
+from services.utils.modem_pool import modems, NoModemAvailable, UnknownModem
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger("PyAirLink")
@@ -17,26 +24,59 @@ logger = logging.getLogger("PyAirLink")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scheduler.start()
-    initialize_module()
+    if hasattr(signal, 'SIGHUP'):
+        # kill -HUP 重新加载配置，推送渠道的密钥等无需重启即可更新
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, config.reload)
+    config.watch()
+    # 调度器与模块初始化都在后台进行，程序立即开始响应请求，初始化进度见 /health 与 /ready
+    scheduler_task = asyncio.create_task(start_scheduler())
+    dispatcher.start()
+    modems.start()
     stop_event = threading.Event()
-    sms_thread = threading.Thread(target=sms_listener, args=(stop_event,), daemon=True)
-    sms_thread.start()
-    logger.info("sms_listener started")
+    init_threads = []
+    sms_threads = []
+    for modem in modems:
+        init_thread = threading.Thread(target=initialize_in_background, args=(modem, stop_event),
+                                       name=f"init-{modem.name}", daemon=True)
+        # 每个模块一个监听线程，各自读取自己 SIM 卡上的短信，模块就绪后开始读取
+        sms_thread = threading.Thread(target=sms_listener, args=(stop_event, modem), name=f"sms-{modem.name}",
+                                      daemon=True)
+        init_thread.start()
+        sms_thread.start()
+        init_threads.append(init_thread)
+        sms_threads.append(sms_thread)
+        logger.info(f"sms_listener started for modem {modem.name}")
+    for campaign_id in campaigns.interrupted():
+        # 上次退出时未发送完的群发任务，从中断处继续
+        logger.info(f"Resuming campaign {campaign_id}")
+        scheduler.add_job(func=run_campaign, args=(campaign_id,), id=f'campaign-{campaign_id}-resume',
+                          replace_existing=True, jobstore='default')
     try:
         yield
     finally:
+        campaign_stop.set()
+        restart_stop.set()
+        scheduler_task.cancel()
         if scheduler.running:
             scheduler.shutdown()
         stop_event.set()
-        sms_thread.join()
+        for sms_thread in sms_threads:
+            sms_thread.join()
         logger.info("sms_listener stopped")
+        # 停止串口工作线程后，仍在等待模块响应的初始化随之结束
+        modems.stop()
+        for init_thread in init_threads:
+            init_thread.join(timeout=10)
+        dispatcher.stop()
 
 
 app = FastAPI(lifespan=lifespan, title='PyAirLink API', version='0.0.1')
 app.include_router(module_router)
 app.include_router(sms_router)
 app.include_router(schedule_router)
+app.include_router(notification_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
 
 
 @app.exception_handler(ValidationError)
@@ -48,6 +88,26 @@ async def validation_exception_handler(exc: ValidationError):
     )
 
 
+@app.exception_handler(CommandQueueFull)
+async def command_queue_full_handler(request, exc: CommandQueueFull):
+    return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "fail", "message": str(exc)})
+
+
+@app.exception_handler(NoModemAvailable)
+async def no_modem_handler(request, exc: NoModemAvailable):
+    return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "fail", "message": str(exc)})
+
+
+@app.exception_handler(UnknownModem)
+async def unknown_modem_handler(request, exc: UnknownModem):
+    return ORJSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"status": "fail", "message": f"modem {exc.args[0]} not found"})
+
+
+@app.exception_handler(CommandDeadlineExceeded)
+async def command_deadline_handler(request, exc: CommandDeadlineExceeded):
+    return ORJSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"status": "fail", "message": str(exc)})
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=10103, reload=False)
\ No newline at end of file
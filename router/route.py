@@ -1,12 +1,29 @@
-from typing import List, Annotated
+import asyncio
+import time
+from typing import List, Annotated, Optional, Union
+from zoneinfo import ZoneInfo
 
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import ORJSONResponse
+import orjson
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
 
+import services
 from services import scheduler
+from services.dispatcher import dispatcher
 from schemas import schemas
-from services.initialize import send_sms, web_send_at_command, web_restart
+from services.initialize import send_sms, web_restart, send_sms_async, web_send_at_command_async, web_restart_async, send_sms_batch, run_campaign
 from services.utils.commands import at_commands
+from services.utils import metrics
+from services.utils.campaigns import campaigns
+from services.utils.config_parser import config
+from services.utils.event_stream import sms_events
+from services.utils.inbox import inbox
+from services.utils.modem_pool import modems
+from services.utils.sms import count_segments
+
+_started = time.monotonic()
 
 module_router = APIRouter(
     prefix="/api/v1/module",
@@ -20,6 +37,20 @@ sms_router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+notification_router = APIRouter(
+    prefix="/api/v1/notification",
+    tags=["notification"],
+    responses={404: {"description": "Not found"}},
+)
+
+metrics_router = APIRouter(
+    tags=["metrics"],
+)
+
+health_router = APIRouter(
+    tags=["health"],
+)
+
 schedule_router = APIRouter(
     prefix="/api/v1/schedule",
     tags=["schedule"],
@@ -34,7 +65,8 @@ schedule_router = APIRouter(
 """
                    )
 async def command_base(params: Annotated[schemas.CommandBaseRequest, Query()]):
-    response = web_send_at_command(at_commands.base(params.command), keywords=params.keyword, timeout=params.timeout)
+    response = await web_send_at_command_async(at_commands.base(params.command), keywords=params.keyword, timeout=params.timeout,
+                                               modem_name=params.modem)
     return {'status': 'success' if response else 'failure', 'content': response}
 
 
@@ -43,21 +75,202 @@ async def command_base(params: Annotated[schemas.CommandBaseRequest, Query()]):
 """
 """
                    )
-async def command_reset():
-    response = web_restart()
+async def command_reset(modem: Optional[str] = Query(None, description="模块名，不传则为 [SERIAL] 对应的模块")):
+    response = await web_restart_async(modem)
     return {'status': 'success' if response else 'failure', 'content': ''}
 
 
-@sms_router.post("/sms/send", response_model=schemas.CommandResponse, summary='发送短信',
+@module_router.get("/queue", response_model=List[schemas.CommandQueueStats], summary='查看串口任务队列',
+                   description=
+"""
+各优先级（即时发送 > 收短信 > 定时/批量 > 诊断）的排队数与排队等待时间
+"""
+                   )
+async def command_queue(modem: Optional[str] = Query(None, description="模块名，不传则为 [SERIAL] 对应的模块")):
+    return modems.get(modem).scheduler.stats()
+
+
+@module_router.get("/modems", response_model=List[schemas.ModemHealth], summary='查看所有模块状态',
                    description=
 """
-尚未支持长短信，不要大于70个字符
+模块池中各模块的就绪状态、熔断状态、排队任务数与发送耗时，发送短信只分配给已就绪且未熔断的模块
+"""
+                   )
+async def list_modems():
+    return modems.stats()
+
+
+@sms_router.post("/sms/send", response_model=schemas.SendSMSResponse, summary='发送短信',
+                   description=
+"""
+自动选择编码：纯GSM字符使用7-bit编码（单条160字符），否则使用UCS2（单条70字符）。
+超过单条长度时按长短信拆分发送，最多10段，返回中包含编码与段数
 """
                    )
 async def immediately_send_sms(params: Annotated[schemas.SendSMSRequest, Query()]):
-    response = send_sms(f'+{params.country}{params.number}', text=params.message)
+    encoding, segments = count_segments(params.message)
+    response = await send_sms_async(f'+{params.country}{params.number}', text=params.message)
     return {'status': 'success' if response else 'failure',
-            'content': f'to:+{params.country}{params.number}, message:{params.message}'}
+            'content': f'to:+{params.country}{params.number}, message:{params.message}',
+            'encoding': encoding, 'segments': segments}
+
+
+@sms_router.post("/sms/batch", response_model=schemas.BatchSendSMSResult, summary='批量发送短信',
+                   description=
+"""
+请求体为短信列表，分配到各可用模块发送（每个模块只设置一次PDU模式，并用AT+CMMS保持链路）。
+以 NDJSON 流式返回，每发送完一条输出一行 BatchSendSMSResult。
+"""
+                   )
+async def batch_send_sms(params: schemas.BatchSendSMSRequest):
+    messages = [(f'+{item.country}{item.number}', item.message) for item in params.messages]
+
+    async def results():
+        async for result in send_sms_batch(messages):
+            yield orjson.dumps(result) + b'\n'
+
+    return StreamingResponse(results(), media_type='application/x-ndjson')
+
+
+@sms_router.get("/inbox", response_model=schemas.InboxPage, summary='查询收件箱',
+                   description=
+"""
+按发送方、接收时间、正文文字过滤收到的短信，按接收时间倒序返回。
+结果中的 next_cursor 不为空时，把它作为 cursor 参数请求下一页。未带时区的时间按 Asia/Shanghai 处理
+"""
+                   )
+async def list_inbox(params: Annotated[schemas.InboxQuery, Query()]):
+    since, until = (value.replace(tzinfo=ZoneInfo("Asia/Shanghai")) if value and value.tzinfo is None else value
+                    for value in (params.since, params.until))
+    try:
+        items, next_cursor = await asyncio.to_thread(inbox.query, sender=params.sender, since=since, until=until,
+                                                     text=params.q, cursor=params.cursor, limit=params.limit)
+    except ValueError as e:
+        return ORJSONResponse(status_code=400, content={"status": "fail", "message": str(e)})
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+@sms_router.get("/inbox/{message_id}", response_model=schemas.InboxMessage, summary='查看收件箱中的短信',
+                   description=
+"""
+"""
+                   )
+async def get_inbox_message(message_id: int):
+    message = await asyncio.to_thread(inbox.get, message_id)
+    if message is None:
+        return ORJSONResponse(status_code=404, content={"status": "fail", "message": f"message {message_id} not found"})
+    return message
+
+
+def _sse(event, data, event_id=None):
+    head = f'id: {event_id}\nevent: {event}\n' if event_id is not None else f'event: {event}\n'
+    return head.encode() + b'data: ' + orjson.dumps(data) + b'\n\n'
+
+
+@sms_router.get("/stream", summary='订阅短信事件流',
+                   description=
+"""
+Server-Sent Events 流，推送以下事件：
+- sms：收到的短信，id 为收件箱 id
+- send：发送短信的结果（to、status、segments、sent）
+- status-report：短信回执
+
+断线重连时带上 last_id 参数（或 Last-Event-ID 请求头），先按 id 顺序补发之后收到的短信，再继续推送新事件。
+客户端处理过慢导致缓冲区溢出时，先推送 dropped 事件（count 为丢弃的事件数），缺失的短信同样从收件箱补发，send/status-report 事件不补发
+"""
+                   )
+async def stream_sms(last_id: Optional[int] = Query(None, ge=0, description="最后收到的短信 id"),
+                     last_event_id: Optional[str] = Header(None)):
+    if last_id is None and last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+    cursor = last_id
+
+    async def replay():
+        nonlocal cursor
+        while True:
+            rows = await asyncio.to_thread(inbox.after, cursor)
+            for row in rows:
+                cursor = row['id']
+                yield _sse('sms', row, row['id'])
+            if len(rows) < 500:
+                return
+
+    async def events():
+        nonlocal cursor
+        # 先订阅再读取收件箱，补发与实时推送之间不会漏掉短信，重复的按 id 跳过
+        subscription = sms_events.subscribe()
+        try:
+            if cursor is None:
+                cursor = await asyncio.to_thread(inbox.last_id)
+            yield b'retry: 3000\n\n'
+            async for chunk in replay():
+                yield chunk
+            while True:
+                if subscription.dropped:
+                    yield _sse('dropped', {'count': subscription.dropped})
+                    subscription.dropped = 0
+                    async for chunk in replay():
+                        yield chunk
+                try:
+                    event, data, event_id = await subscription.get(timeout=15)
+                except asyncio.TimeoutError:
+                    yield b': keep-alive\n\n'
+                    continue
+                if event_id is not None:
+                    if event_id <= cursor:
+                        continue
+                    cursor = event_id
+                yield _sse(event, data, event_id)
+        finally:
+            sms_events.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@metrics_router.get("/metrics", summary='Prometheus 指标',
+                   description=
+"""
+串口指令耗时与结果、任务排队时间、收发短信数量与耗时、PDU 解析失败、各推送渠道的耗时与结果等，Prometheus 文本格式
+"""
+                   )
+async def prometheus_metrics():
+    # 部分指标在输出时查询发件箱数据库
+    content = await asyncio.to_thread(metrics.REGISTRY.render)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
+
+
+def _health(status):
+    return {
+        'status': status,
+        'uptime': round(time.monotonic() - _started, 3),
+        'scheduler': scheduler.running,
+        'scheduler_error': services.scheduler_error,
+        'modems': [{'name': modem.name, 'ready': modem.ready, 'stage': modem.stage, 'init_error': modem.init_error}
+                   for modem in modems],
+    }
+
+
+@health_router.get("/health", response_model=schemas.HealthResponse, summary='存活探针',
+                   description=
+"""
+程序在运行即返回 200，不访问串口与数据库；模块初始化进度见 modems[].stage
+"""
+                   )
+async def health():
+    return _health('ok')
+
+
+@health_router.get("/ready", response_model=schemas.HealthResponse, summary='就绪探针',
+                   description=
+"""
+至少有一个模块已可收发短信时返回 200，否则返回 503
+"""
+                   )
+async def ready():
+    if any(modem.ready for modem in modems):
+        return _health('ok')
+    return ORJSONResponse(status_code=503, content=_health('not_ready'))
 
 
 @schedule_router.get("/schedule/list", response_model=List[schemas.ListScheduleJob], summary='查看定时任务',
@@ -87,6 +300,24 @@ async def del_schedule(job_id: str = Query()):
     return 404
 
 
+def _job_options(params: Union[schemas.ScheduleRestartRequest, schemas.CampaignRequest]):
+    """
+    add_job 的公共参数，未指定的并发、合并与补执行选项使用配置 [SCHEDULER] 中的当前值
+    """
+    defaults = config.scheduler()
+    options = {
+        'max_instances': params.max_instances or defaults.max_instances,
+        'coalesce': defaults.coalesce if params.coalesce is None else params.coalesce,
+        'misfire_grace_time': params.misfire_grace_time or defaults.misfire_grace_time,
+    }
+    if isinstance(params, schemas.ScheduleRestartRequest):
+        options['id'] = params.id
+        # next_run_time=None 会添加为暂停状态的任务，未指定时不传
+        if params.next_run_time is not None:
+            options['next_run_time'] = params.next_run_time
+    return options
+
+
 @schedule_router.post("/schedule/add/sms", response_model=schemas.CommandResponse, summary='添加定时发短信任务',
                    description=
 """
@@ -95,7 +326,8 @@ async def del_schedule(job_id: str = Query()):
 async def add_sms_schedule(params: Annotated[schemas.ScheduleSendSMSRequest, Query()]):
     try:
         job = scheduler.add_job(func=send_sms, args=(f'+{params.country}{params.number}', params.message,),
-                                id=params.id, trigger='interval', seconds=params.seconds, jobstore='default')
+                                trigger='interval', seconds=params.seconds, jobstore='default',
+                                **_job_options(params))
         return {'status': 'success', 'content': job.id}
     except Exception as e:
         return ORJSONResponse(status_code=400, content={"status": "error", "message": f"An error occurred: {str(e)}"})
@@ -108,7 +340,88 @@ async def add_sms_schedule(params: Annotated[schemas.ScheduleSendSMSRequest, Que
                    )
 async def add_restart_schedule(params: Annotated[schemas.ScheduleRestartRequest, Query()]):
     try:
-        job = scheduler.add_job(func=web_restart, trigger='interval', seconds=params.seconds, jobstore='default')
+        # GPRS 附着最多等待一个周期，避免任务一直占用线程池
+        job = scheduler.add_job(func=web_restart, kwargs={'attach_timeout': params.seconds}, trigger='interval',
+                                seconds=params.seconds, jobstore='default', **_job_options(params))
         return {'status': 'success', 'content': job.id}
     except Exception as e:
         return ORJSONResponse(status_code=400, content={"status": "error", "message": f"An error occurred: {str(e)}"})
+
+
+@schedule_router.post("/campaign", response_model=schemas.Campaign, summary='添加群发任务',
+                   description=
+"""
+收件人列表只保存一次，整个群发任务在定时任务中只占一项，执行时再逐页读取收件人，按 rate 限速分配到各模块发送。
+run_date 为单次发送的时间，cron 为周期发送的 crontab 表达式，两者都为空时立即发送。
+"""
+                   )
+async def add_campaign(params: schemas.CampaignRequest):
+    try:
+        if params.cron:
+            trigger = CronTrigger.from_crontab(params.cron, timezone=scheduler.timezone)
+            spec = {'type': 'cron', 'cron': params.cron}
+        else:
+            trigger = DateTrigger(run_date=params.run_date, timezone=scheduler.timezone)
+            spec = {'type': 'date', 'run_date': trigger.run_date}
+    except ValueError as e:
+        return ORJSONResponse(status_code=400, content={"status": "error", "message": f"Invalid trigger: {e}"})
+    campaign_id = await asyncio.to_thread(campaigns.create, params.name, params.message, spec, params.recipients,
+                                          params.rate)
+    scheduler.add_job(func=run_campaign, args=(campaign_id,), trigger=trigger, id=f'campaign-{campaign_id}',
+                      jobstore='default', **_job_options(params))
+    return await get_campaign(campaign_id)
+
+
+@schedule_router.get("/campaign", response_model=List[schemas.Campaign], summary='查看群发任务',
+                   description=
+"""
+所有群发任务及本轮发送进度
+"""
+                   )
+async def list_campaigns():
+    items = await asyncio.to_thread(campaigns.list)
+    for item in items:
+        item['next_run_time'] = _campaign_next_run(item['id'])
+    return items
+
+
+@schedule_router.get("/campaign/{campaign_id}", response_model=schemas.Campaign, summary='查看群发任务进度',
+                   description=
+"""
+"""
+                   )
+async def get_campaign(campaign_id: int):
+    item = await asyncio.to_thread(campaigns.get, campaign_id)
+    if item is None:
+        return ORJSONResponse(status_code=404, content={"status": "fail", "message": f"campaign {campaign_id} not found"})
+    item['next_run_time'] = _campaign_next_run(campaign_id)
+    return item
+
+
+@schedule_router.delete("/campaign/{campaign_id}", response_model=schemas.CommandResponse, summary='取消群发任务',
+                   description=
+"""
+取消后不再执行，正在发送的一轮最多再提交 20 条短信后停止
+"""
+                   )
+async def cancel_campaign(campaign_id: int):
+    if not await asyncio.to_thread(campaigns.cancel, campaign_id):
+        return ORJSONResponse(status_code=404, content={"status": "fail", "message": f"campaign {campaign_id} not found or already finished"})
+    if scheduler.get_job(f'campaign-{campaign_id}'):
+        scheduler.remove_job(f'campaign-{campaign_id}')
+    return {'status': 'success', 'content': str(campaign_id)}
+
+
+def _campaign_next_run(campaign_id):
+    job = scheduler.get_job(f'campaign-{campaign_id}')
+    return job.next_run_time if job else None
+
+
+@notification_router.get("/health", response_model=List[schemas.NotificationChannelHealth], summary='查看推送渠道状态',
+                         description=
+"""
+各推送渠道的熔断状态、调用/失败次数、推送耗时与发件箱积压情况
+"""
+                         )
+async def notification_health():
+    return dispatcher.health()
@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import List, Union, Optional, Any, Dict
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from services.utils.sms import count_segments, MAX_SEGMENTS
 
 
 class ErrorDetail(BaseModel):
@@ -34,6 +36,7 @@ class Command(BaseModel):
 
 class CommandRequest(Command):
     command: str
+    modem: Optional[str] = Field(default=None, description="模块名，对应配置节 [SERIAL:<name>]，不传则为 [SERIAL] 对应的模块")
 
 
 class CommandBaseRequest(CommandRequest):
@@ -44,6 +47,98 @@ class CommandResponse(BaseModel):
     status: str
     content: str
 
+
+class CommandQueueStats(BaseModel):
+    priority: str = Field(..., description="优先级分类")
+    queued: int = Field(..., description="当前排队数")
+    maxsize: int = Field(..., description="队列上限")
+    submitted: int
+    completed: int
+    rejected: int = Field(..., description="因队列已满被拒绝的数量")
+    expired: int = Field(..., description="排队超过截止时间未执行的数量")
+    wait_avg_ms: float
+    wait_max_ms: float
+    wait_p50_ms: float = Field(..., description="最近1000个任务的排队时间中位数")
+    wait_p99_ms: float
+
+
+class ModemHealth(BaseModel):
+    name: str = Field(..., description="模块名，[SERIAL] 对应的模块为 default")
+    port: str
+    ready: bool = Field(..., description="模块是否已初始化，只有已就绪的模块会被分配短信")
+    stage: str = Field(..., description="初始化阶段：pending、probe、sim、pdu_mode、charset、storage、cnmi、"
+                                        "attach（已可收发短信，等待GPRS附着）、ready、failed")
+    init_error: Optional[str] = Field(None, description="最近一次初始化失败的阶段与原因")
+    load: int = Field(..., description="排队中与正在执行的串口任务数")
+    state: str = Field(..., description="熔断状态：closed 正常，open 连续发送失败暂停分配，half_open 试探中")
+    calls: int = Field(..., description="发送短信次数")
+    failures: int
+    short_circuited: int
+    consecutive_failures: int
+    last_error: Optional[str]
+    latency_avg_ms: float = Field(..., description="发送一条短信（含排队）的平均耗时")
+    latency_p50_ms: float
+    latency_p99_ms: float
+
+
+class ModemStage(BaseModel):
+    name: str
+    ready: bool
+    stage: str
+    init_error: Optional[str] = None
+
+
+class HealthResponse(BaseModel):
+    status: str = Field(..., description="ok 或 not_ready")
+    uptime: float = Field(..., description="启动后经过的秒数")
+    scheduler: bool = Field(..., description="定时任务调度器是否已启动")
+    scheduler_error: Optional[str] = Field(None, description="调度器启动失败的原因，此时定时任务与群发任务都不会执行")
+    modems: List[ModemStage]
+
+
+class NotificationChannelHealth(BaseModel):
+    channel: str = Field(..., description="推送渠道")
+    state: str = Field(..., description="熔断状态：closed 正常，open 熔断中，half_open 冷却结束等待试探")
+    calls: int
+    failures: int
+    short_circuited: int = Field(..., description="熔断期间被跳过的推送次数")
+    consecutive_failures: int
+    last_error: Optional[str] = None
+    latency_avg_ms: float
+    latency_p50_ms: float = Field(..., description="最近1000次推送耗时中位数")
+    latency_p99_ms: float
+    outbox: Dict[str, int] = Field(..., description="发件箱中该渠道各状态(pending/delivered/failed)的记录数")
+
+
+class InboxMessage(BaseModel):
+    id: int
+    sender: str = Field(..., description="发送方号码")
+    received: datetime = Field(..., description="短信中心时间戳(SCTS)")
+    body: str
+    pdu: Optional[str] = Field(None, description="原始PDU，长短信各分段以换行分隔")
+    delivery: str = Field(..., description="推送状态：none 未推送，pending 推送中，failed 推送失败，delivered 已送达")
+    deliveries: Dict[str, str] = Field(..., description="各渠道的推送状态")
+
+
+class InboxPage(BaseModel):
+    items: List[InboxMessage]
+    next_cursor: Optional[str] = Field(None, description="下一页的游标，为空表示没有更多记录")
+
+
+class InboxQuery(BaseModel):
+    sender: Optional[str] = Field(None, description="发送方号码，精确匹配")
+    since: Optional[datetime] = Field(None, description="接收时间下限(含)")
+    until: Optional[datetime] = Field(None, description="接收时间上限(不含)")
+    q: Optional[str] = Field(None, description="正文包含的文字，3个字符及以上使用全文索引")
+    cursor: Optional[str] = Field(None, description="上一页返回的 next_cursor")
+    limit: int = Field(50, ge=1, le=500)
+
+
+class SendSMSResponse(CommandResponse):
+    encoding: str = Field(..., description="短信编码，纯GSM字符使用gsm7(每段160/153字符)，否则ucs2(每段70/67字符)")
+    segments: int = Field(..., description="短信拆分的段数")
+
+
 class SendSMSRequest(BaseModel):
     country: int
     number: int
@@ -52,11 +147,24 @@ class SendSMSRequest(BaseModel):
     @field_validator('message')
     @classmethod
     def check_message(cls, v: str) -> str:
-        if len(v) > 70:
-            raise ValueError(f"Do not support long sms yet, makesure less than 71 characters.")
+        encoding, segments = count_segments(v)
+        if segments > MAX_SEGMENTS:
+            raise ValueError(f"Message too long, {encoding} encoding needs {segments} segments, at most {MAX_SEGMENTS}.")
         return v
 
 
+class BatchSendSMSRequest(BaseModel):
+    messages: List[SendSMSRequest] = Field(..., min_length=1, description="要发送的短信列表")
+
+
+class BatchSendSMSResult(BaseModel):
+    index: int = Field(..., description="在请求列表中的序号")
+    to: str
+    status: str
+    segments: int = Field(default=0, description="短信拆分的段数")
+    message: str = Field(default='', description="失败原因")
+
+
 class ListScheduleJob(BaseModel):
     id: str
     next_run_time: datetime
@@ -68,7 +176,63 @@ class ScheduleRestartRequest(BaseModel):
     seconds: int = Field(..., description="任务间隔秒数")
     next_run_time: Optional[datetime] = Field(default=None, examples=[datetime.now()], description="下次执行的时间")
     id: Optional[str] = Field(default=None, description="可以自己起名job_id")
+    max_instances: Optional[int] = Field(default=None, ge=1, description="同时运行的最大实例数，默认见配置 [SCHEDULER]")
+    coalesce: Optional[bool] = Field(default=None, description="错过的多次执行是否合并为一次，默认见配置 [SCHEDULER]")
+    misfire_grace_time: Optional[int] = Field(default=None, ge=1,
+                                              description="错过执行时间多少秒以内仍然补执行，默认见配置 [SCHEDULER]")
 
 
 class ScheduleSendSMSRequest(ScheduleRestartRequest, SendSMSRequest):
     pass
+
+
+class CampaignRequest(BaseModel):
+    name: str = Field(..., max_length=100, description="群发任务名称")
+    message: str
+    recipients: List[str] = Field(..., min_length=1, max_length=100000,
+                                  description="收件号码列表，带国家码，如 +8613800138000")
+    run_date: Optional[datetime] = Field(default=None, description="单次发送的时间，与 cron 都为空时立即发送")
+    cron: Optional[str] = Field(default=None, examples=['0 9 * * 1-5'], description="周期发送的 crontab 表达式（分 时 日 月 周）")
+    rate: float = Field(default=0, ge=0, description="每秒最多发送条数，0 表示不限制")
+    max_instances: Optional[int] = Field(default=None, ge=1, description="同时运行的最大实例数，默认见配置 [SCHEDULER]")
+    coalesce: Optional[bool] = Field(default=None, description="错过的多次执行是否合并为一次，默认见配置 [SCHEDULER]")
+    misfire_grace_time: Optional[int] = Field(default=None, ge=1,
+                                              description="错过执行时间多少秒以内仍然补执行，默认见配置 [SCHEDULER]")
+
+    @field_validator('message')
+    @classmethod
+    def check_message(cls, v: str) -> str:
+        return SendSMSRequest.check_message(v)
+
+    @field_validator('recipients')
+    @classmethod
+    def check_recipients(cls, v: List[str]) -> List[str]:
+        numbers = [number.strip() for number in v]
+        invalid = [number for number in numbers if not number.lstrip('+').isdigit()]
+        if invalid:
+            raise ValueError(f"Invalid phone numbers: {', '.join(invalid[:10])}")
+        return numbers
+
+    @model_validator(mode='after')
+    def check_trigger(self):
+        if self.run_date is not None and self.cron is not None:
+            raise ValueError("run_date and cron are mutually exclusive")
+        return self
+
+
+class Campaign(BaseModel):
+    id: int
+    name: str
+    message: str
+    trigger: Dict[str, Any] = Field(..., description="触发方式：{'type': 'date', 'run_date': ...} 或 {'type': 'cron', 'cron': ...}")
+    rate: float
+    status: str = Field(..., description="scheduled 等待执行，running 发送中，completed 已完成，cancelled 已取消")
+    run: int = Field(..., description="当前（或最近一次）发送的轮次，周期群发每次执行为一轮")
+    total: int = Field(..., description="收件人数")
+    sent: int = Field(..., description="本轮发送成功数")
+    failed: int = Field(..., description="本轮发送失败数")
+    pending: int = Field(..., description="本轮尚未发送数")
+    next_run_time: Optional[datetime] = None
+    created: datetime
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
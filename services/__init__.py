@@ -1,14 +1,54 @@
-import threading
+import asyncio
+import logging
 from zoneinfo import ZoneInfo
 
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from services.utils.config_parser import config
 
-jobstores = {
-    'default': SQLAlchemyJobStore(url=config.sqlite_url())
+logger = logging.getLogger("PyAirLink")
+
+# 定时任务都是同步函数（send_sms、web_restart），AsyncIOScheduler 默认把它们放到事件循环的默认线程池中执行，
+# 与 API 的 asyncio.to_thread 共用线程；这里改用独立的有界线程池，长时间运行的任务不会拖慢 API
+executors = {
+    'default': ThreadPoolExecutor(max_workers=config.scheduler().max_workers)
+}
+
+job_defaults = {
+    'max_instances': config.scheduler().max_instances,
+    'coalesce': config.scheduler().coalesce,
+    'misfire_grace_time': config.scheduler().misfire_grace_time,
 }
 
-scheduler = AsyncIOScheduler(timezone=ZoneInfo("Asia/Shanghai"), jobstores=jobstores)
+# 任务存储（SQLAlchemyJobStore）在 start_scheduler 中创建；启动前添加的任务会先排队，启动后写入任务存储
+scheduler = AsyncIOScheduler(timezone=ZoneInfo("Asia/Shanghai"), executors=executors, job_defaults=job_defaults)
+
+
+def create_jobstore():
+    """
+    导入 SQLAlchemy 需要约 0.1 秒，放在启动之后执行
+    """
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    return SQLAlchemyJobStore(url=config.sqlite_url())
+
+
+# 调度器启动失败的原因，由 /health 返回；启动成功时为 None
+scheduler_error = None
+
 
-serial_lock = threading.Lock()
\ No newline at end of file
+async def start_scheduler():
+    """
+    在线程池中创建任务存储后启动调度器，不阻塞程序启动。
+    该协程作为后台任务运行，没有调用方等待其结果，失败时在这里记录日志并保存到 scheduler_error
+    """
+    global scheduler_error
+    try:
+        jobstore = await asyncio.to_thread(create_jobstore)
+        scheduler.add_jobstore(jobstore, 'default')
+        scheduler.start()
+    except Exception as e:
+        scheduler_error = f"{type(e).__name__}: {e}"
+        logger.exception(f"Unable to start scheduler, scheduled jobs will not run: {e}")
+        return False
+    scheduler_error = None
+    return True
@@ -0,0 +1,248 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from services.notification import batch_channels as notification_batch_channels
+from services.notification import channels as notification_channels
+from services.notification import idle_hooks as notification_idle_hooks
+from services.utils import metrics
+from services.utils.circuit_breaker import CircuitBreaker
+from services.utils.config_parser import config
+from services.utils.outbox import outbox as notification_outbox
+
+logger = logging.getLogger("PyAirLink")
+
+
+class NotificationDispatcher:
+    """
+    推送分发器。
+    handle_sms 只负责把消息写入持久化的发件箱（NotificationOutbox），写入完成后短信即可从 SIM 卡删除；
+    每个渠道一个工作线程从发件箱取出到期的记录推送，失败的记录按指数退避重试，
+    一个渠道变慢或不可用只会积压它自己的记录，不会拖住串口读取和其它渠道，程序重启后未送达的记录会继续推送。
+    每个渠道有一个熔断器（CircuitBreaker），连续失败后在冷却期内不再调用该渠道，到期记录顺延到冷却结束。
+    渠道开启合并推送（DIGEST_WINDOW）后，每个窗口内最多推送一次：安静期的第一条短信立即推送，
+    之后窗口内到达的短信留在发件箱中，窗口结束或攒满 DIGEST_MAX 条时按发送方分组合并为一条推送。
+    """
+
+    def __init__(self, channels=None, outbox=None, batch_channels=None, idle_hooks=None,
+                 batch_size=20, idle_interval=30, purge_interval=3600):
+        """
+        :param channels: {渠道名: 推送函数(title, content)}，返回 False 或抛出异常视为失败
+        :param outbox: 发件箱，默认为 services.utils.outbox.outbox
+        :param batch_channels: {渠道名: 批量推送函数([(title, content), ...])}，有多条到期记录时合并推送，
+                               中途失败时返回已送达的条数 n（前 n 条），只重试其余记录
+        :param idle_hooks: {渠道名: 空闲回调()}，渠道线程每空闲 idle_interval 秒调用一次
+        :param batch_size: 每次从发件箱取出的最大记录数
+        :param purge_interval: 清理过期已送达记录的间隔秒数
+        """
+        self.channels = channels or notification_channels
+        self.outbox = outbox or notification_outbox
+        self.batch_channels = notification_batch_channels if batch_channels is None else batch_channels
+        self.idle_hooks = notification_idle_hooks if idle_hooks is None else idle_hooks
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.purge_interval = purge_interval
+        self.breakers = {}
+        for name in self.channels:
+            policy = config.notification_policy(name)
+            self.breakers[name] = CircuitBreaker(name, failure_threshold=policy.failure_threshold,
+                                                 cooldown=policy.cooldown)
+        config.on_reload(self._apply_settings)
+        self._wakeups = {}
+        self._threads = {}
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._stop_event.clear()
+            for name in self.channels:
+                thread = self._threads.get(name)
+                if thread is not None and thread.is_alive():
+                    continue
+                self._wakeups[name] = threading.Event()
+                thread = threading.Thread(target=self._worker, args=(name, self._wakeups[name]),
+                                          name=f"notify-{name}", daemon=True)
+                self._threads[name] = thread
+                thread.start()
+        logger.info("Notification dispatcher started")
+        return self
+
+    def stop(self, timeout=10):
+        """
+        停止所有渠道线程，正在推送的一批完成后退出，未送达的记录保留在发件箱中，下次启动后继续推送
+        """
+        with self._lock:
+            threads, self._threads = self._threads, {}
+            self._stop_event.set()
+            for name in threads:
+                self._wakeups[name].set()
+        for thread in threads.values():
+            thread.join(timeout)
+        logger.info("Notification dispatcher stopped")
+
+    def dispatch(self, title, content, channels, key=None):
+        """
+        把消息写入发件箱并唤醒对应渠道的线程，返回时消息已持久化
+
+        :param key: 消息的唯一标识，同一 key 重复分发会被忽略；为空时每次调用都视为新消息
+        :return: 已写入发件箱的渠道列表
+        """
+        if not self._threads:
+            self.start()
+        known = []
+        for name in channels:
+            if name in self.channels:
+                known.append(name)
+            else:
+                logger.error(f'Unknown notification channel: {name}')
+        if not known:
+            return known
+        key = key or f'{time.time_ns()}-{id(content)}'
+        if not self.outbox.add(key, title, content, known):
+            logger.info(f'Notification already in outbox, skipped: {title}')
+        for name in known:
+            self._wakeups[name].set()
+        return known
+
+    def _worker(self, name, wakeup):
+        last_purge = time.monotonic()
+        last_delivery = float('-inf')
+        while not self._stop_event.is_set():
+            wakeup.clear()
+            # 每轮读取一次，热加载后的合并推送参数立即生效
+            policy = config.notification_policy(name)
+            digest_window, digest_max = policy.digest_window, policy.digest_max
+            try:
+                records = self.outbox.due(name, digest_max if digest_window else self.batch_size)
+                if records:
+                    hold = last_delivery + digest_window - time.monotonic() if digest_window else 0
+                    if hold > 0 and len(records) < digest_max:
+                        # 合并窗口内：记录留在发件箱中，等窗口结束或攒满 digest_max 条
+                        wakeup.wait(hold)
+                        continue
+                    self._deliver(name, records, digest=bool(digest_window))
+                    last_delivery = time.monotonic()
+                    continue
+                next_attempt = self.outbox.next_attempt(name)
+            except Exception as e:
+                logger.error(f'Notification outbox error, channel type: {name}, error: {e}')
+                next_attempt = None
+            wait = self.idle_interval
+            if next_attempt is not None:
+                wait = min(max(next_attempt - time.time(), 0), wait)
+            if wakeup.wait(wait) or self._stop_event.is_set():
+                continue
+            self._on_idle(name)
+            if time.monotonic() - last_purge > self.purge_interval:
+                last_purge = time.monotonic()
+                try:
+                    self.outbox.purge()
+                except Exception as e:
+                    logger.error(f'Notification outbox purge error: {e}')
+
+    def _deliver(self, name, records, digest=False):
+        func = self.channels[name]
+        batch_func = self.batch_channels.get(name)
+        if (digest or batch_func is not None) and len(records) > 1:
+            batches = [records]
+        else:
+            batches = [[record] for record in records]
+        breaker = self.breakers[name]
+        for i, batch in enumerate(batches):
+            if not breaker.allow():
+                # 熔断中：剩余记录顺延到冷却结束，不计入重试次数
+                remaining = [record[0] for pending in batches[i:] for record in pending]
+                self.outbox.defer(remaining, time.time() + breaker.retry_after())
+                return
+            error = None
+            delivered = []
+            start = time.perf_counter()
+            try:
+                if digest and len(batch) > 1:
+                    result = func(*self._digest(batch))
+                elif len(batch) > 1:
+                    result = batch_func([(title, content) for _, title, content, _ in batch])
+                    if not isinstance(result, bool) and isinstance(result, int):
+                        # 批量推送中途失败，返回值为失败前已送达的条数
+                        delivered, result = batch[:result], result >= len(batch)
+                else:
+                    _, title, content, _ = batch[0]
+                    result = func(title, content)
+                if result is False:
+                    error = 'channel returned failure'
+            except Exception as e:
+                error = e
+            latency = time.perf_counter() - start
+            metrics.notification_duration.labels(name).observe(latency)
+            metrics.notification_results.labels(name, 'success' if error is None else 'failure').inc()
+            if error is None:
+                breaker.record_success(latency)
+                self.outbox.mark_delivered([record[0] for record in batch])
+            else:
+                breaker.record_failure(latency, error)
+                logger.error(f'SMS push error, channel type: {name}, error: {error}, will retry')
+                if delivered:
+                    self.outbox.mark_delivered([record[0] for record in delivered])
+                self.outbox.mark_retry(batch[len(delivered):], error)
+
+    def _apply_settings(self, settings):
+        """
+        配置热加载后更新各渠道熔断器的参数
+        """
+        for name, breaker in self.breakers.items():
+            policy = settings.policies.get(name, settings.default_policy)
+            breaker.failure_threshold = policy.failure_threshold
+            breaker.cooldown = policy.cooldown
+
+    @staticmethod
+    def _digest(records):
+        """
+        把多条记录按标题（即发送方）分组，合并为一条 (title, content)
+        """
+        groups = OrderedDict()
+        for _, title, content, _ in records:
+            groups.setdefault(title, []).append(content)
+        if len(groups) == 1:
+            title = f'{next(iter(groups))} ({len(records)} messages)'
+        else:
+            title = f'{len(records)} new sms from {len(groups)} senders'
+        sections = []
+        for group_title, contents in groups.items():
+            sections.append('\n'.join([f'[{group_title}]'] + [f'- {content}' for content in contents]))
+        return title, '\n\n'.join(sections)
+
+    def health(self):
+        """
+        各渠道的熔断状态、调用次数、失败次数、延迟统计与发件箱中各状态的记录数
+        """
+        try:
+            outbox_stats = self.outbox.stats()
+        except Exception as e:
+            logger.error(f'Notification outbox error: {e}')
+            outbox_stats = {}
+        result = []
+        for name, breaker in self.breakers.items():
+            stats = breaker.stats()
+            stats['outbox'] = outbox_stats.get(name, {})
+            result.append(stats)
+        return result
+
+    def _on_idle(self, name):
+        idle_hook = self.idle_hooks.get(name)
+        if idle_hook is not None:
+            try:
+                idle_hook()
+            except Exception as e:
+                logger.error(f'Notification idle hook error, channel type: {name}, error: {e}')
+
+
+dispatcher = NotificationDispatcher()
+
+metrics.Gauge('pyairlink_notification_outbox', 'Outbox records by channel and status', ['channel', 'status'],
+              callback=lambda: {(channel, status): count for channel, counts in dispatcher.outbox.stats().items()
+                                for status, count in counts.items()})
+metrics.Gauge('pyairlink_notification_circuit_open', 'Whether the channel is short-circuited after failures',
+              ['channel'], callback=lambda: {(name,): int(breaker.retry_after() > 0)
+                                             for name, breaker in dispatcher.breakers.items()})
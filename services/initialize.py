@@ -1,198 +1,639 @@
-from io import StringIO
+import asyncio
+import hashlib
+from collections import deque
+from concurrent.futures import Future
+import queue
+import threading
 import time
 import logging
 from zoneinfo import ZoneInfo
 
-from services.notification import serverchan, send_email, bark, feishu_webhook, wecom_app
+from services.dispatcher import dispatcher
 from services.utils.config_parser import config
-from services.utils.serial_manager import SerialManager
-from .utils.sms import parse_pdu, encode_pdu
+from services.utils.event_stream import sms_events
+from services.utils.inbox import inbox
+from services.utils.campaigns import campaigns, SCHEDULED, COMPLETED, SENT, FAILED
+from services.utils import metrics
+from services.utils.command_scheduler import Priority
+from services.utils.modem_pool import modems, SendOutcome, RECIPIENT_CMS_ERRORS
+from .utils.sms import parse_pdu, encode_sms, SMSReassembler, sms_indexes
 from .utils.commands import at_commands
 
 logger = logging.getLogger("PyAirLink")
 
 
-def web_send_at_command(command, keywords=None, timeout=3):
-    with SerialManager() as serial_manager:
-        response = serial_manager.send_at_command(command, keywords=keywords, timeout=timeout)
-        return response
+def web_send_at_command(command, keywords=None, timeout=3, modem_name=None):
+    return modems.get(modem_name).send_at_command(command, keywords=keywords, timeout=timeout,
+                                                  priority=Priority.DIAGNOSTIC)
 
 
-def initialize_module():
+async def web_send_at_command_async(command, keywords=None, timeout=3, modem_name=None):
+    return await modems.get(modem_name).send_at_command_async(command, keywords=keywords, timeout=timeout,
+                                                              priority=Priority.DIAGNOSTIC)
+
+
+# 模块初始化状态机的各阶段：(阶段, 指令, 成功时的日志, 失败时的日志)，依次执行，任一阶段失败则停在 failed
+_CONFIGURE_STAGES = (
+    ('probe', at_commands.at, None, "Unable to communicate with module"),
+    ('sim', at_commands.cpin, "SIM card ready", "SIM card not detected, please check and restart the module"),
+    ('pdu_mode', at_commands.cmgf, "SMS format is set to PDU", "Unable to set SMS format to PDU"),
+    ('charset', at_commands.cscs, "Character set is set to UCS2", "Unable to set character set to UCS2"),
+    ('storage', at_commands.cpms, "New SMS buffer configuration completed", "Unable to configure new SMS buffer"),
+    # 新短信到达时以 +CMTI: <mem>,<index> 主动上报
+    ('cnmi', lambda: at_commands.cnmi(mode=2, mt=1), "New SMS notification configuration completed",
+     "Unable to configure new SMS notifications"),
+)
+# 之后的阶段：attach 等待 GPRS 附着（已可收发短信），ready 初始化完成
+INIT_STAGES = ('pending',) + tuple(stage for stage, _, _, _ in _CONFIGURE_STAGES) + ('attach', 'ready', 'failed')
+
+
+def initialize_module(modem=None, attach_timeout=None, stop_event=None):
     """
-    初始化模块
+    初始化模块，进度记录在 modem.stage（见 INIT_STAGES），失败原因记录在 modem.init_error
+
+    :param modem: ModemSession，默认为 [SERIAL] 对应的模块
+    :param attach_timeout: 等待 GPRS 附着的最长秒数，为空时一直等待
+    :param stop_event: 设置后停止等待 GPRS 附着并返回 False
     """
-    logger.info("Initializing modules...")
+    modem = modem or modems.get()
+    logger.info(f"Initializing module {modem.name}...")
+    modem.ready = False
+    modem.init_error = None
+    if not modem.call(_configure_module, modem):
+        return False
+    # 基本配置完成即可收发短信，GPRS 附着只影响数据业务
+    modem.ready = True
+    modem.stage = 'attach'
 
-    # 发送基本AT指令
-    with SerialManager() as serial_manager:
-        response = serial_manager.send_at_command(at_commands.at(), keywords="OK")
-        if not response:
-            logger.error("Unable to communicate with module")
-            return False
+    # 检查 GPRS 附着状态，等待期间不占用串口工作线程，其它指令可以穿插执行
+    deadline = None if attach_timeout is None else time.monotonic() + attach_timeout
+    while True:
+        response = modem.send_at_command(at_commands.cgatt(), keywords="+CGATT: 1")
+        # 未附着时模块返回 +CGATT: 0 与 OK，响应非空，需检查附着状态
+        if response and '+CGATT: 1' in response:
+            logger.info("GPRS Attached")
+            break
+        elif deadline is not None and time.monotonic() >= deadline:
+            logger.warning(f"GPRS not attached after {attach_timeout} seconds, continuing without it")
+            break
+        else:
+            logger.warning("GPRS not attached, retrying in 5 seconds...")
+            if stop_event is not None:
+                if stop_event.wait(5):
+                    return False
+            else:
+                time.sleep(5)
 
-        response = serial_manager.send_at_command(at_commands.cpin(), keywords="OK")
-        if "READY" not in response:
-            logger.error("SIM card not detected, please check and restart the module")
-            return False
-        logger.info("SIM card ready")
+    # 不再按 delflag 删除已读短信：上次未收齐的长短信分段、未写入发件箱的短信仍在 SIM 卡中，
+    # 由 sms_listener 就绪后的第一次 AT+CMGL 读取，写入发件箱后按位置删除
+    modem.stage = 'ready'
+    logger.info("Module initialization completed")
+    return True
 
-        response = serial_manager.send_at_command(at_commands.cmgf(), keywords="OK")
-        if not response:
-            logger.error("Unable to set SMS format to PDU")
-            return False
-        logger.info("SMS format is set to PDU")
 
-        response = serial_manager.send_at_command(at_commands.cscs(), keywords="OK")
-        if not response:
-            logger.error("Unable to set character set to UCS2")
-            return False
-        logger.info("Character set is set to UCS2")
+def initialize_in_background(modem, stop_event, max_backoff=60):
+    """
+    在后台线程中初始化模块，不阻塞程序启动；失败时从 5 秒开始加倍退避重试（最长 max_backoff 秒），
+    直到成功或 stop_event 被设置
+    """
+    delay = 5
+    while not stop_event.is_set():
+        try:
+            if initialize_module(modem, stop_event=stop_event):
+                return True
+        except Exception as e:
+            modem.stage, modem.init_error = 'failed', str(e)
+            logger.error(f"Module {modem.name} initialization error: {e}")
+        if stop_event.is_set():
+            break
+        logger.warning(f"Module {modem.name} initialization failed, retrying in {delay} seconds...")
+        if stop_event.wait(delay):
+            break
+        delay = min(delay * 2, max_backoff)
+    return False
 
-        response = serial_manager.send_at_command(at_commands.cpms(), keywords="OK")
-        if not response:
-            logger.error("Unable to configure new SMS buffer")
-            return False
-        logger.info("New SMS buffer configuration completed")
 
-        response = serial_manager.send_at_command(at_commands.cnmi(), keywords="OK")
+def _configure_module(serial_manager, modem=None):
+    """
+    在串口工作线程中依次执行 _CONFIGURE_STAGES 中的初始化指令
+    """
+    for stage, command, success, failure in _CONFIGURE_STAGES:
+        if modem is not None:
+            modem.stage = stage
+        response = serial_manager.send_at_command(command(), keywords="OK")
+        if stage == 'sim':
+            response = response if response and "READY" in response else None
         if not response:
-            logger.error("Unable to configure new SMS notifications")
+            logger.error(failure)
+            if modem is not None:
+                modem.stage, modem.init_error = 'failed', f"{stage}: {failure}"
             return False
-        logger.info("New SMS notification configuration completed")
+        if success:
+            logger.info(success)
+    return True
 
-        # 检查 GPRS 附着状态
-        while True:
-            response = serial_manager.send_at_command(at_commands.cgatt(), keywords="+CGATT: 1")
-            if response:
-                logger.info("GPRS Attached")
-                break
-            else:
-                logger.warning("GPRS not attached, retrying in 5 seconds...")
-                time.sleep(5)
 
-        response = serial_manager.send_at_command(at_commands.cmgd(index=1, delflag=2), keywords=['OK'])
-        if not response:
-            logger.error("Unable to delete read messages, and unable to receive new messages if the storage area is full")
-        logger.info("All read messages have been deleted")
+# 退出时设置，正在执行的重启（定时任务或 API）不再等待模块响应与 GPRS 附着，调度器关闭时不会被阻塞
+restart_stop = threading.Event()
 
-    logger.info("Module initialization completed")
-    return True
+
+def web_restart(modem_name=None, attach_timeout=None):
+    """
+    :param attach_timeout: 见 initialize_module，定时重启时传入，避免 GPRS 一直未附着时任务永远不结束
+    """
+    modem = modems.get(modem_name)
+    # 重启期间不再向该模块分配短信
+    modem.ready = False
+    modem.stage = 'pending'
+    resp = modem.send_at_command(at_commands.reset(), priority=Priority.DIAGNOSTIC)
+    if not resp:
+        logger.warning(f"Module {modem.name} restart failed")
+    else:
+        logger.info(f"Module {modem.name} restart successful")
+    if restart_stop.wait(3):
+        return False
+    return initialize_module(modem, attach_timeout=attach_timeout, stop_event=restart_stop)
 
 
-def web_restart():
-    with SerialManager() as serial_manager:
-        resp = serial_manager.send_at_command(at_commands.reset())
-        if not resp:
-            logger.warning("Module restart failed")
-        else:
-            logger.info("Module restart successful")
-    time.sleep(3)
-    return initialize_module()
+async def web_restart_async(modem_name=None, attach_timeout=30):
+    """
+    web_restart 的异步版本，重启与初始化过程在线程池中执行，不阻塞事件循环；
+    GPRS 附着最多等待 attach_timeout 秒，未附着时仍可收发短信，请求不会一直挂起
+    """
+    return await asyncio.to_thread(web_restart, modem_name, attach_timeout)
 
 
-def handle_sms(phone_number, sms_content, receive_time, tz="Asia/Shanghai"):
+def handle_sms(phone_number, sms_content, receive_time, tz="Asia/Shanghai", pdu=None):
     """
-    处理接收到的短信
+    处理接收到的短信，保存到收件箱并写入推送发件箱后返回，推送由 dispatcher 在各渠道线程中执行。
+    收件箱与发件箱都以 号码+时间+内容 去重，删除短信前异常退出导致同一条短信被再次读取时不会重复保存和推送
     """
     logger.info(f"Received SMS from {phone_number} at {receive_time}, content: {sms_content}")
-    channels = {'serverchan': serverchan, 'mail': send_email, 'bark': bark, 'feishu_webhook': feishu_webhook, "wecom_app": wecom_app}
+    if isinstance(sms_content, bytes):
+        sms_content = sms_content.hex()
+    key = hashlib.sha1(f'{phone_number}|{receive_time.isoformat()}|{sms_content}'.encode()).hexdigest()
+    message_id = inbox.add(key, phone_number, receive_time, sms_content, pdu)
+    if message_id is not None:
+        sms_events.publish('sms', {'id': message_id, 'sender': phone_number, 'received': receive_time,
+                                   'body': sms_content}, event_id=message_id)
     use_channels = config.notification()
     if use_channels:
         title = f'new sms from {phone_number}'
         content = f'{sms_content},\nreceive time: {receive_time.astimezone(ZoneInfo(tz))}'
-        for channel in use_channels:
-            func = channels[channel]
-            try:
-                func(title, content)
-            except Exception as e:
-                logger.error(f'SMS push error, channel type: {channel}, error: {e}')
+        dispatcher.dispatch(title, content, use_channels, key=key)
     return True
 
 
-def send_sms(to, text):
+def send_sms(to, text, priority=Priority.BULK):
     """
     使用AT指令在PDU模式下发送SMS。
-    ser是已打开的pyserial串口对象。
     to为目标号码字符串（如"+8613800138000"），text为短信内容（UTF-8字符串）。
+    同步版本主要由定时任务调用，默认按批量任务的优先级排队。
+    接有多个模块时由模块池（ModemPool）按 [SMS] ROUTING 选择模块，发送失败时改用其它模块。
     """
     logging_tag = "send_sms"
-    pdu, length = encode_pdu(to, text)
-    if not pdu or not length:
+    segments = encode_sms(to, text)
+    if not segments:
         logger.error("%s: SMS encoding failed", logging_tag)
         return False
+    return bool(modems.send(_send_segments, segments, to=to, priority=priority).result())
+
+
+async def send_sms_async(to, text, priority=Priority.INTERACTIVE):
+    """
+    send_sms 的异步版本，等待串口工作线程发送完成期间不阻塞事件循环
+    """
+    segments = encode_sms(to, text)
+    if not segments:
+        logger.error("send_sms: SMS encoding failed")
+        return False
+    return bool(await asyncio.wrap_future(modems.send(_send_segments, segments, to=to, priority=priority)))
 
+
+def _send_segments(serial_manager, segments, set_mode=True, to=None):
+    """
+    在同一任务内依次发送一条短信的所有分段，任一段失败即停止，发送结果同时发布到 sms_events
+
+    :return: SendOutcome，只有第一段在提交 PDU 之前失败时才可以改用其它模块重发
+    """
+    sent = 0
+    outcome = None
+    for i, (pdu, length) in enumerate(segments):
+        outcome = _send_pdu(serial_manager, pdu, length, set_mode=set_mode and i == 0)
+        if not outcome:
+            if len(segments) > 1:
+                logger.error(f"send_sms: Segment {i + 1}/{len(segments)} of concatenated SMS failed")
+            break
+        sent += 1
+    ok = sent == len(segments)
+    sms_events.publish('send', {'to': to, 'status': 'success' if ok else 'failure',
+                                'segments': len(segments), 'sent': sent})
+    if ok:
+        return SendOutcome(True, sent=sent)
+    return SendOutcome(False, sent=sent, retryable=sent == 0 and outcome.retryable, cms_error=outcome.cms_error,
+                       error=outcome.error)
+
+
+def _send_pdu(serial_manager, pdu, length, set_mode=True):
+    """
+    在串口工作线程中发送已编码的PDU，CMGS 与 PDU 数据在同一任务内完成，不会被其它指令打断
+
+    :param set_mode: 是否先发送 AT+CMGF=0，批量发送时只在开始设置一次
+    :return: SendOutcome，PDU 数据写入串口之前的失败为 retryable
+    """
+    logging_tag = "send_sms"
     # 设置CMGF=0进入PDU模式（如果之前没设置过）
-    with SerialManager() as serial_manager:
+    if set_mode:
         resp = serial_manager.send_at_command(at_commands.cmgf())
         if not resp:
             logger.error("%s: Unable to enter PDU mode", logging_tag)
+            return SendOutcome(False, retryable=True, error='unable to enter PDU mode')
+
+    # 发送AT+CMGS指令
+    resp = serial_manager.execute(at_commands.cmgs(length), timeout=3)
+    if not resp or resp.final != '>':
+        logger.error("%s: Receive SMS message sending prompt '>' timeout, response: %s", logging_tag, resp)
+        cms_error = resp.error_code if resp else None
+        return SendOutcome(False, retryable=cms_error not in RECIPIENT_CMS_ERRORS, cms_error=cms_error,
+                           error=resp.final if resp and resp.final else "no '>' prompt")
+
+    # 发送PDU数据和Ctrl+Z结束符(0x1A)，此后短信可能已提交到网络，失败也不能换模块重发
+    resp = serial_manager.execute(pdu.encode('utf-8') + b'\x1A', timeout=5)
+    logger.debug("%s: PDU data has been sent, waiting for URC to be sent successfully", logging_tag)
+    if resp and not resp.error and resp.records('+CMGS:'):
+        logger.info("%s: SMS sent successfully", logging_tag)
+        return SendOutcome(True, sent=1)
+    else:
+        logger.error("%s: No confirmation message of '+CMGS' was received, sending failed, response: %s", logging_tag, resp)
+        return SendOutcome(False, cms_error=resp.error_code if resp else None,
+                           error=resp.final if resp and resp.final else 'no +CMGS confirmation')
+
+
+def _set_batch_mode(serial_manager, enable):
+    """
+    批量发送开始时设置一次 PDU 模式并用 AT+CMMS=1 保持链路，结束时关闭
+    """
+    if enable:
+        if not serial_manager.send_at_command(at_commands.cmgf()):
+            logger.error("send_sms_batch: Unable to enter PDU mode")
             return False
+        resp = serial_manager.execute(at_commands.cmms(1))
+    else:
+        resp = serial_manager.execute(at_commands.cmms(0))
+    if not resp or not resp.ok:
+        # 不支持 CMMS 的模块仍可逐条发送，只是每条之间可能重新建立链路
+        logger.warning(f"send_sms_batch: AT+CMMS is not accepted, response: {resp}")
+    return True
 
-        # 发送AT+CMGS指令
-        resp = serial_manager.send_at_command(at_commands.cmgs(length), keywords='>', timeout=3)
-        if not resp:
-            logger.error("%s: Receive SMS message sending prompt '>' timeout", logging_tag)
+
+async def send_sms_batch(messages, window=8):
+    """
+    批量发送短信，按顺序逐条产出发送结果。
+    短信由模块池分配到各模块，以批量优先级发送：每个模块的 PDU 模式只设置一次，AT+CMMS 在连续提交之间保持链路，
+    每个可用模块同时最多有 window 条短信排队在其串口工作线程中，前一条完成后下一条立即开始，没有空档。
+
+    :param messages: [(to, text), ...]
+    :return: 异步生成器，产出 {'index', 'to', 'status', 'segments', 'message'}
+    """
+    batch_modems = []
+    for name in modems.available():
+        try:
+            if await modems.get(name).call_async(_set_batch_mode, True, priority=Priority.BULK):
+                batch_modems.append(name)
+        except Exception as e:
+            logger.warning(f"send_sms_batch: Unable to prepare modem {name}: {e}")
+    if not batch_modems:
+        for index, (to, text) in enumerate(messages):
+            yield {'index': index, 'to': to, 'status': 'failure', 'segments': 0, 'message': 'unable to enter PDU mode'}
+        return
+    window *= len(batch_modems)
+
+    pending = deque()
+    items = iter(enumerate(messages))
+    try:
+        while True:
+            while len(pending) < window:
+                item = next(items, None)
+                if item is None:
+                    break
+                index, (to, text) = item
+                segments = []
+                try:
+                    segments = encode_sms(to, text)
+                    future = modems.send(_send_segments, segments, set_mode=False, to=to, priority=Priority.BULK)
+                except Exception as e:
+                    future = Future()
+                    future.set_exception(e)
+                pending.append((index, to, len(segments), future))
+            if not pending:
+                break
+            index, to, segments, future = pending.popleft()
+            try:
+                ok = await asyncio.wrap_future(future)
+                yield {'index': index, 'to': to, 'status': 'success' if ok else 'failure', 'segments': segments,
+                       'message': '' if ok else str(getattr(ok, 'error', None) or '')}
+            except Exception as e:
+                yield {'index': index, 'to': to, 'status': 'failure', 'segments': segments, 'message': str(e)}
+    finally:
+        # 客户端中途断开时取消尚未执行的短信
+        for _, _, _, future in pending:
+            future.cancel()
+        for name in batch_modems:
+            try:
+                modems.get(name).submit(_set_batch_mode, False, priority=Priority.BULK)
+            except Exception as e:
+                logger.warning(f"send_sms_batch: Unable to disable AT+CMMS on modem {name}: {e}")
+
+
+# 退出时通知正在执行的群发任务停止，未处理的收件人在下次启动后继续发送
+campaign_stop = threading.Event()
+_running_campaigns = set()
+_running_campaigns_lock = threading.Lock()
+
+
+def run_campaign(campaign_id, window=8):
+    """
+    执行群发任务的一轮发送，由定时任务在调度线程池中调用。
+    按页读取本轮尚未处理的收件人，按群发任务的 rate 限速提交到模块池，每个可用模块同时最多有 window 条短信排队，
+    每页结束后保存各收件人的结果；群发任务被取消或程序退出时停止，已提交但尚未执行的短信随之取消。
+
+    :return: 本轮是否执行完毕
+    """
+    with _running_campaigns_lock:
+        if campaign_id in _running_campaigns:
+            logger.warning(f"Campaign {campaign_id} is already running, skipping")
             return False
+        _running_campaigns.add(campaign_id)
+    try:
+        return _run_campaign(campaign_id, window)
+    finally:
+        with _running_campaigns_lock:
+            _running_campaigns.discard(campaign_id)
 
-        # 发送PDU数据和Ctrl+Z结束符(0x1A)
-        resp = serial_manager.send_at_command(pdu.encode('utf-8') + b'\x1A', keywords='+CMGS:', timeout=5)
-        logger.debug("%s: PDU data has been sent, waiting for URC to be sent successfully", logging_tag)
-        if resp:
-            logger.info("%s: SMS sent successfully", logging_tag)
-            return True
-        else:
-            logger.error("%s: No confirmation message of '+CMGS' was received, sending failed", logging_tag)
+
+def _run_campaign(campaign_id, window, ready_timeout=300):
+    # 程序刚启动（如续发中断的群发任务）时模块可能仍在初始化，等待其就绪，避免整轮短信都因没有可用模块而失败
+    deadline = time.monotonic() + ready_timeout
+    while not modems.available() and time.monotonic() < deadline:
+        if campaign_stop.wait(1):
             return False
+    started = campaigns.start_run(campaign_id)
+    if started is None:
+        logger.info(f"Campaign {campaign_id} is cancelled or completed, skipping")
+        return False
+    message, run, rate, trigger = started
+    logger.info(f"Campaign {campaign_id} run {run} started")
 
+    batch_modems = []
+    for name in modems.available():
+        try:
+            if modems.get(name).call(_set_batch_mode, True, priority=Priority.BULK):
+                batch_modems.append(name)
+        except Exception as e:
+            logger.warning(f"Campaign {campaign_id}: Unable to prepare modem {name}: {e}")
+    # 没有可用模块时照常逐条提交，由模块池立即返回失败
+    window *= max(1, len(batch_modems))
+    interval = 1 / rate if rate else 0
+    next_send = time.monotonic()
+    pending = deque()
+    results = []
+    after = -1
+    stopped = False
+
+    def collect(seq, future):
+        try:
+            ok = future.result()
+        except Exception as e:
+            logger.debug(f"Campaign {campaign_id}: Sending to recipient {seq} failed: {e}")
+            ok = False
+        results.append((seq, SENT if ok else FAILED))
+
+    try:
+        while not stopped:
+            page = campaigns.pending(campaign_id, run, after, limit=100)
+            if not page:
+                break
+            for i, seq_number in enumerate(page):
+                # 每提交 20 条检查一次是否已取消
+                if campaign_stop.is_set() or (i % 20 == 19 and campaigns.is_cancelled(campaign_id)):
+                    stopped = True
+                    break
+                seq, number = seq_number
+                after = seq
+                delay = next_send - time.monotonic()
+                # 限速等待期间收到停止信号立即退出
+                if delay > 0 and campaign_stop.wait(delay):
+                    stopped = True
+                    break
+                next_send = max(next_send, time.monotonic()) + interval
+                while len(pending) >= window:
+                    collect(*pending.popleft())
+                try:
+                    segments = encode_sms(number, message)
+                    future = modems.send(_send_segments, segments, set_mode=False, to=number,
+                                         priority=Priority.BULK)
+                except Exception as e:
+                    future = Future()
+                    future.set_exception(e)
+                pending.append((seq, future))
+            campaigns.record(campaign_id, run, results)
+            results.clear()
+            stopped = stopped or campaigns.is_cancelled(campaign_id)
+        # 停止时也等待已提交的短信发送完成并记录结果，避免续发时重复发送
+        while pending:
+            collect(*pending.popleft())
+        campaigns.record(campaign_id, run, results)
+    finally:
+        # 出错退出时取消尚未执行的短信，这些收件人仍是本轮待发送
+        for _, future in pending:
+            future.cancel()
+        for name in batch_modems:
+            try:
+                modems.get(name).submit(_set_batch_mode, False, priority=Priority.BULK)
+            except Exception as e:
+                logger.warning(f"Campaign {campaign_id}: Unable to disable AT+CMMS on modem {name}: {e}")
+    if stopped:
+        logger.info(f"Campaign {campaign_id} run {run} stopped")
+        return False
+    campaigns.finish_run(campaign_id, SCHEDULED if trigger['type'] == 'cron' else COMPLETED)
+    progress = campaigns.get(campaign_id)
+    logger.info(f"Campaign {campaign_id} run {run} finished, sent: {progress['sent']}, failed: {progress['failed']}")
+    return True
 
-def sms_listener(stop_event):
+
+def parse_sms_records(response, prefix, modem_name='default', index=None):
+    """
+    解析 +CMGL / +CMGR 的结构化响应，每个以 prefix 开头的头行之后是一行 PDU 数据。
+    每条短信的 'index' 为其在 SIM 卡中的位置：+CMGL 从头行读取，+CMGR 的头行不含位置，由调用方传入
+
+    :param index: AT+CMGR 读取的位置
+    """
+    massages = []
+    for header, pdu_line in response.records(prefix):
+        if pdu_line is None:
+            # 错误处理：短信头后没有 PDU 数据
+            logger.warning(f"PDU data is missing after line: {header}")
+            continue
+        location = index
+        if prefix == '+CMGL:':
+            # +CMGL: <index>,<stat>,[<alpha>],<length>，stat 为 2 / 3 的是已存储的待发短信，不处理
+            fields = header[len(prefix):].split(',')
+            try:
+                location, stat = int(fields[0]), int(fields[1])
+            except (IndexError, ValueError):
+                logger.warning(f"Incorrect SMS list header: {header}")
+                continue
+            if stat in (2, 3):
+                continue
+        # 解析短信通知
+        try:
+            match = parse_pdu(pdu_line)
+            if isinstance(match, dict):
+                match['pdu'] = pdu_line
+                match['index'] = location
+                massages.append(match)
+            else:
+                metrics.pdu_parse_errors.labels(modem_name).inc()
+                logger.warning(f"Incorrect parsing of PDU: {pdu_line}")
+        except Exception as e:
+            metrics.pdu_parse_errors.labels(modem_name).inc()
+            logger.error(f"Parsing PDU: {pdu_line}\nerror: {e}\nresponse: {response}")
+    return massages
+
+
+def dispatch_sms(massages, reassembler, modem_name='default'):
+    """
+    把解析后的短信交给 handle_sms 写入推送发件箱。
+    长短信的分段先进入重组缓冲区 reassembler，收齐（或过期）后只推送合并后的一条；
+    缓冲区中的分段只在内存里，其 SIM 卡位置要等所在分组写入发件箱后才返回，程序中途退出时分段仍留在 SIM 卡中，
+    启动后由 AT+CMGL 重新读取。写入失败的短信记录日志后跳过，不返回其位置，下次轮询重新读取。
+
+    :return: 已处理完、可以从 SIM 卡删除的位置列表
+    """
+    done = []
+    ready = []
+    for massage in massages:
+        if massage.get('header', {}).get('mti') == 'status-report':
+            logger.info(f"SMS status report for message {massage.get('message_ref')} "
+                        f"to {massage.get('recipient', {}).get('number')}: status {massage.get('status')}")
+            sms_events.publish('status-report', {'message_ref': massage.get('message_ref'),
+                                                 'to': massage.get('recipient', {}).get('number'),
+                                                 'status': massage.get('status'),
+                                                 'discharge_time': massage.get('discharge_time')})
+            done.extend(sms_indexes(massage))
+            continue
+        try:
+            ready.extend(reassembler.add(massage))
+        except Exception as e:
+            # 一条异常的分段不能让每次轮询都在同一位置失败，记录日志后按普通短信推送
+            logger.error(f"Unable to buffer concatenated SMS fragment, forwarding it as is: {e}")
+            ready.append(massage)
+    ready.extend(reassembler.expire())
+    for massage in ready:
+        phone_number = massage.get('sender').get('number')
+        receive_time = massage.get('scts')
+        sms_content = massage.get('user_data').get('data')
+        try:
+            handle_sms(phone_number, sms_content, receive_time, pdu=massage.get('pdu'))
+        except Exception as e:
+            metrics.listener_errors.labels(modem_name).inc()
+            logger.error(f"Unable to persist SMS from {phone_number}, keeping it on SIM: {e}")
+            continue
+        metrics.sms_received.labels(modem_name).inc()
+        done.extend(sms_indexes(massage))
+    return done
+
+
+def _delete_sms(modem, indexes):
+    """
+    逐个删除 SIM 卡中已处理的短信
+    """
+    for index in indexes:
+        modem.send_at_command(at_commands.cmgd(index=index, delflag=0), keywords=['OK'], priority=Priority.INBOUND)
+
+
+def _sweep_sms(modem, reassembler):
+    """
+    兜底轮询：查询所有短信（含已读未删除的，如上次未收齐的长短信分段、写入发件箱失败的短信），
+    写入发件箱后按位置删除
+    """
+    response = modem.execute(at_commands.cmgl(stat=4), priority=Priority.INBOUND)
+    if response and response.records('+CMGL:'):
+        _delete_sms(modem, dispatch_sms(parse_sms_records(response, '+CMGL:', modem.name), reassembler, modem.name))
+
+
+def _fetch_sms(modem, reassembler, index):
     """
-    定期查询是否有新短信的监听器
+    读取 +CMTI 上报位置的短信，写入发件箱后删除该位置（长短信分段等收齐后再删除）
     """
-    with SerialManager() as serial_manager:
+    response = modem.execute(at_commands.cmgr(index), priority=Priority.INBOUND)
+    if response and response.ok and response.records('+CMGR:'):
+        massages = parse_sms_records(response, '+CMGR:', modem.name, index=index)
+        _delete_sms(modem, dispatch_sms(massages, reassembler, modem.name))
+    else:
+        logger.warning(f"Unable to read SMS at index {index}, response: {response}")
+
+
+def sms_listener(stop_event, modem=None):
+    """
+    新短信监听器，每个模块一个。
+    由模块上报的 +CMTI（短信存储位置）或 +CMT（短信 PDU）驱动，只读取上报的那一条；
+    另按 SMS.POLL_INTERVAL 低频执行一次 AT+CMGL 兜底，防止遗漏上报。
+
+    :param modem: ModemSession，默认为 [SERIAL] 对应的模块
+    """
+    modem = modem or modems.get()
+    # 长短信的各分段由同一个模块接收，重组缓冲区只在本线程中使用
+    reassembler = SMSReassembler()
+    arrivals = queue.Queue()
+
+    def on_cmti(line, pdu):
+        # +CMTI: "SM",3
+        arrivals.put(('index', int(line.rsplit(',', 1)[1])))
+
+    def on_cmt(line, pdu):
+        if pdu:
+            arrivals.put(('pdu', pdu))
+
+    modem.add_urc_handler('+CMTI:', on_cmti)
+    modem.add_urc_handler('+CMT:', on_cmt)
+    poll_interval = config.sms().poll_interval
+    next_sweep = 0
+    try:
         while not stop_event.is_set():
+            if not modem.ready:
+                # 模块初始化或重启期间不读取短信，就绪后立即补一次 AT+CMGL
+                next_sweep = 0
+                stop_event.wait(0.5)
+                continue
             try:
-                # 发送AT+CMGL命令查询未读短信
-                response = serial_manager.send_at_command(at_commands.cmgl(stat=0), keywords=['OK'])
-                # logger.warning(f"本次查询短信收到回复: {response}")
-                if response and '+CMGL:' in response:
-                    lines = response.strip().splitlines()
-                    i = 0
-                    massages = []
-                    while i < len(lines):
-                        line = lines[i].strip()
-                        if line.startswith('+CMGL:'):
-                            # 当前行为短信头，下一行应为 PDU 数据
-                            if i + 1 < len(lines):
-                                pdu_line = lines[i + 1].strip()
-                                # 解析短信通知
-                                try:
-                                    match = parse_pdu(StringIO(pdu_line))
-                                    if isinstance(match, dict):
-                                        massages.append(match)
-                                    else:
-                                        logger.warning(f"Incorrect parsing of PDU: {pdu_line}")
-                                except Exception as e:
-                                    logger.error(f"Parsing PDU: {pdu_line}\nerror: {e}\nresponse: {response}")
-                                i += 2  # 跳过 PDU 数据行，继续处理下一条短信
-                            else:
-                                # 错误处理：+CMGL 行后没有 PDU 数据
-                                logger.warning(f"At index {i}, PDU data is missing after +CMGL line")
-                                i += 1
-                        else:
-                            i += 1
-                    for massage in massages:
-                        phone_number = massage.get('sender').get('number')
-                        receive_time = massage.get('scts')
-                        sms_content = massage.get('user_data').get('data')
-                        handle_sms(phone_number, sms_content, receive_time)
-                    serial_manager.send_at_command(at_commands.cmgd(), keywords=['OK'])
-                # 短暂休眠，避免占用过多资源
-                time.sleep(1)
+                now = time.monotonic()
+                if now >= next_sweep:
+                    _sweep_sms(modem, reassembler)
+                    next_sweep = time.monotonic() + poll_interval
+                try:
+                    kind, value = arrivals.get(timeout=min(1, max(next_sweep - now, 0)))
+                except queue.Empty:
+                    # 推送等待超时仍未收齐的长短信，并删除其分段
+                    _delete_sms(modem, dispatch_sms([], reassembler, modem.name))
+                    continue
+                if kind == 'index':
+                    _fetch_sms(modem, reassembler, value)
+                else:
+                    try:
+                        massage = parse_pdu(value)
+                    except ValueError:
+                        metrics.pdu_parse_errors.labels(modem.name).inc()
+                        raise
+                    massage['pdu'] = value
+                    dispatch_sms([massage], reassembler, modem.name)
             except Exception as e:
-                logger.error(f"sms_listener error: {e}")
+                metrics.listener_errors.labels(modem.name).inc()
+                logger.error(f"sms_listener error on modem {modem.name}: {e}")
                 time.sleep(1)
+    finally:
+        modem.remove_urc_handler('+CMTI:', on_cmti)
+        modem.remove_urc_handler('+CMT:', on_cmt)
 
 
 if __name__ == "__main__":
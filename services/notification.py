@@ -1,10 +1,6 @@
 import logging
 import re
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-import requests
+import threading
 import json
 import time
 import hmac
@@ -12,9 +8,37 @@ import hashlib
 import base64
 
 from .utils.config_parser import config
+from .utils.mail_transport import MailTransport, MailSendError
+from .utils.token_provider import TokenProvider
 
 logger = logging.getLogger("PyAirLink")
 
+# 建立连接的最长等待秒数，读取超时见 channel_timeout
+HTTP_CONNECT_TIMEOUT = 5
+
+_local = threading.local()
+
+
+def http_session():
+    """
+    当前线程复用的 requests.Session，保持长连接。
+    推送由 NotificationDispatcher 中每个渠道各自的工作线程执行，因此各渠道的连接池互不共享，也无需加锁
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        # requests 导入较慢，在第一次推送时才导入
+        import requests
+        session = _local.session = requests.Session()
+    return session
+
+
+def channel_timeout(channel):
+    """
+    渠道请求的 (连接超时, 读取超时)，读取超时来自 config.notification_policy
+    """
+    timeout = config.notification_policy(channel).timeout
+    return min(HTTP_CONNECT_TIMEOUT, timeout), timeout
+
 
 def serverchan(title, desp='', options=None):
     """
@@ -38,7 +62,7 @@ def serverchan(title, desp='', options=None):
         **options
     }
     try:
-        response = requests.post(url, json=data)
+        response = http_session().post(url, json=data, timeout=channel_timeout('serverchan'))
         if response.ok:
             logger.info(f"serverChan has been pushed, return: {response.json()}")
             return True
@@ -54,12 +78,12 @@ def bark(title, body, options=None):
     使用 Bark 推送消息
     """
     bark_config = config.bark()
-    url = f"{bark_config.get('url')}/push"
-    key = bark_config.get('key')
+    url = f"{bark_config.url}/push"
+    key = bark_config.key
     options = options if options else {}
     data = {"title": title, "body": body, "device_key": key, **options}
     try:
-        response = requests.post(url, json=data)
+        response = http_session().post(url, json=data, timeout=channel_timeout('bark'))
         if response.ok:
             logger.info(f"Bark push has been sent, return: {response.json()}")
             return True
@@ -71,16 +95,16 @@ def bark(title, body, options=None):
 
 def feishu_webhook(title, desp='', options=None):
     feishu_webhook_config = config.feishu_webhook()
-    webhook_url = feishu_webhook_config.get("webhook_url")
-    secret = feishu_webhook_config.get("secret")
+    webhook_url = feishu_webhook_config.webhook_url
+    secret = feishu_webhook_config.secret
 
     # 检查必要参数
     if not webhook_url:
         logger.warning("飞书群聊机器人webhook_url未填写，跳过调用")
-        return
+        return False
     if not secret:
         logger.warning("飞书群聊机器人secret未填写，跳过调用")
-        return
+        return False
 
     try:
         timestamp = str(int(time.time()))
@@ -101,75 +125,93 @@ def feishu_webhook(title, desp='', options=None):
         logger.info("正在发送飞书群聊机器人通知")
 
         # 发送请求
-        response = requests.post(
+        response = http_session().post(
             webhook_url,
             headers={"Content-Type": "application/json"},
             json=request_body,
+            timeout=channel_timeout('feishu_webhook'),
             # 如需禁用IPv6可添加适配器配置（此处略）
         )
 
         # 处理响应
         if response.status_code != 200:
             logger.warning(f"发送失败，状态码：{response.status_code}，响应：{response.text}")
-            return
+            return False
 
         resp = response.json()
         if resp.get("code") != 0:
             logger.warning(f"飞书返回错误：{resp.get('code')} - {resp.get('msg', '未知错误')}")
-        else:
-            logger.info("飞书群聊机器人发送成功")
+            return False
+        logger.info("飞书群聊机器人发送成功")
+        return True
 
     except Exception as e:
         logger.error(f"飞书群聊机器人发送失败: {str(e)}")
+    return False
+
+# 企业微信 access_token 无效(40014)或已过期(42001)
+WECOM_TOKEN_INVALID_ERRCODES = (40014, 42001)
+
+_wecom_tokens = {}
+_wecom_tokens_lock = threading.Lock()
+
+
+def _wecom_token_provider(url, corpid, corpsecret):
+    """
+    按 (url, corpid, corpsecret) 缓存 TokenProvider，access_token 在有效期（expires_in）内复用
+    """
+    key = (url, corpid, corpsecret)
+    with _wecom_tokens_lock:
+        provider = _wecom_tokens.get(key)
+        if provider is None:
+            def fetch():
+                logger.info("正在获取企业微信APP推送TOKEN")
+                get_token_url = '{}/cgi-bin/gettoken?corpid={}&corpsecret={}'.format(url, corpid, corpsecret)
+                response = http_session().get(get_token_url, timeout=channel_timeout('wecom_app'))
+                if response.status_code != 200:
+                    raise ValueError(f"状态码：{response.status_code}，响应：{response.text}")
+                resp = response.json()
+                if resp.get("errcode") != 0:
+                    raise ValueError(f"返回错误：{resp.get('errcode')} - {resp.get('errmsg', '未知错误')}")
+                return resp.get("access_token"), resp.get("expires_in", 7200)
+
+            provider = _wecom_tokens[key] = TokenProvider(fetch, name="wecom_app")
+        return provider
+
 
 def wecom_app(title, desp='', options=None):
     wecom_app_config = config.wecom_app()
 
     try:
-        url = wecom_app_config.get("url")
-        corpid = wecom_app_config.get("corpid")
-        corpsecret = wecom_app_config.get("corpsecret")
-        agentid = wecom_app_config.get("agentid")
-        touser = wecom_app_config.get("touser")
+        url = wecom_app_config.url
+        corpid = wecom_app_config.corpid
+        corpsecret = wecom_app_config.corpsecret
+        agentid = wecom_app_config.agentid
+        touser = wecom_app_config.touser
 
         # 检查必要参数
         if not url:
             logger.warning("企业微信APP推送 url 未填写，跳过调用")
-            return
+            return False
         if not corpid:
             logger.warning("企业微信APP推送 corpid 未填写，跳过调用")
-            return
+            return False
         if not corpsecret :
             logger.warning("企业微信APP推送 corpsecret 未填写，跳过调用")
-            return
+            return False
         if not agentid :
             logger.warning("企业微信APP推送 agentid 未填写，跳过调用")
-            return
+            return False
         if not touser :
             logger.warning("企业微信APP推送 touser 未填写，跳过调用")
-            return
-
-        logger.info("正在获取企业微信APP推送TOKEN")
-        get_token_url = '{}/cgi-bin/gettoken?corpid={}&corpsecret={}'.format(url, corpid, corpsecret)
-        # 发送请求
-        response = requests.get(get_token_url)
-
-        # 处理响应
-        if response.status_code != 200:
-            logger.error(f"企业微信APP推送，获取TOKEN失败，状态码：{response.status_code}，响应：{response.text}")
-            return
-
-        resp = response.json()
-        if resp.get("errcode") != 0:
-            logger.error(f"企业微信APP推送，获取TOKEN失败，返回错误：{resp.get('errcode')} - {resp.get('errmsg', '未知错误')}")
+            return False
 
-        access_token = resp.get("access_token")
-
-        if not access_token :
-            logger.error("企业微信APP发送消息失败 access_token is nil")
-            return
-        logger.info(f"正在发送企业微信APP通知，已获取TOKEN：{access_token}")
-        send_url = '{}/cgi-bin/message/send?debug=1&access_token={}'.format(url, access_token)
+        token_provider = _wecom_token_provider(url, corpid, corpsecret)
+        try:
+            access_token = token_provider.get()
+        except Exception as e:
+            logger.error(f"企业微信APP推送，获取TOKEN失败：{e}")
+            return False
 
         # 构造请求体
         request_body = {
@@ -185,48 +227,82 @@ def wecom_app(title, desp='', options=None):
             "duplicate_check_interval": 1800
         }
 
-        logger.info(f"send_url:{send_url}")
         logger.info("正在发送企业微信APP通知")
 
-        # 发送请求
-        response = requests.post(
-            send_url,
-            headers={"Content-Type": "application/json"},
-            json=request_body,
-        )
-
-        # 处理响应
-        if response.status_code != 200:
-            logger.warning(f"企业微信APP发送失败，状态码：{response.status_code}，响应：{response.text}")
-            return
-
-        resp = response.json()
-        if resp.get("errcode") != 0:
-            logger.warning(f"企业微信APP返回错误：{resp.get('errcode')} - {resp.get('errmsg', '未知错误')}")
-        else:
+        for attempt in range(2):
+            send_url = '{}/cgi-bin/message/send?debug=1&access_token={}'.format(url, access_token)
+            # 发送请求
+            response = http_session().post(
+                send_url,
+                headers={"Content-Type": "application/json"},
+                json=request_body,
+                timeout=channel_timeout('wecom_app'),
+            )
+
+            # 处理响应
+            if response.status_code != 200:
+                logger.warning(f"企业微信APP发送失败，状态码：{response.status_code}，响应：{response.text}")
+                return False
+
+            resp = response.json()
+            if resp.get("errcode") in WECOM_TOKEN_INVALID_ERRCODES and attempt == 0:
+                # 缓存的 TOKEN 已失效，作废后重新获取并重发一次
+                logger.info(f"企业微信APP TOKEN 已失效：{resp.get('errcode')}，重新获取")
+                token_provider.invalidate(access_token)
+                access_token = token_provider.get()
+                continue
+            if resp.get("errcode") != 0:
+                logger.warning(f"企业微信APP返回错误：{resp.get('errcode')} - {resp.get('errmsg', '未知错误')}")
+                return False
             logger.info("企业微信APP发送成功")
+            return True
 
     except Exception as e:
         logger.error(f"企业微信APP发送失败: {str(e)}")
+    return False
 
-def send_email(subject, body):
-    email_account = config.mail()
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = email_account.get('account')
-        msg['To'] = email_account.get('mail_to')
-        msg['Subject'] = subject
+mail_transport = MailTransport()
 
-        msg.attach(MIMEText(body, 'plain'))
-        server = smtplib.SMTP(email_account.get('smtp_server'), email_account.get('smtp_port'), timeout=5)
 
-        if email_account.get('tls'):
-            server.starttls()
+def _build_email(email_account, subject, body):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
 
-        server.login(email_account.get('account'), email_account.get('password'))
-        server.sendmail(email_account.get('account'), email_account.get('mail_to'), msg.as_string())
-        server.quit()
+    msg = MIMEMultipart()
+    msg['From'] = email_account.account
+    msg['To'] = email_account.mail_to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return email_account.mail_to, msg.as_string()
 
-        logger.info(f"Successfully sent email to: {email_account.get('mail_to')}")
+
+def send_email(subject, body):
+    return send_emails([(subject, body)]) is True
+
+
+def send_emails(items):
+    """
+    通过复用的 SMTP 连接一次发送多封邮件，推送线程会把队列中积压的邮件合并后调用
+
+    :param items: [(subject, body), ...]
+    :return: 全部发送成功时为 True，否则为失败前已发送的封数（前 n 封已送达）
+    """
+    email_account = config.mail()
+    try:
+        messages = [_build_email(email_account, subject, body) for subject, body in items]
+        mail_transport.send(email_account, messages, timeout=config.notification_policy('mail').timeout)
+        logger.info(f"Successfully sent {len(messages)} email(s) to: {email_account.mail_to}")
+        return True
+    except MailSendError as e:
+        logger.error(f"Email sending failed after {e.sent} of {len(items)} email(s): {str(e)}")
+        return e.sent
     except Exception as e:
-        logger.error(f"Email sending failed: {str(e)}")
\ No newline at end of file
+        logger.error(f"Email sending failed: {str(e)}")
+    return 0
+
+
+channels = {'serverchan': serverchan, 'mail': send_email, 'bark': bark, 'feishu_webhook': feishu_webhook, "wecom_app": wecom_app}
+# 支持一次推送多条消息的渠道：{渠道名: 推送函数([(title, content), ...])}
+batch_channels = {'mail': send_emails}
+# 渠道空闲时调用的清理函数，例如断开空闲的长连接
+idle_hooks = {'mail': mail_transport.close_idle}
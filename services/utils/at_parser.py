@@ -0,0 +1,155 @@
+import logging
+
+logger = logging.getLogger("PyAirLink")
+
+# 最终结果码，收到后本条指令的响应结束
+FINAL_RESULTS = ('OK', 'ERROR')
+FINAL_ERROR_PREFIXES = ('+CMS ERROR:', '+CME ERROR:')
+# AT+CMGS 等待输入 PDU 的提示符，后面没有换行
+PROMPT = '>'
+# 模块主动上报的非请求结果码（URC）前缀
+URC_PREFIXES = ('+CMTI:', '+CMT:', '+CDSI:', '+CDS:')
+# 这些 URC 的下一行为 PDU 数据
+URC_WITH_PDU = ('+CMT:', '+CDS:')
+
+
+class ATResponse:
+    """
+    一条AT指令的结构化响应。
+    lines 为中间结果行（不含空行与 URC），final 为最终结果码（OK / ERROR / +CMS ERROR: ... / >），
+    超时未收到最终结果码时 final 为 None。
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.final = None
+
+    @property
+    def complete(self):
+        return self.final is not None
+
+    @property
+    def ok(self):
+        return self.final == 'OK' or self.final == PROMPT
+
+    @property
+    def error(self):
+        return self.final is not None and not self.ok
+
+    @property
+    def error_code(self):
+        """
+        +CMS ERROR / +CME ERROR 的错误码，如 '+CMS ERROR: 21' -> 21；其它情况为 None
+        """
+        if self.final is None or not self.final.startswith(FINAL_ERROR_PREFIXES):
+            return None
+        try:
+            return int(self.final.split(':', 1)[1])
+        except ValueError:
+            return None
+
+    @property
+    def text(self):
+        """
+        还原为文本形式，供需要原始响应字符串的调用方使用
+        """
+        lines = self.lines + [self.final] if self.final is not None else self.lines
+        return ''.join(f'\r\n{line}\r\n' for line in lines)
+
+    def records(self, prefix):
+        """
+        按 prefix 取出 “头行 + 数据行” 形式的记录，如 +CMGL / +CMGR 的响应，
+        返回 [(头行, 数据行或None), ...]
+        """
+        records = []
+        lines = self.lines
+        for i, line in enumerate(lines):
+            if line.startswith(prefix):
+                body = lines[i + 1] if i + 1 < len(lines) and not lines[i + 1].startswith(prefix) else None
+                records.append((line, body))
+        return records
+
+    def __repr__(self):
+        return f'ATResponse(lines={self.lines!r}, final={self.final!r})'
+
+
+class ATResponseParser:
+    """
+    增量的行解析器。
+    串口读到的字节通过 feed() 追加到 bytearray 缓冲区，每次只切分新到达的完整 \\r\\n 行，
+    行被分类为最终结果码、中间结果或 URC；URC 交给 urc_callback(line, pdu)，
+    其余行归入 begin() 开始的当前响应。
+    """
+
+    def __init__(self, urc_callback=None):
+        self.urc_callback = urc_callback
+        self.response = None
+        self._buffer = bytearray()
+        self._pending_urc = None
+
+    def begin(self):
+        """
+        开始接收一条新指令的响应
+        """
+        self.response = ATResponse()
+        return self.response
+
+    def end(self):
+        response, self.response = self.response, None
+        return response
+
+    def feed(self, data):
+        """
+        追加数据并解析其中完整的行。
+
+        :return: 本次新增到当前响应中的行（含最终结果码），用于关键字判断
+        """
+        self._buffer += data
+        new_lines = []
+        start = 0
+        buffer = self._buffer
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = buffer[start:end].strip().decode(errors='ignore')
+            start = end + 1
+            if line:
+                self._classify(line, new_lines)
+        if start:
+            del buffer[:start]
+        # 提示符 '>' 之后没有换行，需要单独检查缓冲区剩余部分
+        if self.response is not None and not self.response.complete and self._pending_urc is None:
+            if buffer.strip() == PROMPT.encode():
+                buffer.clear()
+                self.response.final = PROMPT
+                new_lines.append(PROMPT)
+        return new_lines
+
+    def _classify(self, line, new_lines):
+        if self._pending_urc is not None:
+            header, self._pending_urc = self._pending_urc, None
+            self._emit_urc(header, line)
+            return
+        if line.startswith(URC_PREFIXES):
+            if line.startswith(URC_WITH_PDU):
+                self._pending_urc = line
+            else:
+                self._emit_urc(line, None)
+            return
+        response = self.response
+        if response is None or response.complete:
+            logger.debug(f"Discard unexpected line: {line}")
+            return
+        if line in FINAL_RESULTS or line.startswith(FINAL_ERROR_PREFIXES):
+            response.final = line
+        else:
+            response.lines.append(line)
+        new_lines.append(line)
+
+    def _emit_urc(self, line, pdu):
+        if self.urc_callback:
+            try:
+                self.urc_callback(line, pdu)
+            except Exception as e:
+                logger.error(f"URC callback error: {e}")
@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from configparser import ConfigParser
+
+from .config_parser import config, parse_settings
+from .simulator import FakeModem
+
+logger = logging.getLogger("PyAirLink")
+
+# 端到端压测：用 FakeModem 代替实体模块，在临时目录中运行真实的 ModemSession / ModemPool / sms_listener / 收件箱，
+# 输出 AT 指令往返时间、发送吞吐量与收到短信到发布 sms 事件的端到端延迟，作为性能回归的基线。
+#   python -m services.utils.benchmark --modems 2 --latency 0.01 --messages 200
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summary(values):
+    """
+    :return: 'p50 x ms, p99 y ms, max z ms'
+    """
+    return (f"p50 {percentile(values, 0.5) * 1000:.1f} ms, p99 {percentile(values, 0.99) * 1000:.1f} ms, "
+            f"max {max(values, default=0) * 1000:.1f} ms")
+
+
+def prepare(workdir, fakes):
+    """
+    在 workdir/data 下写入指向各 FakeModem 的配置并切换工作目录，收件箱等数据库都建在临时目录中；
+    关闭推送渠道，避免压测时访问外部服务
+    """
+    parser = ConfigParser()
+    parser.read(os.path.join(ROOT, 'config.ini.template'))
+    parser['SERIAL']['PORT'] = fakes[0].port
+    for i, fake in enumerate(fakes[1:], start=2):
+        parser[f'SERIAL:{i}'] = {'PORT': fake.port, 'BAUD_RATE': '115200', 'TIMEOUT': '1'}
+    parser['NOTIFICATION']['CHANNELS'] = ''
+    parser['SMS']['POLL_INTERVAL'] = '3600'
+    os.makedirs(os.path.join(workdir, 'data'))
+    with open(os.path.join(workdir, 'data', 'config.ini'), 'w') as f:
+        parser.write(f)
+    os.chdir(workdir)
+    config.settings = parse_settings(parser)
+
+
+def bench_at(modems, rounds):
+    """
+    AT 指令往返时间：依次发送 rounds 条 AT，每条等待 OK
+    """
+    session = modems.get()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        session.send_at_command(b'AT\r\n', keywords='OK')
+        times.append(time.perf_counter() - start)
+    print(f"AT round trip ({rounds}): {summary(times)}")
+
+
+def bench_send(modems, count):
+    """
+    发送吞吐量：一次提交 count 条短信，由模块池分配到各模块
+    """
+    from services.initialize import _send_segments
+    from services.utils.sms import encode_sms
+
+    segments = encode_sms('+8613800138000', 'PyAirLink benchmark')
+    latencies = []
+    done = threading.Event()
+
+    def record(start):
+        def callback(future):
+            latencies.append(time.perf_counter() - start)
+            if len(latencies) == count:
+                done.set()
+        return callback
+
+    start = time.perf_counter()
+    futures = []
+    for i in range(count):
+        future = modems.send(_send_segments, segments, to=f'+86138{i:08d}')
+        future.add_done_callback(record(time.perf_counter()))
+        futures.append(future)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    sent = sum(1 for future in futures if future.exception() is None and future.result())
+    print(f"send: {sent}/{count} sent in {elapsed:.2f}s, {count / elapsed:.1f} msg/s, "
+          f"per message (incl. queueing) {summary(latencies)}")
+
+
+async def bench_inbound(modems, fakes, count, interval):
+    """
+    收短信端到端延迟：FakeModem 上报 +CMTI 到 sms_listener 读取、解析、写入收件箱并发布 sms 事件
+    """
+    from services.initialize import sms_listener
+    from services.utils.event_stream import sms_events
+
+    subscription = sms_events.subscribe(maxsize=count + 16)
+    stop_event = threading.Event()
+    listeners = [threading.Thread(target=sms_listener, args=(stop_event, session), daemon=True)
+                 for session in modems]
+    for listener in listeners:
+        listener.start()
+    injected = {}
+
+    def inject():
+        for i in range(count):
+            text = f'benchmark {i}'
+            injected[text] = time.perf_counter()
+            fakes[i % len(fakes)].inject_sms('+8610086', text)
+            time.sleep(interval)
+
+    await asyncio.sleep(0.5)
+    injector = threading.Thread(target=inject, daemon=True)
+    injector.start()
+    latencies = []
+    try:
+        while len(latencies) < count:
+            event, data, _ = await subscription.get(timeout=30)
+            if event == 'sms' and data['body'] in injected:
+                latencies.append(time.perf_counter() - injected[data['body']])
+    except asyncio.TimeoutError:
+        print(f"inbound: timed out, {len(latencies)}/{count} received")
+    finally:
+        sms_events.unsubscribe(subscription)
+        stop_event.set()
+        for listener in listeners:
+            listener.join()
+    print(f"inbound ({len(latencies)}, one every {interval * 1000:.0f} ms): end-to-end {summary(latencies)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PyAirLink end-to-end benchmark against simulated modems")
+    parser.add_argument('--modems', type=int, default=1, help="number of simulated modems")
+    parser.add_argument('--latency', type=float, default=0.005, help="simulated response latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probability of +CMS ERROR on submit")
+    parser.add_argument('--messages', type=int, default=200, help="messages to send")
+    parser.add_argument('--inbound', type=int, default=100, help="messages to receive")
+    parser.add_argument('--interval', type=float, default=0.02, help="seconds between received messages")
+    parser.add_argument('--rounds', type=int, default=500, help="AT round trips")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s [%(levelname)s] %(message)s')
+    sys.path.insert(0, ROOT)
+    cwd = os.getcwd()
+    fakes = [FakeModem(latency=args.latency, error_rate=args.error_rate).start() for _ in range(args.modems)]
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            prepare(workdir, fakes)
+            # 配置替换后再导入，模块池与收件箱使用压测配置
+            from services.initialize import initialize_module
+            from services.utils.modem_pool import modems
+
+            print(f"{args.modems} simulated modem(s), {args.latency * 1000:.0f} ms latency, "
+                  f"{args.error_rate:.0%} submit errors")
+            modems.start()
+            try:
+                for session in modems:
+                    initialize_module(session)
+                bench_at(modems, args.rounds)
+                bench_send(modems, args.messages)
+                asyncio.run(bench_inbound(modems, fakes, args.inbound, args.interval))
+            finally:
+                modems.stop()
+                os.chdir(cwd)
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
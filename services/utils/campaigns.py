@@ -0,0 +1,205 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import orjson
+
+from .config_parser import config
+
+logger = logging.getLogger("PyAirLink")
+
+# 收件人只保存一次，每轮发送不复制也不重置：campaign.run 为当前轮次，recipient.run < campaign.run 的收件人即本轮待发送。
+# 开始新一轮只需把 campaign.run 加一；中途重启后按同一轮次继续发送尚未处理的收件人。
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sms_campaign (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    schedule TEXT NOT NULL,  -- 触发方式（API 中的 trigger），JSON
+    rate REAL NOT NULL,
+    status TEXT NOT NULL,
+    run INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS sms_campaign_recipient (
+    campaign_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    number TEXT NOT NULL,
+    run INTEGER NOT NULL DEFAULT 0,
+    status INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, seq)
+) WITHOUT ROWID;
+"""
+
+SCHEDULED, RUNNING, COMPLETED, CANCELLED = 'scheduled', 'running', 'completed', 'cancelled'
+# 收件人在最近一次处理时的结果
+SENT, FAILED = 1, 2
+
+
+class CampaignStore:
+    """
+    群发任务：短信内容、触发方式（date 单次 / cron 周期）与收件人列表保存在 DATABASE/SQLITE 指定的数据库中，
+    每个群发任务在 APScheduler 中只对应一个任务，运行时再按页读取收件人逐条发送，并记录每个收件人的结果。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.sqlite_path()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def create(self, name, message, trigger, recipients, rate=0):
+        """
+        :param trigger: {'type': 'date', 'run_date': ...} 或 {'type': 'cron', 'cron': ...}
+        :param recipients: 收件号码列表
+        :param rate: 每秒最多发送条数，0 表示不限制
+        :return: 新群发任务的 id
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            campaign_id = conn.execute(
+                'INSERT INTO sms_campaign (name, message, schedule, rate, status, total, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (name, message, orjson.dumps(trigger).decode(), rate, SCHEDULED, len(recipients),
+                 time.time())).lastrowid
+            conn.executemany(
+                'INSERT INTO sms_campaign_recipient (campaign_id, seq, number) VALUES (?, ?, ?)',
+                ((campaign_id, seq, number) for seq, number in enumerate(recipients)))
+        return campaign_id
+
+    def get(self, campaign_id):
+        """
+        :return: 群发任务及当前轮次的进度（sent / failed / pending），不存在时返回 None
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT id, name, message, schedule, rate, status, run, total, created, started, finished '
+                'FROM sms_campaign WHERE id = ?', (campaign_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM sms_campaign_recipient WHERE campaign_id = ? AND run = ? '
+                'GROUP BY status', (campaign_id, row[6])).fetchall()) if row[6] else {}
+        return self._row(row, counts)
+
+    def list(self):
+        with self._lock:
+            ids = [row[0] for row in self._connect().execute('SELECT id FROM sms_campaign ORDER BY id DESC')]
+        return [campaign for campaign in map(self.get, ids) if campaign is not None]
+
+    def interrupted(self):
+        """
+        上次退出时仍在发送中的群发任务 id，启动后继续发送
+        """
+        with self._lock:
+            return [row[0] for row in self._connect().execute(
+                'SELECT id FROM sms_campaign WHERE status = ?', (RUNNING,))]
+
+    def start_run(self, campaign_id):
+        """
+        开始一轮发送，上一轮未完成（进程中途退出）时继续该轮
+
+        :return: (短信内容, 轮次, 每秒条数, 触发方式)，群发任务已取消、已完成或不存在时返回 None
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT message, status, run, rate, schedule FROM sms_campaign WHERE id = ?',
+                               (campaign_id,)).fetchone()
+            if row is None or row[1] in (CANCELLED, COMPLETED):
+                return None
+            message, status, run, rate, trigger = row
+            if status != RUNNING:
+                run += 1
+                conn.execute('UPDATE sms_campaign SET status = ?, run = ?, started = ?, finished = NULL '
+                             'WHERE id = ?', (RUNNING, run, time.time(), campaign_id))
+        return message, run, rate, orjson.loads(trigger)
+
+    def pending(self, campaign_id, run, after=-1, limit=500):
+        """
+        本轮尚未处理的收件人，按序号升序
+
+        :param after: 上一页最后一个序号
+        :return: [(序号, 号码), ...]
+        """
+        with self._lock:
+            return self._connect().execute(
+                'SELECT seq, number FROM sms_campaign_recipient WHERE campaign_id = ? AND seq > ? AND run < ? '
+                'ORDER BY seq LIMIT ?', (campaign_id, after, run, limit)).fetchall()
+
+    def record(self, campaign_id, run, results):
+        """
+        :param results: [(序号, SENT 或 FAILED), ...]
+        """
+        if not results:
+            return
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'UPDATE sms_campaign_recipient SET run = ?, status = ? WHERE campaign_id = ? AND seq = ?',
+                ((run, status, campaign_id, seq) for seq, status in results))
+
+    def finish_run(self, campaign_id, status):
+        """
+        :param status: 单次群发为 COMPLETED，周期群发为 SCHEDULED（等待下一轮）；已取消的群发任务保持 CANCELLED
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('UPDATE sms_campaign SET status = ?, finished = ? WHERE id = ? AND status = ?',
+                         (status, time.time(), campaign_id, RUNNING))
+
+    def cancel(self, campaign_id):
+        """
+        :return: 群发任务是否存在且尚未结束
+        """
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute('UPDATE sms_campaign SET status = ?, finished = ? WHERE id = ? AND status IN (?, ?)',
+                                  (CANCELLED, time.time(), campaign_id, SCHEDULED, RUNNING))
+            return cursor.rowcount > 0
+
+    def is_cancelled(self, campaign_id):
+        with self._lock:
+            row = self._connect().execute('SELECT status FROM sms_campaign WHERE id = ?', (campaign_id,)).fetchone()
+        return row is None or row[0] == CANCELLED
+
+    @staticmethod
+    def _row(row, counts):
+        campaign_id, name, message, trigger, rate, status, run, total, created, started, finished = row
+        sent, failed = counts.get(SENT, 0), counts.get(FAILED, 0)
+        return {
+            'id': campaign_id,
+            'name': name,
+            'message': message,
+            'trigger': orjson.loads(trigger),
+            'rate': rate,
+            'status': status,
+            'run': run,
+            'total': total,
+            'sent': sent,
+            'failed': failed,
+            'pending': total - sent - failed if run else total,
+            'created': datetime.fromtimestamp(created, timezone.utc),
+            'started': datetime.fromtimestamp(started, timezone.utc) if started else None,
+            'finished': datetime.fromtimestamp(finished, timezone.utc) if finished else None,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+campaigns = CampaignStore()
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("PyAirLink")
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    推送渠道（以及模块池中各模块）的熔断器与健康统计。
+    连续失败 failure_threshold 次后熔断（open），cooldown 秒内不再调用该渠道；
+    冷却结束后进入 half_open，只放行一次试探调用（试探未结束时其它调用仍被拒绝），成功则恢复（closed），失败则重新熔断。
+    """
+
+    def __init__(self, name, failure_threshold=5, cooldown=60, window=1000, label='Notification channel'):
+        """
+        :param failure_threshold: 触发熔断的连续失败次数，0 表示不熔断
+        :param cooldown: 熔断持续秒数
+        :param window: 参与延迟分位数统计的最近调用次数
+        :param label: 日志中的对象名称
+        """
+        self.name = name
+        self.label = label
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.calls = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.latency_total = 0.0
+        self.recent_latencies = deque(maxlen=window)
+        self._opened_at = 0.0
+        # 半开状态下试探调用开始的时间，None 表示还没有放行试探调用
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        是否允许调用该渠道；熔断期间返回 False 并计入 short_circuited
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self._opened_at < self.cooldown:
+                    self.short_circuited += 1
+                    return False
+                self.state = HALF_OPEN
+                self._trial_started = None
+                logger.info(f"{self.label} {self.name} circuit half-open, trying one call")
+            if self.state == HALF_OPEN:
+                # 试探调用没有结果（如被取消）超过 cooldown 秒时，再放行一次
+                if self._trial_started is not None and now - self._trial_started < self.cooldown:
+                    self.short_circuited += 1
+                    return False
+                self._trial_started = now
+            return True
+
+    def retry_after(self):
+        """
+        距离熔断结束的秒数，未熔断时为 0
+        """
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.cooldown - (time.monotonic() - self._opened_at), 0.0)
+
+    def record_success(self, latency):
+        with self._lock:
+            self._record(latency)
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info(f"{self.label} {self.name} recovered, circuit closed")
+                self.state = CLOSED
+
+    def record_failure(self, latency, error):
+        with self._lock:
+            self._record(latency)
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.state == HALF_OPEN or (
+                    self.failure_threshold and self.consecutive_failures >= self.failure_threshold):
+                if self.state != OPEN:
+                    logger.warning(f"{self.label} {self.name} failed {self.consecutive_failures} times "
+                                   f"in a row, circuit open for {self.cooldown}s: {error}")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _record(self, latency):
+        self.calls += 1
+        self.latency_total += latency
+        self.recent_latencies.append(latency)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.recent_latencies)
+            state = self.state
+            if state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                state = HALF_OPEN
+            return {
+                'channel': self.name,
+                'state': state,
+                'calls': self.calls,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited,
+                'consecutive_failures': self.consecutive_failures,
+                'last_error': self.last_error,
+                'latency_avg_ms': self.latency_total / self.calls * 1000 if self.calls else 0.0,
+                'latency_p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+                'latency_p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+            }
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    """
+    串口任务的优先级分类，数值越小越优先
+    """
+    INTERACTIVE = 0  # API 即时发送短信、模块初始化
+    INBOUND = 1  # 读取新短信
+    BULK = 2  # 定时任务、批量发送
+    DIAGNOSTIC = 3  # 任意AT命令、重启
+
+
+class CommandQueueFull(Exception):
+    """
+    对应优先级的队列已满
+    """
+
+
+class CommandDeadlineExceeded(TimeoutError):
+    """
+    任务在队列中等待超过截止时间，未被执行
+    """
+
+
+class _Entry:
+    __slots__ = ('future', 'job', 'args', 'kwargs', 'priority', 'enqueued', 'deadline')
+
+    def __init__(self, future, job, args, kwargs, priority, deadline):
+        self.future = future
+        self.job = job
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + deadline if deadline is not None else None
+
+
+class _ClassStats:
+    __slots__ = ('submitted', 'completed', 'rejected', 'expired', 'wait_total', 'wait_max', 'recent_waits')
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=1000)
+
+
+class CommandScheduler:
+    """
+    串口任务调度器。
+    每个优先级一个有界的先进先出队列，取任务时优先级高者先出；为避免低优先级长期饥饿，
+    任务等待超过 aging 秒后有效优先级提升一级（最多一级），与上一级的任务按入队先后执行，
+    因此等待再久的批量任务也不会排在新的即时任务之前。每个优先级可设置最长排队时间，超时的任务不再执行，
+    其 future 以 CommandDeadlineExceeded 结束。
+    """
+    MAXSIZE = {Priority.INTERACTIVE: 100, Priority.INBOUND: 100, Priority.BULK: 10000, Priority.DIAGNOSTIC: 20}
+    DEADLINE = {Priority.INTERACTIVE: 30, Priority.INBOUND: 60, Priority.BULK: None, Priority.DIAGNOSTIC: 60}
+
+    def __init__(self, maxsize=None, deadline=None, aging=5):
+        self.maxsize = {**self.MAXSIZE, **(maxsize or {})}
+        self.deadline = {**self.DEADLINE, **(deadline or {})}
+        self.aging = aging
+        self._queues = {priority: deque() for priority in Priority}
+        self._stats = {priority: _ClassStats() for priority in Priority}
+        self._cond = threading.Condition()
+
+    def put(self, future, job, args, kwargs, priority=Priority.INTERACTIVE, deadline=None):
+        """
+        加入队列。
+
+        :param deadline: 最长排队秒数，不传则使用该优先级的默认值
+        :raise CommandQueueFull: 该优先级的队列已满
+        """
+        priority = Priority(priority)
+        if deadline is None:
+            deadline = self.deadline[priority]
+        entry = _Entry(future, job, args, kwargs, priority, deadline)
+        with self._cond:
+            queue = self._queues[priority]
+            stats = self._stats[priority]
+            if len(queue) >= self.maxsize[priority]:
+                stats.rejected += 1
+                raise CommandQueueFull(f"{priority.name} command queue is full ({self.maxsize[priority]})")
+            queue.append(entry)
+            stats.submitted += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        取出下一个要执行的任务，超时返回 None。
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                entry = self._pop()
+                if entry is not None:
+                    return entry
+                remaining = end - time.monotonic() if end is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def drain(self):
+        """
+        清空所有队列并返回其中的任务
+        """
+        with self._cond:
+            entries = [entry for queue in self._queues.values() for entry in queue]
+            for queue in self._queues.values():
+                queue.clear()
+        return entries
+
+    def pending(self):
+        """
+        所有优先级排队中的任务数
+        """
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def done(self, entry):
+        """
+        任务执行完毕后调用，用于统计
+        """
+        self._stats[entry.priority].completed += 1
+
+    def stats(self):
+        """
+        各优先级的队列长度与排队等待时间统计
+        """
+        result = []
+        with self._cond:
+            for priority in Priority:
+                stats = self._stats[priority]
+                waits = sorted(stats.recent_waits)
+                started = stats.submitted - stats.expired - len(self._queues[priority])
+                result.append({
+                    'priority': priority.name,
+                    'queued': len(self._queues[priority]),
+                    'maxsize': self.maxsize[priority],
+                    'submitted': stats.submitted,
+                    'completed': stats.completed,
+                    'rejected': stats.rejected,
+                    'expired': stats.expired,
+                    'wait_avg_ms': stats.wait_total / started * 1000 if started > 0 else 0.0,
+                    'wait_max_ms': stats.wait_max * 1000,
+                    'wait_p50_ms': waits[len(waits) // 2] * 1000 if waits else 0.0,
+                    'wait_p99_ms': waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000 if waits else 0.0,
+                })
+        return result
+
+    def _pop(self):
+        now = time.monotonic()
+        best = None
+        best_key = None
+        for priority, queue in self._queues.items():
+            # 先丢弃队头已过截止时间的任务
+            while queue and queue[0].deadline is not None and queue[0].deadline < now:
+                entry = queue.popleft()
+                self._stats[priority].expired += 1
+                if entry.future.set_running_or_notify_cancel():
+                    entry.future.set_exception(CommandDeadlineExceeded(
+                        f"{priority.name} command waited more than {entry.deadline - entry.enqueued:.0f}s in queue"))
+            if not queue:
+                continue
+            head = queue[0]
+            # 等待超过 aging 秒只提升一级，同一有效优先级内先入队者先出
+            level = max(priority - 1, 0) if now - head.enqueued >= self.aging else priority
+            key = (level, head.enqueued)
+            if best_key is None or key < best_key:
+                best, best_key = priority, key
+        if best is None:
+            return None
+        entry = self._queues[best].popleft()
+        wait = now - entry.enqueued
+        stats = self._stats[best]
+        stats.wait_total += wait
+        stats.wait_max = max(stats.wait_max, wait)
+        stats.recent_waits.append(wait)
+        return entry
+
+
+if __name__ == "__main__":
+    # 回归检查：批量任务已排队很久时，新的即时任务仍然先执行
+    from concurrent.futures import Future
+
+    scheduler = CommandScheduler(aging=5)
+    for i in range(8):
+        scheduler.put(Future(), 'bulk', (), {}, Priority.BULK)
+    for entry in scheduler._queues[Priority.BULK]:
+        entry.enqueued -= 15
+    scheduler.put(Future(), 'inbound', (), {}, Priority.INBOUND)
+    scheduler.put(Future(), 'interactive', (), {}, Priority.INTERACTIVE)
+    order = [scheduler.get(timeout=0).job for _ in range(10)]
+    print(order)
+    assert order[0] == 'interactive', order
+    # 超过 aging 的批量任务与上一级（读取短信）按入队先后执行，不会饿死
+    assert order[1] == 'bulk', order
@@ -96,6 +96,17 @@ class ATCommands:
         """
         return ATCommands._send(f"AT+CMGL={stat}")
 
+    @staticmethod
+    def cmgr(index):
+        """
+        读取指定位置的短信，一般用于收到 +CMTI: <mem>,<index> 上报之后，且返回如下：
+            +CMGR:<stat>,[<alpha>],<length><CR><LF><pdu>
+            OK
+        :param index: 短信在存储区中的位置
+        :return:
+        """
+        return ATCommands._send(f"AT+CMGR={index}")
+
     @staticmethod
     def cmgd(index=1, delflag=3):
         """
@@ -128,6 +139,16 @@ class ATCommands:
         """ Prepare for sending a message. The command must be followed by the PDU and Ctrl-Z. """
         return ATCommands._send(f"AT+CMGS={to}")
 
+    @staticmethod
+    def cmms(mode=1):
+        """
+        连续发送多条短信时保持中继链路。
+        0 关闭
+        1 保持链路，若两条短信间隔超过1-5秒（由网络决定）则链路关闭并自动切回0
+        2 一直保持链路
+        """
+        return ATCommands._send(f"AT+CMMS={mode}")
+
     @staticmethod
     def cpms(mem='SM'):
         """ Set up a short message storage area; "SM" stands for SIM card. """
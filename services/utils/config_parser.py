@@ -1,56 +1,363 @@
-from configparser import ConfigParser
+import logging
+import os
+import threading
+import time
+from configparser import ConfigParser, Error as ConfigParserError
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+logger = logging.getLogger("PyAirLink")
+
+
+class ConfigError(ValueError):
+    """
+    配置文件缺少必填项或取值不合法，message 中列出所有出错的 [节] 选项
+    """
+
+
+@dataclass(frozen=True)
+class SerialSettings:
+    port: str
+    rate: int
+    timeout: int
+
+
+@dataclass(frozen=True)
+class SMSSettings:
+    # 收到 +CMTI 上报后按位置读取短信，轮询只作为低频兜底
+    poll_interval: int
+    # 多个模块时发送短信的分配方式，见 ROUTING_STRATEGIES
+    routing: str
+    # 模块连续发送失败 failure_threshold 次后 cooldown 秒内不再分配短信
+    failure_threshold: int
+    cooldown: float
+
+
+ROUTING_STRATEGIES = ('least_queue', 'round_robin', 'sticky')
+
+
+@dataclass(frozen=True)
+class SchedulerSettings:
+    # 定时任务在独立线程池中执行，不占用事件循环与 API 使用的默认线程池
+    max_workers: int
+    # 以下为定时任务的默认值，添加任务时可以单独指定
+    max_instances: int
+    coalesce: bool
+    misfire_grace_time: int
+
+
+@dataclass(frozen=True)
+class BarkSettings:
+    url: str
+    key: str
+
+
+@dataclass(frozen=True)
+class FeishuWebhookSettings:
+    webhook_url: str
+    secret: str
+
+
+@dataclass(frozen=True)
+class WecomAppSettings:
+    url: str
+    corpid: str
+    corpsecret: str
+    agentid: str
+    touser: str
+
+
+@dataclass(frozen=True)
+class MailSettings:
+    smtp_server: str
+    smtp_port: int
+    account: str
+    password: str
+    mail_to: str
+    tls: bool
+
+
+@dataclass(frozen=True)
+class ChannelPolicy:
+    timeout: float
+    failure_threshold: int
+    cooldown: float
+    digest_window: float
+    digest_max: int
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    一次解析得到的完整配置快照，不可修改；热加载时整体替换
+    """
+    sqlite: str
+    serial: SerialSettings
+    # 所有模块，{模块名: 串口配置}，[SERIAL] 为 'default'，[SERIAL:<name>] 为 <name>
+    modems: Mapping[str, SerialSettings]
+    sms: SMSSettings
+    scheduler: SchedulerSettings
+    # 推送渠道的配置只在渠道启用（[NOTIFICATION] CHANNELS）时解析，未启用为 None
+    server_chan: Optional[str]
+    bark: Optional[BarkSettings]
+    feishu_webhook: Optional[FeishuWebhookSettings]
+    wecom_app: Optional[WecomAppSettings]
+    mail: Optional[MailSettings]
+    channels: Tuple[str, ...]
+    reload_interval: float
+    default_policy: ChannelPolicy
+    policies: Mapping[str, ChannelPolicy]
+
+
+class _Reader:
+    """
+    读取并校验选项，出错时先记录下来，便于一次报告所有问题
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.errors = []
+
+    def get(self, section, option, getter='get', fallback=None, minimum=None, choices=None):
+        if not self.parser.has_option(section, option):
+            if fallback is None:
+                self.errors.append(f"[{section}] {option}: missing")
+            return fallback
+        try:
+            value = getattr(self.parser, getter)(section, option)
+        except (ValueError, ConfigParserError) as e:
+            self.errors.append(f"[{section}] {option}: {e}")
+            return fallback
+        if minimum is not None and value < minimum:
+            self.errors.append(f"[{section}] {option}: must be >= {minimum}, got {value}")
+            return fallback
+        if choices is not None and value not in choices:
+            self.errors.append(f"[{section}] {option}: must be one of {', '.join(choices)}, got {value}")
+            return fallback
+        return value
+
+
+_NON_CHANNEL_SECTIONS = ('CONFIG', 'DATABASE', 'SERIAL', 'SMS', 'SCHEDULER', 'NOTIFICATION')
+_SERIAL_PREFIX = 'SERIAL:'
+
+
+def parse_settings(parser):
+    """
+    把 ConfigParser 解析为 Settings，配置不合法时抛出 ConfigError
+    """
+    r = _Reader(parser)
+
+    def policy(section, default):
+        return ChannelPolicy(
+            timeout=r.get(section, 'TIMEOUT', 'getfloat', fallback=default.timeout, minimum=0.1),
+            failure_threshold=r.get(section, 'BREAKER_THRESHOLD', 'getint', fallback=default.failure_threshold,
+                                    minimum=0),
+            cooldown=r.get(section, 'BREAKER_COOLDOWN', 'getfloat', fallback=default.cooldown, minimum=0),
+            digest_window=r.get(section, 'DIGEST_WINDOW', 'getfloat', fallback=default.digest_window, minimum=0),
+            digest_max=r.get(section, 'DIGEST_MAX', 'getint', fallback=default.digest_max, minimum=1),
+        )
+
+    channels = r.get('NOTIFICATION', 'CHANNELS', fallback='')
+    channels = tuple(channel.strip() for channel in channels.split(',') if channel.strip())
+    default_policy = policy('NOTIFICATION', ChannelPolicy(timeout=10, failure_threshold=5, cooldown=60,
+                                                          digest_window=0, digest_max=20))
+    # 渠道名即配置节名的小写，如 [FEISHU_WEBHOOK] -> feishu_webhook；未启用的渠道不读取其配置节，缺少或填错都不报错
+    policies = {section.lower(): policy(section, default_policy)
+                for section in parser.sections()
+                if section not in _NON_CHANNEL_SECTIONS and not section.startswith(_SERIAL_PREFIX)
+                and section.lower() in channels}
+
+    def channel(name, build):
+        return build() if name in channels else None
+
+    def serial(section):
+        return SerialSettings(
+            port=r.get(section, 'PORT'),
+            rate=r.get(section, 'BAUD_RATE', 'getint', fallback=115200 if section != 'SERIAL' else None, minimum=1),
+            timeout=r.get(section, 'TIMEOUT', 'getint', fallback=1 if section != 'SERIAL' else None, minimum=0),
+        )
+
+    modems = {'default': serial('SERIAL')}
+    for section in parser.sections():
+        if section.startswith(_SERIAL_PREFIX):
+            name = section[len(_SERIAL_PREFIX):].strip()
+            if not name or name in modems:
+                r.errors.append(f"[{section}]: modem name must be unique and not empty")
+                continue
+            modems[name] = serial(section)
+
+    settings = Settings(
+        sqlite=r.get('DATABASE', 'SQLITE'),
+        serial=modems['default'],
+        modems=MappingProxyType(modems),
+        sms=SMSSettings(
+            poll_interval=r.get('SMS', 'POLL_INTERVAL', 'getint', fallback=60, minimum=1),
+            routing=r.get('SMS', 'ROUTING', fallback='least_queue', choices=ROUTING_STRATEGIES),
+            failure_threshold=r.get('SMS', 'FAILURE_THRESHOLD', 'getint', fallback=3, minimum=0),
+            cooldown=r.get('SMS', 'COOLDOWN', 'getfloat', fallback=60, minimum=0),
+        ),
+        scheduler=SchedulerSettings(
+            max_workers=r.get('SCHEDULER', 'MAX_WORKERS', 'getint', fallback=4, minimum=1),
+            max_instances=r.get('SCHEDULER', 'MAX_INSTANCES', 'getint', fallback=1, minimum=1),
+            coalesce=r.get('SCHEDULER', 'COALESCE', 'getboolean', fallback=True),
+            misfire_grace_time=r.get('SCHEDULER', 'MISFIRE_GRACE_TIME', 'getint', fallback=60, minimum=1),
+        ),
+        server_chan=channel('serverchan', lambda: r.get('SERVERCHAN', 'SENDKEY')),
+        bark=channel('bark', lambda: BarkSettings(url=r.get('BARK', 'URL'), key=r.get('BARK', 'KEY'))),
+        feishu_webhook=channel('feishu_webhook', lambda: FeishuWebhookSettings(
+            webhook_url=r.get('FEISHU_WEBHOOK', 'WEBHOOK_URL'),
+            secret=r.get('FEISHU_WEBHOOK', 'SECRET'),
+        )),
+        wecom_app=channel('wecom_app', lambda: WecomAppSettings(
+            url=r.get('WECOM_APP', 'URL'),
+            corpid=r.get('WECOM_APP', 'CORPID'),
+            corpsecret=r.get('WECOM_APP', 'CORPSECRET'),
+            agentid=r.get('WECOM_APP', 'AGENTID'),
+            touser=r.get('WECOM_APP', 'TOUSER'),
+        )),
+        mail=channel('mail', lambda: MailSettings(
+            smtp_server=r.get('MAIL', 'SMTP_SERVER'),
+            smtp_port=r.get('MAIL', 'SMTP_PORT', 'getint', minimum=1),
+            account=r.get('MAIL', 'ACCOUNT'),
+            password=r.get('MAIL', 'PASSWORD'),
+            mail_to=r.get('MAIL', 'MAIL_TO'),
+            tls=r.get('MAIL', 'TLS', 'getboolean'),
+        )),
+        channels=channels,
+        reload_interval=r.get('CONFIG', 'RELOAD_INTERVAL', 'getfloat', fallback=0, minimum=0),
+        default_policy=default_policy,
+        policies=MappingProxyType(policies),
+    )
+    if r.errors:
+        raise ConfigError("Invalid configuration:\n  " + "\n  ".join(r.errors))
+    return settings
 
 
 class Config:
+    """
+    配置只在启动和热加载时解析一次，得到不可修改的 Settings 快照，各方法直接返回快照中的对象。
+    reload() 重新读取配置文件，校验通过后整体替换快照，校验失败则保留当前配置；
+    可由 SIGHUP 触发，或由 watch() 在配置文件修改后自动触发。串口与数据库配置需要重启后生效。
+    """
+
     def __init__(self, ini_path='data/config.ini', default_ini_path='config.ini.template'):
-        self.config = ConfigParser()
-        config_read = self.config.read(ini_path)
-        if not config_read:
-            print(f"Warning: '{ini_path}' not found. Using default settings.")
-            self.config.read(default_ini_path)
+        self.ini_path = ini_path
+        self.default_ini_path = default_ini_path
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._mtime = self._stat()
+        self.settings = parse_settings(self._read())
+
+    def _read(self):
+        parser = ConfigParser()
+        if not parser.read(self.ini_path):
+            print(f"Warning: '{self.ini_path}' not found. Using default settings.")
+            parser.read(self.default_ini_path)
+        return parser
+
+    def _stat(self):
+        try:
+            return os.stat(self.ini_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """
+        重新读取配置文件，成功返回 True；配置不合法时记录错误并保留当前配置
+        """
+        with self._reload_lock:
+            self._mtime = self._stat()
+            try:
+                settings = parse_settings(self._read())
+            except (ConfigError, ConfigParserError) as e:
+                logger.error(f"Config reload failed, keeping current settings: {e}")
+                return False
+            old, self.settings = self.settings, settings
+            if ((dict(old.modems), old.sqlite, old.scheduler.max_workers) !=
+                    (dict(settings.modems), settings.sqlite, settings.scheduler.max_workers)):
+                logger.warning("SERIAL/DATABASE/SCHEDULER MAX_WORKERS settings changed, restart to apply them")
+            logger.info("Config reloaded")
+            for listener in list(self._listeners):
+                try:
+                    listener(settings)
+                except Exception as e:
+                    logger.error(f"Config reload listener error: {e}")
+            return True
+
+    def on_reload(self, listener):
+        """
+        注册热加载回调 listener(settings)
+        """
+        self._listeners.append(listener)
+
+    def watch(self, interval=None):
+        """
+        启动后台线程，每 interval 秒检查一次配置文件修改时间，变化后自动 reload()；
+        interval 默认为 [CONFIG] RELOAD_INTERVAL，为 0 时不启动
+        """
+        interval = self.settings.reload_interval if interval is None else interval
+        if not interval or self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                if self._stat() != self._mtime:
+                    self.reload()
+
+        self._watcher = threading.Thread(target=run, name="config-watch", daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching {self.ini_path} for changes every {interval}s")
+
+    def sqlite_path(self):
+        return f'data/{self.settings.sqlite}'
 
     def sqlite_url(self):
-        url = self.config.get('DATABASE', 'SQLITE')
-        return f'sqlite:///data/{url}'
+        return f'sqlite:///{self.sqlite_path()}'
 
     def serial(self):
-        port = self.config.get('SERIAL', 'PORT')
-        rate = self.config.getint('SERIAL', 'BAUD_RATE')
-        timeout = self.config.getint('SERIAL', 'TIMEOUT')
-        return {'port': port, 'rate': rate, 'timeout': timeout}
+        return self.settings.serial
+
+    def modems(self):
+        return self.settings.modems
+
+    def sms(self):
+        return self.settings.sms
+
+    def scheduler(self):
+        return self.settings.scheduler
 
     def server_chan(self):
-        return self.config.get('SERVERCHAN', 'SENDKEY')
+        return self._channel('serverchan', self.settings.server_chan)
 
     def bark(self):
-        url = self.config.get('BARK', 'URL')
-        key = self.config.get('BARK', 'KEY')
-        return {'url': url, 'key': key}
+        return self._channel('bark', self.settings.bark)
 
     def feishu_webhook(self):
-        webhook_url = self.config.get('FEISHU_WEBHOOK', 'WEBHOOK_URL')
-        secret = self.config.get('FEISHU_WEBHOOK', 'SECRET')
-        return {'webhook_url': webhook_url, 'secret': secret}
+        return self._channel('feishu_webhook', self.settings.feishu_webhook)
 
     def wecom_app(self):
-        url = self.config.get('WECOM_APP', 'URL')
-        corpid = self.config.get('WECOM_APP', 'CORPID')
-        corpsecret = self.config.get('WECOM_APP', 'CORPSECRET')
-        agentid = self.config.get('WECOM_APP', 'AGENTID')
-        touser = self.config.get('WECOM_APP', 'TOUSER')
-        return {'url': url, 'corpid': corpid, 'corpsecret': corpsecret, 'agentid': agentid, 'touser': touser}
+        return self._channel('wecom_app', self.settings.wecom_app)
 
     def mail(self):
-        smtp_server = self.config.get('MAIL', 'SMTP_SERVER')
-        smtp_port = self.config.getint('MAIL', 'SMTP_PORT')
-        account = self.config.get('MAIL', 'ACCOUNT')
-        password = self.config.get('MAIL', 'PASSWORD')
-        mail_to = self.config.get('MAIL', 'MAIL_TO')
-        tls = self.config.getboolean('MAIL', 'TLS')
-        return {'smtp_server': smtp_server, 'smtp_port': smtp_port, 'account': account, 'password': password, 'mail_to': mail_to, 'tls': tls}
+        return self._channel('mail', self.settings.mail)
+
+    @staticmethod
+    def _channel(name, settings):
+        if settings is None:
+            raise ConfigError(f"Notification channel {name} is not enabled in [NOTIFICATION] CHANNELS")
+        return settings
+
+    def notification_policy(self, channel):
+        """
+        渠道的超时、熔断与合并推送参数，优先读取渠道自己的配置节（如 [BARK] TIMEOUT），否则使用 [NOTIFICATION] 中的默认值
+        """
+        settings = self.settings
+        return settings.policies.get(channel, settings.default_policy)
 
     def notification(self):
-        channels = self.config.get('NOTIFICATION', 'CHANNELS').split(',')
-        return [channel.strip() for channel in channels] if channels else []
+        return self.settings.channels
 
-config = Config()
\ No newline at end of file
+config = Config()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import threading
+
+from . import metrics
+
+logger = logging.getLogger("PyAirLink")
+
+
+class Subscription:
+    """
+    一个订阅者的有界缓冲区，属于订阅时所在的事件循环。
+    缓冲区满时丢弃新事件并计数，由订阅方根据 dropped 决定如何补齐（例如从收件箱按 id 重放）
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self, timeout=None):
+        """
+        :return: (event, data, event_id)
+        :raises asyncio.TimeoutError: timeout 秒内没有新事件
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventStream:
+    """
+    进程内的事件广播，publish 可在任意线程调用（sms_listener、串口工作线程），
+    事件被投递到各订阅者所在的事件循环中，一个订阅者处理慢只会让它自己的缓冲区溢出，不影响发布方和其它订阅者。
+    """
+
+    def __init__(self, maxsize=256):
+        """
+        :param maxsize: 每个订阅者缓冲的最大事件数
+        """
+        self.maxsize = maxsize
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, maxsize=None):
+        """
+        在事件循环中调用，返回 Subscription；用完后需调用 unsubscribe
+        """
+        subscription = Subscription(asyncio.get_running_loop(), maxsize or self.maxsize)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, data, event_id=None):
+        """
+        :param event: 事件类型，如 'sms'、'send'
+        :param data: 可被 orjson 序列化的数据
+        :param event_id: 可用于断线续传的递增 id，没有时为 None
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push((event, data, event_id))
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+# 收到的短信（event_id 为收件箱 id）、发送结果与短信回执
+sms_events = EventStream()
+
+metrics.Gauge('pyairlink_event_stream_subscribers', 'Connected SMS event stream clients',
+              callback=lambda: {(): len(sms_events)})
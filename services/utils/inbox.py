@@ -0,0 +1,193 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from .config_parser import config
+from .outbox import _SCHEMA as _OUTBOX_SCHEMA
+
+logger = logging.getLogger("PyAirLink")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sms_inbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_key TEXT NOT NULL UNIQUE,
+    sender TEXT NOT NULL,
+    received REAL NOT NULL,
+    body TEXT NOT NULL,
+    pdu TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sms_inbox_sender ON sms_inbox (sender, received);
+CREATE INDEX IF NOT EXISTS ix_sms_inbox_received ON sms_inbox (received);
+"""
+
+# 全文索引：trigram 分词支持中文与验证码等任意子串（至少 3 个字符），由触发器与 sms_inbox 保持同步
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS sms_inbox_fts USING fts5(
+    body, content='sms_inbox', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS sms_inbox_ai AFTER INSERT ON sms_inbox BEGIN
+    INSERT INTO sms_inbox_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS sms_inbox_ad AFTER DELETE ON sms_inbox BEGIN
+    INSERT INTO sms_inbox_fts (sms_inbox_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+"""
+
+# 推送状态来自 NotificationOutbox 中同一 message_key 的记录
+_DELIVERIES = ("(SELECT group_concat(channel || ':' || status) FROM notification_outbox o "
+               "WHERE o.message_key = i.message_key)")
+
+
+class SMSInbox:
+    """
+    收件箱：保存收到的每条短信（合并后的长短信为一条），与推送发件箱共用 DATABASE/SQLITE 指定的数据库文件。
+    按发送方、接收时间建索引，正文建全文索引；查询按接收时间倒序，用 (接收时间, id) 作为游标分页。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.sqlite_path()
+        self.fts = True
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            # 查询推送状态时关联发件箱，发件箱尚未使用过时先建表
+            conn.executescript(_OUTBOX_SCHEMA)
+            try:
+                conn.executescript(_FTS_SCHEMA)
+            except sqlite3.OperationalError as e:
+                # SQLite 未编译 FTS5 或版本低于 3.34（不支持 trigram），正文查询退化为 LIKE
+                logger.warning(f"SQLite full-text search unavailable, falling back to LIKE: {e}")
+                self.fts = False
+            self._conn = conn
+        return self._conn
+
+    def add(self, message_key, sender, received, body, pdu=None):
+        """
+        保存一条短信，同一 message_key 重复保存会被忽略
+
+        :param received: 短信中心时间戳(SCTS)，带时区的 datetime
+        :return: 新记录的 id，已存在时返回 None
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO sms_inbox (message_key, sender, received, body, pdu, created) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (message_key, sender or '', received.timestamp(), body or '', pdu, time.time()))
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def get(self, message_id):
+        with self._lock:
+            row = self._connect().execute(
+                f'SELECT i.id, i.sender, i.received, i.body, i.pdu, {_DELIVERIES} FROM sms_inbox i WHERE i.id = ?',
+                (message_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def after(self, message_id, limit=500):
+        """
+        id 大于 message_id 的记录，按 id 升序，用于事件流断线续传
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT id, sender, received, body FROM sms_inbox WHERE id > ? ORDER BY id LIMIT ?',
+                (message_id, limit)).fetchall()
+        return [{'id': row[0], 'sender': row[1], 'received': datetime.fromtimestamp(row[2], timezone.utc),
+                 'body': row[3]} for row in rows]
+
+    def last_id(self):
+        with self._lock:
+            return self._connect().execute('SELECT COALESCE(MAX(id), 0) FROM sms_inbox').fetchone()[0]
+
+    def query(self, sender=None, since=None, until=None, text=None, cursor=None, limit=50):
+        """
+        按条件查询，结果按接收时间倒序
+
+        :param sender: 发送方号码，精确匹配
+        :param since: 接收时间下限(含)，datetime
+        :param until: 接收时间上限(不含)，datetime
+        :param text: 正文包含的文字
+        :param cursor: 上一页返回的 next_cursor
+        :return: (记录列表, next_cursor)，没有下一页时 next_cursor 为 None
+        """
+        conditions, params = [], []
+        if sender:
+            conditions.append('i.sender = ?')
+            params.append(sender)
+        if since is not None:
+            conditions.append('i.received >= ?')
+            params.append(since.timestamp())
+        if until is not None:
+            conditions.append('i.received < ?')
+            params.append(until.timestamp())
+        if cursor:
+            received, message_id = self._parse_cursor(cursor)
+            conditions.append('(i.received < ? OR (i.received = ? AND i.id < ?))')
+            params.extend((received, received, message_id))
+        with self._lock:
+            conn = self._connect()
+            if text:
+                if self.fts and len(text) >= 3:
+                    conditions.append('i.id IN (SELECT rowid FROM sms_inbox_fts WHERE sms_inbox_fts MATCH ?)')
+                    params.append('"' + text.replace('"', '""') + '"')
+                else:
+                    conditions.append("i.body LIKE ? ESCAPE '\\'")
+                    params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            rows = conn.execute(
+                f'SELECT i.id, i.sender, i.received, i.body, i.pdu, {_DELIVERIES} FROM sms_inbox i {where} '
+                f'ORDER BY i.received DESC, i.id DESC LIMIT ?', (*params, limit + 1)).fetchall()
+        items = [self._row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f'{last[2]!r}:{last[0]}'
+        return items, next_cursor
+
+    @staticmethod
+    def _parse_cursor(cursor):
+        try:
+            received, message_id = cursor.rsplit(':', 1)
+            return float(received), int(message_id)
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}") from None
+
+    @staticmethod
+    def _row(row):
+        message_id, sender, received, body, pdu, deliveries = row
+        deliveries = dict(item.rsplit(':', 1) for item in deliveries.split(',')) if deliveries else {}
+        statuses = set(deliveries.values())
+        if not statuses:
+            delivery = 'none'
+        elif 'pending' in statuses:
+            delivery = 'pending'
+        elif 'failed' in statuses:
+            delivery = 'failed'
+        else:
+            delivery = 'delivered'
+        return {
+            'id': message_id,
+            'sender': sender,
+            'received': datetime.fromtimestamp(received, timezone.utc),
+            'body': body,
+            'pdu': pdu,
+            'delivery': delivery,
+            'deliveries': deliveries,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+inbox = SMSInbox()
@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("PyAirLink")
+
+# smtplib 在第一次发送邮件时才导入，不使用邮件推送时不拖慢启动
+
+
+class MailSendError(Exception):
+    """
+    一批邮件发送中途失败，sent 为失败前已成功发送的封数
+    """
+
+    def __init__(self, sent, error):
+        super().__init__(str(error))
+        self.sent = sent
+        self.error = error
+
+
+class MailTransport:
+    """
+    复用已登录的 SMTP 连接。
+    连接空闲超过 noop_interval 秒后，下次发送前先用 NOOP 检查是否仍可用；空闲超过 idle_timeout 秒则主动断开。
+    连接在发送中途断开时自动重连，并从失败的那一封继续发送，已发送的邮件不会重发。
+    """
+
+    def __init__(self, idle_timeout=120, noop_interval=15, timeout=5):
+        self.idle_timeout = idle_timeout
+        self.noop_interval = noop_interval
+        self.timeout = timeout
+        self._smtp = None
+        self._settings = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, settings, messages, timeout=None):
+        """
+        在同一个连接上依次发送多封邮件
+
+        :param settings: config.mail() 返回的 MailSettings
+        :param messages: [(收件人, 邮件内容字符串), ...]
+        :param timeout: 覆盖默认的连接超时秒数
+        :return: 发送的封数
+        :raise MailSendError: 中途失败，异常中带有已发送的封数，调用方只需重试其余邮件
+        """
+        with self._lock:
+            sent = 0
+            reconnected = False
+            while sent < len(messages):
+                try:
+                    smtp = self._connect(settings, timeout or self.timeout)
+                    to_addrs, msg = messages[sent]
+                    smtp.sendmail(settings.account, to_addrs, msg)
+                    sent += 1
+                    self._last_used = time.monotonic()
+                except Exception as e:
+                    if not self._connection_lost(e) or reconnected:
+                        raise MailSendError(sent, e) from e
+                    self._close()
+                    logger.info(f"SMTP connection lost, reconnecting: {e}")
+                    reconnected = True
+            return sent
+
+    @staticmethod
+    def _connection_lost(error):
+        """
+        是否为连接断开，可以重连后继续发送。
+        服务器明确拒绝（认证失败、收件人被拒、5xx 等）重发也不会成功；SMTPException 是 OSError 的子类，
+        只有不属于 SMTPException 的 OSError 才是套接字错误
+        """
+        import smtplib
+
+        if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+            return True
+        if isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused,
+                              smtplib.SMTPSenderRefused)):
+            return False
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    def close_idle(self):
+        """
+        断开空闲超过 idle_timeout 的连接，由推送线程在空闲时调用
+        """
+        with self._lock:
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                logger.debug("Closing idle SMTP connection")
+                self._close()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _connect(self, settings, timeout):
+        import smtplib
+
+        if self._smtp is not None:
+            idle = time.monotonic() - self._last_used
+            if settings != self._settings or idle > self.idle_timeout:
+                self._close()
+            elif idle > self.noop_interval:
+                try:
+                    code, _ = self._smtp.noop()
+                except (smtplib.SMTPException, OSError):
+                    code = None
+                if code != 250:
+                    logger.info("SMTP connection is no longer usable, reconnecting")
+                    self._close()
+        if self._smtp is None:
+            smtp = smtplib.SMTP(settings.smtp_server, settings.smtp_port, timeout=timeout)
+            try:
+                if settings.tls:
+                    smtp.starttls()
+                smtp.login(settings.account, settings.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            self._settings = settings
+            self._last_used = time.monotonic()
+            logger.info(f"SMTP connection established: {settings.smtp_server}")
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is None:
+            return
+        import smtplib
+
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        finally:
+            self._smtp = None
@@ -0,0 +1,286 @@
+import bisect
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger("PyAirLink")
+
+# 不依赖 prometheus_client 的轻量指标，按 Prometheus 文本格式（0.0.4）输出。
+# 计数只写入当前线程自己的分片（threading.local），热路径上没有锁；输出时把各线程的分片相加，
+# 读到的值可能略晚于写入，但不会丢失。只有第一次使用某组标签、某个线程第一次写入时才加锁。
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """
+    每个线程一份 values 列表，只由该线程写入
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = [0] * self._size
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def total(self):
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(column) for column in zip(*shards)] if shards else [0] * self._size
+
+
+class _CounterChild(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self.shard()[0] += amount
+
+    def value(self):
+        return self.total()[0]
+
+
+class _HistogramChild(_Sharded):
+    def __init__(self, buckets):
+        # 各桶计数、总和、次数
+        super().__init__(len(buckets) + 2)
+        self._buckets = buckets
+
+    def observe(self, value):
+        values = self.shard()
+        index = bisect.bisect_left(self._buckets, value)
+        if index < len(self._buckets):
+            values[index] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """
+        取得一组标签对应的子指标，调用方可以缓存返回值以省去查找
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(value) for value in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        """
+        去重后的 (标签值, 子指标)，labels() 会以原始值和字符串值两个键缓存同一个子指标
+        """
+        with self._lock:
+            items = list(self._children.items())
+        seen = set()
+        for values, child in items:
+            if id(child) not in seen:
+                seen.add(id(child))
+                yield tuple(str(value) for value in values), child
+
+    def collect(self):
+        raise NotImplementedError
+
+    def __getattr__(self, item):
+        # 没有标签的指标可以直接调用 inc() / observe()
+        if item in ('inc', 'observe', 'time') and not self.labelnames:
+            return getattr(self.labels(), item)
+        raise AttributeError(item)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def collect(self):
+        for values, child in self._items():
+            yield f'{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value())}'
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def collect(self):
+        for values, child in self._items():
+            totals = child.total()
+            cumulative = 0
+            for bound, count in zip(self.buckets, totals):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, values, 'le="+Inf"')
+            yield f'{self.name}_bucket{labels} {totals[-1]}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {_format_value(float(totals[-2]))}'
+            yield f'{self.name}_count{labels} {totals[-1]}'
+
+
+class Gauge(_Metric):
+    """
+    在输出时调用回调取值，回调返回 {标签值元组: 数值}，没有标签时返回 {(): 数值}
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None, registry=None):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def collect(self):
+        if self.callback is None:
+            return
+        for values, value in self.callback().items():
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """
+        Prometheus 文本格式，单个指标的回调出错时跳过该指标
+        """
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                samples = list(metric.collect())
+            except Exception as e:
+                logger.error(f"Metric {metric.name} collect error: {e}")
+                continue
+            name = f'{metric.name}_total' if metric.type == 'counter' else metric.name
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 串口与模块
+at_command_duration = Histogram('pyairlink_at_command_duration_seconds',
+                                'AT command round trip time, from write to final result code',
+                                ['command'])
+at_command_results = Counter('pyairlink_at_commands', 'AT commands by result (ok, error, timeout, failed)',
+                             ['command', 'result'])
+serial_reconnects = Counter('pyairlink_serial_reconnects', 'Serial port errors that triggered a reconnect',
+                            ['port'])
+command_queue_wait = Histogram('pyairlink_command_queue_wait_seconds',
+                               'Time a job waited in the modem command queue before running',
+                               ['modem', 'priority'])
+command_duration = Histogram('pyairlink_command_job_duration_seconds',
+                             'Time a job held the serial port', ['modem', 'priority'])
+
+# 收短信
+sms_received = Counter('pyairlink_sms_received', 'Received SMS saved to the inbox', ['modem'])
+pdu_parse_errors = Counter('pyairlink_pdu_parse_errors', 'PDUs that could not be decoded', ['modem'])
+listener_errors = Counter('pyairlink_sms_listener_errors', 'Errors in the sms_listener loop', ['modem'])
+
+# 发短信
+sms_sent = Counter('pyairlink_sms_sent', 'Outbound SMS by modem and result (success, failure)',
+                   ['modem', 'result'])
+sms_send_duration = Histogram('pyairlink_sms_send_duration_seconds',
+                              'Time to send one SMS on a modem, including queueing', ['modem'])
+
+# 推送
+notification_duration = Histogram('pyairlink_notification_duration_seconds', 'Push latency per channel',
+                                  ['channel'])
+notification_results = Counter('pyairlink_notifications', 'Push calls by channel and result (success, failure)',
+                               ['channel', 'result'])
+
+
+# 作为标签值的 AT 指令；/command/base 接口可以发送任意指令，其余指令统一记为 'other'，避免标签取值无限增长
+KNOWN_COMMANDS = frozenset({
+    'AT', 'ATI', 'AT+CPIN', 'AT+CMGF', 'AT+CSCS', 'AT+CNMI', 'AT+CMGL', 'AT+CMGR', 'AT+CMGD', 'AT+CGATT',
+    'AT+CMGS', 'AT+CMMS', 'AT+CPMS', 'AT+RESET', 'AT+CSQ', 'AT+CREG', 'AT+COPS',
+})
+
+
+def command_name(command):
+    """
+    把 AT 指令归并为标签值，如 b'AT+CMGS=23\\r\\n' -> 'AT+CMGS'，PDU 数据 -> 'PDU'，不在 KNOWN_COMMANDS 中的指令 -> 'other'
+    """
+    if isinstance(command, (bytes, bytearray)):
+        command = command.decode(errors='ignore')
+    command = command.strip().strip('"').upper()
+    if not command.startswith('AT'):
+        return 'PDU'
+    for separator in ('=', '?'):
+        command = command.split(separator, 1)[0]
+    return command if command in KNOWN_COMMANDS else 'other'
@@ -0,0 +1,287 @@
+import itertools
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+from . import metrics
+from .circuit_breaker import CircuitBreaker
+from .command_scheduler import Priority, CommandQueueFull, CommandDeadlineExceeded
+from .config_parser import config
+from .modem_session import ModemSession, ModemSessionStopped, modem
+from .serial_manager import SerialManager
+
+logger = logging.getLogger("PyAirLink")
+
+
+class NoModemAvailable(RuntimeError):
+    """
+    没有可用（已就绪且未熔断）的模块
+    """
+
+
+class UnknownModem(KeyError):
+    """
+    配置中没有该名称的模块
+    """
+
+
+# 由收件人或短信本身导致的 +CMS ERROR（空号、号码无效、被拒收、PDU 参数错误等），与模块是否正常无关，不计入熔断
+RECIPIENT_CMS_ERRORS = frozenset({1, 8, 10, 21, 22, 27, 28, 29, 30, 50, 69, 95, 96, 97, 98, 99, 111, 304, 305})
+
+# 任务尚未开始执行就失败的异常，短信没有发出，可以改用其它模块
+_NOT_STARTED_ERRORS = (CommandQueueFull, CommandDeadlineExceeded, ModemSessionStopped)
+
+
+class SendOutcome:
+    """
+    发送任务的结果，真值为是否发送成功，失败时说明能否改用其它模块重发、是否计入模块熔断
+
+    :param retryable: 没有任何内容提交到网络（串口打不开、进入 PDU 模式失败、第一段没有收到 '>' 提示符），
+                      换模块重发不会造成重复短信
+    :param cms_error: 模块返回的 +CMS ERROR 错误码
+    """
+    __slots__ = ('ok', 'sent', 'retryable', 'cms_error', 'error')
+
+    def __init__(self, ok, sent=0, retryable=False, cms_error=None, error=None):
+        self.ok = ok
+        self.sent = sent
+        self.retryable = retryable
+        self.cms_error = cms_error
+        self.error = error
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def modem_fault(self):
+        """
+        失败是否由模块或网络导致（计入熔断），收件人或短信本身的错误不计入
+        """
+        return not self.ok and self.cms_error not in RECIPIENT_CMS_ERRORS
+
+    def __repr__(self):
+        return (f'SendOutcome(ok={self.ok}, sent={self.sent}, retryable={self.retryable}, '
+                f'cms_error={self.cms_error}, error={self.error!r})')
+
+
+class ModemPool:
+    """
+    模块池：每个模块有自己的 ModemSession（串口工作线程与任务队列），互不阻塞，发送吞吐量随模块数量线性增加。
+    发送短信时按 routing 选择模块：
+    - least_queue：排队任务最少的模块
+    - round_robin：依次轮流
+    - sticky：按收件号码固定分配到同一模块（该模块不可用时顺延到下一个）
+    模块发送失败时改用其它模块重试；每个模块一个熔断器，连续失败后冷却期内不再分配短信。
+    """
+
+    def __init__(self, sessions, routing='least_queue', failure_threshold=3, cooldown=60):
+        """
+        :param sessions: {模块名: ModemSession}，第一个为默认模块
+        """
+        self.sessions = dict(sessions)
+        self.routing = routing
+        self.breakers = {name: CircuitBreaker(name, failure_threshold=failure_threshold, cooldown=cooldown,
+                                              label='Modem')
+                         for name in self.sessions}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        """
+        按 [SERIAL] 与各 [SERIAL:<name>] 配置节创建模块池，[SERIAL] 使用全局的 modem 会话
+        """
+        sessions = {}
+        for name, settings in config.modems().items():
+            if name == 'default':
+                sessions[name] = modem
+            else:
+                sessions[name] = ModemSession(SerialManager(settings=settings), name=name)
+        if len(sessions) > 1:
+            # 有其它模块可以接替时，断开的模块尽快失败并由熔断器摘除，不再长时间等待重连
+            for session in sessions.values():
+                session.serial_manager.retries = 3
+        sms_settings = config.sms()
+        pool = cls(sessions, routing=sms_settings.routing, failure_threshold=sms_settings.failure_threshold,
+                   cooldown=sms_settings.cooldown)
+        config.on_reload(pool._apply_settings)
+        return pool
+
+    def __iter__(self):
+        return iter(self.sessions.values())
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, name=None):
+        """
+        :param name: 模块名，为空时返回默认模块
+        :raise UnknownModem: 模块不存在
+        """
+        if name is None:
+            return next(iter(self.sessions.values()))
+        try:
+            return self.sessions[name]
+        except KeyError:
+            raise UnknownModem(name) from None
+
+    def start(self):
+        for session in self.sessions.values():
+            session.start()
+        return self
+
+    def stop(self, timeout=10):
+        for session in self.sessions.values():
+            session.stop(timeout)
+
+    def available(self):
+        """
+        已就绪且未熔断的模块名
+        """
+        return [name for name, session in self.sessions.items()
+                if session.ready and session.running and self.breakers[name].retry_after() == 0]
+
+    def route(self, to=None, exclude=()):
+        """
+        按 routing 为一条发往 to 的短信选择模块
+
+        :param exclude: 已尝试失败、不再选择的模块名
+        :raise NoModemAvailable: 没有可用的模块
+        """
+        names = [name for name in self.available() if name not in exclude]
+        if not names:
+            raise NoModemAvailable("No modem available for sending SMS")
+        if self.routing == 'sticky' and to:
+            # 在全部模块中取固定位置，模块暂时不可用时顺延，恢复后同一号码回到原模块
+            ring = list(self.sessions)
+            start = zlib.crc32(to.encode()) % len(ring)
+            for name in ring[start:] + ring[:start]:
+                if name in names:
+                    return name
+        if self.routing == 'round_robin':
+            with self._lock:
+                return names[next(self._counter) % len(names)]
+        return min(names, key=lambda name: self.sessions[name].load())
+
+    def send(self, job, *args, to=None, priority=Priority.BULK, **kwargs):
+        """
+        选择模块提交发送任务 job(serial_manager, *args, to=to, **kwargs)。
+        只有确定短信没有发出时（任务未开始执行就失败，或 job 返回 retryable 的 SendOutcome）才改用下一个模块，
+        已部分提交或结果不确定（如提交 PDU 后超时）的短信直接以失败结束，避免收件人收到重复短信。
+        只有模块或网络导致的失败计入该模块的熔断，收件人号码无效等错误不计入。
+
+        :return: concurrent.futures.Future，取消时同时取消正在排队的任务
+        """
+        result = Future()
+        tried = []
+        current = [None]
+
+        def attempt(last_error=None, last_result=False):
+            skipped = []
+            while True:
+                try:
+                    name = self.route(to, exclude=tried + skipped)
+                except NoModemAvailable as e:
+                    if not tried:
+                        result.set_exception(e)
+                    elif last_error is not None:
+                        result.set_exception(last_error)
+                    else:
+                        result.set_result(last_result)
+                    return
+                # 半开状态只放行一次试探发送，其余短信分配给其它模块
+                if self.breakers[name].allow():
+                    break
+                skipped.append(name)
+            tried.append(name)
+            start = time.perf_counter()
+            try:
+                future = self.sessions[name].submit(job, *args, to=to, priority=priority, **kwargs)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            current[0] = future
+            future.add_done_callback(lambda f: done(name, start, f))
+
+        def done(name, start, future):
+            if result.done():
+                return
+            if future.cancelled():
+                result.cancel()
+                return
+            latency = time.perf_counter() - start
+            breaker = self.breakers[name]
+            error = future.exception()
+            value = None if error is not None else future.result()
+            metrics.sms_send_duration.labels(name).observe(latency)
+            if error is None and value:
+                metrics.sms_sent.labels(name, 'success').inc()
+                breaker.record_success(latency)
+                result.set_result(value)
+                return
+            metrics.sms_sent.labels(name, 'failure').inc()
+            if error is not None:
+                retryable, modem_fault = isinstance(error, _NOT_STARTED_ERRORS), True
+            else:
+                retryable = getattr(value, 'retryable', False)
+                modem_fault = getattr(value, 'modem_fault', True)
+            reason = error or getattr(value, 'error', None) or 'send failed'
+            if modem_fault:
+                breaker.record_failure(latency, reason)
+            else:
+                # 模块正常工作，只是这条短信被拒绝
+                breaker.record_success(latency)
+            if not retryable:
+                logger.warning(f"Sending to {to} via modem {name} failed: {reason}")
+                if error is not None:
+                    result.set_exception(error)
+                else:
+                    result.set_result(value)
+                return
+            logger.warning(f"Sending to {to} via modem {name} failed before submission: {reason}, trying next modem")
+            attempt(error, value)
+
+        def cancel(f):
+            if f.cancelled() and current[0] is not None:
+                current[0].cancel()
+
+        result.add_done_callback(cancel)
+        attempt()
+        return result
+
+    def stats(self):
+        """
+        各模块的就绪状态、熔断状态、排队数与发送延迟统计
+        """
+        result = []
+        for name, session in self.sessions.items():
+            stats = self.breakers[name].stats()
+            stats.pop('channel')
+            result.append({'name': name, 'port': session.serial_manager.port, 'ready': session.ready,
+                           'stage': session.stage, 'init_error': session.init_error, 'load': session.load(),
+                           **stats})
+        return result
+
+    def _apply_settings(self, settings):
+        """
+        配置热加载后更新分配方式与熔断参数，新增或删除模块需要重启
+        """
+        self.routing = settings.sms.routing
+        for breaker in self.breakers.values():
+            breaker.failure_threshold = settings.sms.failure_threshold
+            breaker.cooldown = settings.sms.cooldown
+
+
+modems = ModemPool.from_config()
+
+metrics.Gauge('pyairlink_modem_ready', 'Whether the modem is initialized and receives outbound SMS', ['modem'],
+              callback=lambda: {(name,): int(session.ready) for name, session in modems.sessions.items()})
+metrics.Gauge('pyairlink_modem_circuit_open', 'Whether the modem is taken out of rotation after failures',
+              ['modem'], callback=lambda: {(name,): int(breaker.retry_after() > 0)
+                                           for name, breaker in modems.breakers.items()})
+metrics.Gauge('pyairlink_command_queue_depth', 'Jobs waiting in the modem command queue', ['modem', 'priority'],
+              callback=lambda: {(name, stats['priority']): stats['queued']
+                                for name, session in modems.sessions.items()
+                                for stats in session.scheduler.stats()})
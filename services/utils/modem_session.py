@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from . import metrics
+from .command_scheduler import CommandScheduler, Priority
+from .serial_manager import SerialManager
+
+logger = logging.getLogger("PyAirLink")
+
+
+class ModemSessionStopped(RuntimeError):
+    """
+    会话已停止，排队中的任务未执行
+    """
+
+
+class ModemSession:
+    """
+    进程级的模块会话。
+    串口在整个应用生命周期内只由一个工作线程打开并持有，其它线程按优先级（Priority）提交任务到 CommandScheduler，
+    任务在工作线程中以 job(serial_manager, *args, **kwargs) 的形式依次执行，
+    因此同一任务内的多条AT指令（如 CMGS + PDU）不会与其它调用方交错。
+    队列空闲时工作线程会读取串口上的 URC（如 +CMTI），并分发给已注册的处理函数。
+    """
+
+    def __init__(self, serial_manager=None, scheduler=None, urc_poll_interval=0.05, name='default'):
+        """
+        :param name: 模块名，对应配置节 [SERIAL]（default）或 [SERIAL:<name>]
+        """
+        self.name = name
+        self.serial_manager = serial_manager or SerialManager()
+        self.serial_manager.urc_callback = self._dispatch_urc
+        self.scheduler = scheduler or CommandScheduler()
+        self.urc_poll_interval = urc_poll_interval
+        self._urc_handlers = []
+        # 模块初始化（SIM 卡就绪、PDU 模式等）成功后为 True，模块池只向就绪的模块分配短信
+        self.ready = False
+        # 初始化进度与最近一次初始化失败的原因，见 services.initialize.INIT_STAGES
+        self.stage = 'pending'
+        self.init_error = None
+        self.busy = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # 调用 stop() 之后为 True，submit 不再自动启动工作线程，需显式调用 start()
+        self._stopped = False
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        启动串口工作线程，重复调用无副作用。
+        """
+        with self._start_lock:
+            self._stopped = False
+            self._start()
+        return self
+
+    def _start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"modem-{self.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"Modem session {self.name} started")
+
+    def stop(self, timeout=10):
+        """
+        停止工作线程并关闭串口，队列中尚未执行的任务会以异常结束。
+        停止后提交任务抛出 ModemSessionStopped；工作线程在 timeout 秒内没有结束（仍在执行任务）时，
+        保留该线程，直到它真正退出前不会启动第二个工作线程。
+        """
+        with self._start_lock:
+            self._stopped = True
+            thread = self._thread
+            self._stop_event.set()
+            self.scheduler.wake()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning(f"Modem session {self.name} is still running a job after {timeout} seconds")
+        for entry in self.scheduler.drain():
+            if entry.future.set_running_or_notify_cancel():
+                entry.future.set_exception(ModemSessionStopped("Modem session stopped"))
+        self.ready = False
+        logger.info(f"Modem session {self.name} stopped")
+
+    def submit(self, job, *args, priority=Priority.INTERACTIVE, deadline=None, **kwargs):
+        """
+        提交任务到串口工作线程。
+
+        :param job: 可调用对象，第一个参数为已打开的 SerialManager
+        :param priority: 任务优先级
+        :param deadline: 最长排队秒数，不传则使用该优先级的默认值
+        :return: concurrent.futures.Future，结果为 job 的返回值
+        :raise CommandQueueFull: 该优先级的队列已满
+        :raise ModemSessionStopped: 会话已停止
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # 任务内部再次调用会话时直接执行，避免工作线程等待自己
+            try:
+                future.set_result(job(self.serial_manager, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._start_lock:
+            # 与 stop() 互斥，停止后不会再有任务进入队列
+            if self._stopped:
+                raise ModemSessionStopped(f"Modem session {self.name} is stopped")
+            self._start()
+            self.scheduler.put(future, job, args, kwargs, priority=priority, deadline=deadline)
+        return future
+
+    def call(self, job, *args, **kwargs):
+        """
+        提交任务并阻塞等待结果。
+        """
+        return self.submit(job, *args, **kwargs).result()
+
+    async def call_async(self, job, *args, **kwargs):
+        """
+        提交任务并在事件循环中等待结果，等待期间不阻塞事件循环，也不占用额外线程。
+        """
+        return await asyncio.wrap_future(self.submit(job, *args, **kwargs))
+
+    def send_at_command(self, command, keywords=None, timeout=3, priority=Priority.INTERACTIVE):
+        """
+        通过会话发送单条AT指令，参数同 SerialManager.send_at_command。
+        """
+        return self.call(lambda serial_manager: serial_manager.send_at_command(command, keywords=keywords, timeout=timeout),
+                         priority=priority)
+
+    async def send_at_command_async(self, command, keywords=None, timeout=3, priority=Priority.INTERACTIVE):
+        """
+        send_at_command 的异步版本。
+        """
+        return await self.call_async(lambda serial_manager: serial_manager.send_at_command(command, keywords=keywords, timeout=timeout),
+                                     priority=priority)
+
+    def execute(self, command, timeout=3, priority=Priority.INTERACTIVE):
+        """
+        通过会话发送单条AT指令，返回结构化响应 ATResponse，参数同 SerialManager.execute。
+        """
+        return self.call(lambda serial_manager: serial_manager.execute(command, timeout=timeout), priority=priority)
+
+    def load(self):
+        """
+        排队中与正在执行的任务数
+        """
+        return self.scheduler.pending() + self.busy
+
+    def add_urc_handler(self, prefix, handler):
+        """
+        注册 URC 处理函数，handler(line, pdu) 在串口工作线程中被调用，
+        不能阻塞，也不应在其中同步等待会话任务，需要读写串口时请交给其它线程提交任务。
+        """
+        self._urc_handlers.append((prefix, handler))
+
+    def remove_urc_handler(self, prefix, handler):
+        try:
+            self._urc_handlers.remove((prefix, handler))
+        except ValueError:
+            pass
+
+    def _dispatch_urc(self, line, pdu):
+        logger.debug(f"Received URC: {line}")
+        handled = False
+        for prefix, handler in list(self._urc_handlers):
+            if line.startswith(prefix):
+                handled = True
+                try:
+                    handler(line, pdu)
+                except Exception as e:
+                    logger.error(f"URC handler error, URC: {line}, error: {e}")
+        if not handled:
+            logger.debug(f"No handler for URC: {line}")
+
+    def _run(self):
+        try:
+            self.serial_manager.open()
+        except Exception as e:
+            # 打开失败时不退出，send_at_command 会在执行任务时自动重连
+            logger.error(f"Modem session {self.name} could not open serial port: {e}")
+        try:
+            while not self._stop_event.is_set():
+                entry = self.scheduler.get(timeout=self.urc_poll_interval)
+                if entry is None:
+                    self.serial_manager.read_unsolicited()
+                    continue
+                if not entry.future.set_running_or_notify_cancel():
+                    continue
+                priority = entry.priority.name
+                started = time.monotonic()
+                metrics.command_queue_wait.labels(self.name, priority).observe(started - entry.enqueued)
+                self.busy = True
+                try:
+                    result = entry.job(self.serial_manager, *entry.args, **entry.kwargs)
+                except Exception as e:
+                    logger.error(f"Modem session {self.name} job error: {e}")
+                    result, error = None, e
+                else:
+                    error = None
+                finally:
+                    self.busy = False
+                    self.scheduler.done(entry)
+                    metrics.command_duration.labels(self.name, priority).observe(time.monotonic() - started)
+                # 先结束计时再通知调用方，回调（如模块池的故障转移）不计入本任务的占用时间
+                if error is None:
+                    entry.future.set_result(result)
+                else:
+                    entry.future.set_exception(error)
+        finally:
+            self.serial_manager.close()
+
+
+modem = ModemSession()
@@ -0,0 +1,168 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from .config_parser import config
+
+logger = logging.getLogger("PyAirLink")
+
+PENDING = 'pending'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_key TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    delivered REAL,
+    last_error TEXT,
+    UNIQUE (message_key, channel)
+);
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_due ON notification_outbox (channel, status, next_attempt);
+"""
+
+
+class NotificationOutbox:
+    """
+    持久化的推送发件箱，与 APScheduler 的任务存储共用 DATABASE/SQLITE 指定的数据库文件。
+    短信在从 SIM 卡删除前先写入这里，每个渠道一行；同一条短信（message_key 相同）重复写入会被忽略，
+    推送线程按渠道取出到期的记录，成功后标记为已送达，失败则按指数退避安排下一次重试。
+    """
+
+    def __init__(self, path=None, backoff=5, max_backoff=3600, max_attempts=50):
+        """
+        :param path: 数据库文件路径，默认为 config.sqlite_path()
+        :param backoff: 第一次重试前的等待秒数，之后每次翻倍
+        :param max_backoff: 两次重试之间的最长等待秒数
+        :param max_attempts: 超过该次数仍失败则标记为 failed，不再重试
+        """
+        self.path = path or config.sqlite_path()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def add(self, message_key, title, content, channels):
+        """
+        写入一条待推送消息，返回新写入的渠道数；已存在的 (message_key, 渠道) 会被忽略
+        """
+        now = time.time()
+        rows = [(message_key, channel, title, content, now, now) for channel in channels]
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany(
+                    'INSERT OR IGNORE INTO notification_outbox '
+                    '(message_key, channel, title, content, next_attempt, created) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return conn.total_changes - before
+
+    def due(self, channel, limit=20):
+        """
+        取出该渠道已到重试时间的待推送记录：[(id, title, content, attempts), ...]
+        """
+        with self._lock:
+            return self._connect().execute(
+                'SELECT id, title, content, attempts FROM notification_outbox '
+                'WHERE channel = ? AND status = ? AND next_attempt <= ? ORDER BY id LIMIT ?',
+                (channel, PENDING, time.time(), limit)).fetchall()
+
+    def next_attempt(self, channel):
+        """
+        该渠道最早的下一次重试时间(time.time())，没有待推送记录时返回 None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT MIN(next_attempt) FROM notification_outbox WHERE channel = ? AND status = ?',
+                (channel, PENDING)).fetchone()
+        return row[0]
+
+    def mark_delivered(self, ids):
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'UPDATE notification_outbox SET status = ?, delivered = ?, last_error = NULL '
+                'WHERE id = ? AND status = ?', [(DELIVERED, time.time(), i, PENDING) for i in ids])
+
+    def mark_retry(self, records, error):
+        """
+        推送失败：attempts 加一，按指数退避（带随机抖动）安排下一次重试，超过 max_attempts 则标记为 failed
+
+        :param records: due() 返回的记录
+        """
+        now = time.time()
+        updates = []
+        for record_id, _, _, attempts in records:
+            attempts += 1
+            if self.max_attempts and attempts >= self.max_attempts:
+                logger.error(f"Notification {record_id} failed after {attempts} attempts, giving up: {error}")
+                updates.append((FAILED, attempts, now, str(error), record_id, PENDING))
+                continue
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            delay *= random.uniform(0.8, 1.2)
+            updates.append((PENDING, attempts, now + delay, str(error), record_id, PENDING))
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'UPDATE notification_outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? '
+                'WHERE id = ? AND status = ?', updates)
+
+    def defer(self, ids, until):
+        """
+        推迟记录到 until(time.time()) 之后再推送，不计入重试次数，用于渠道熔断期间
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            conn.executemany('UPDATE notification_outbox SET next_attempt = ? WHERE id = ? AND status = ?',
+                             [(until, i, PENDING) for i in ids])
+
+    def purge(self, older_than=7 * 86400):
+        """
+        删除超过 older_than 秒的已送达记录，返回删除的行数
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN')
+            cursor = conn.execute('DELETE FROM notification_outbox WHERE status = ? AND delivered < ?',
+                                  (DELIVERED, time.time() - older_than))
+            return cursor.rowcount
+
+    def stats(self):
+        """
+        各渠道各状态的记录数：{渠道: {状态: 数量}}
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT channel, status, COUNT(*) FROM notification_outbox GROUP BY channel, status').fetchall()
+        result = {}
+        for channel, status, count in rows:
+            result.setdefault(channel, {})[status] = count
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+outbox = NotificationOutbox()
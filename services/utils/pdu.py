@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta, timezone
+
+from smspdudecoder.codecs import GSM
+from smspdudecoder.elements import TypeOfAddress
+
+# SMS-DELIVER / SMS-STATUS-REPORT 的 PDU 解码（GSM 03.40）。
+# 直接在 bytes.fromhex 得到的缓冲区上按偏移读取，GSM 7-bit 用整数移位加查找表解包，UCS2 交给 utf-16-be 编解码器，
+# 返回与 smspdudecoder.fields.SMSDeliver.decode 相同结构的字典，供 sms_listener 使用。
+
+MTI = {0b00: 'deliver', 0b01: 'submit-report', 0b10: 'status-report'}
+
+_GSM7_ALPHABET = tuple(GSM.ALPHABET)
+_GSM7_EXT = GSM.ALPHABET_EXT
+_ESC = '\x1b'
+# 半字节交换后的号码字符，0x21 -> '12'
+_SWAPPED_DIGITS = tuple(f'{b & 0x0F:X}{b >> 4:X}' for b in range(256))
+# 半字节交换后的 BCD 数值，0x21 -> 12
+_SWAPPED_BCD = tuple((b & 0x0F) * 10 + (b >> 4) for b in range(256))
+_TOA = tuple({'ton': TypeOfAddress.TON.get((b >> 4) & 0b111), 'npi': TypeOfAddress.NPI.get(b & 0x0F)}
+             for b in range(256))
+
+
+def _dcs_encoding(dcs):
+    """
+    按 3GPP TS 23.038 的编码组取 TP-DCS 的字符集
+    """
+    group = dcs >> 4
+    if group <= 0x7:
+        # 通用编码组：bit 5 为压缩（无法解码，按二进制处理），bit 3..2 为字符集，保留值按 GSM 7-bit 处理
+        if dcs & 0x20:
+            return 'binary'
+        return ('gsm', 'binary', 'ucs2', 'gsm')[(dcs & 0x0C) >> 2]
+    if group in (0xC, 0xD):
+        # 消息等待指示组，丢弃 / 存储短信，GSM 7-bit
+        return 'gsm'
+    if group == 0xE:
+        # 消息等待指示组，存储短信，UCS2
+        return 'ucs2'
+    if group == 0xF:
+        # 数据编码 / 消息类别组：bit 2 为 1 表示 8-bit 数据
+        return 'binary' if dcs & 0x04 else 'gsm'
+    # 保留的编码组
+    return 'binary'
+
+
+_ENCODINGS = tuple(_dcs_encoding(dcs) for dcs in range(256))
+_TIMEZONES = {}
+
+
+def _tz(octet):
+    tz = _TIMEZONES.get(octet)
+    if tz is None:
+        swapped = ((octet & 0x0F) << 4) | (octet >> 4)
+        quarters = ((swapped & 0x70) >> 4) * 10 + (swapped & 0x0F)
+        tz = _TIMEZONES[octet] = timezone(timedelta(minutes=-15 * quarters if swapped & 0x80 else 15 * quarters))
+    return tz
+
+
+def _unpack_gsm7(data, count, skip=0):
+    """
+    解包 count 个 septet 并按默认字母表/扩展表转换为字符串，跳过前 skip 个（UDH 及填充位）
+    """
+    value = int.from_bytes(data, 'little')
+    text = ''.join([_GSM7_ALPHABET[(value >> shift) & 0x7F] for shift in range(skip * 7, count * 7, 7)])
+    if _ESC in text:
+        chars = []
+        escaped = False
+        for char in text:
+            if escaped:
+                escaped = False
+                chars.append(_GSM7_EXT.get(_GSM7_ALPHABET.index(char), ' '))
+            elif char == _ESC:
+                escaped = True
+            else:
+                chars.append(char)
+        text = ''.join(chars)
+    return text
+
+
+def _number(data):
+    number = ''.join([_SWAPPED_DIGITS[b] for b in data])
+    return number[:-1] if number.endswith('F') else number
+
+
+def _address(buf, pos):
+    """
+    TP-OA / TP-RA，长度单位为半字节
+
+    :return: (地址字典, 下一字段的偏移)
+    """
+    length = buf[pos]
+    toa = _TOA[buf[pos + 1]]
+    end = pos + 2 + (length + 1) // 2
+    data = buf[pos + 2:end]
+    if toa['ton'] == 'alphanumeric':
+        number = _unpack_gsm7(data, length * 4 // 7)
+    else:
+        number = _number(data)
+    return {'length': length, 'toa': dict(toa), 'number': number}, end
+
+
+def _smsc(buf):
+    length = buf[0]
+    if not length:
+        return {'length': 0, 'toa': None, 'number': None}, 1
+    toa = _TOA[buf[1]]
+    data = buf[2:1 + length]
+    number = _unpack_gsm7(data, (length - 1) * 8 // 7) if toa['ton'] == 'alphanumeric' else _number(data)
+    return {'length': length, 'toa': dict(toa), 'number': number}, 1 + length
+
+
+def _timestamp(buf, pos):
+    b = _SWAPPED_BCD
+    local = datetime(2000 + b[buf[pos]], b[buf[pos + 1]], b[buf[pos + 2]], b[buf[pos + 3]], b[buf[pos + 4]],
+                     b[buf[pos + 5]], tzinfo=_tz(buf[pos + 6]))
+    return local.astimezone(timezone.utc)
+
+
+def _user_data_header(data):
+    elements = []
+    length = data[0]
+    pos = 1
+    while pos < length + 1:
+        iei, ie_length = data[pos], data[pos + 1]
+        value = data[pos + 2:pos + 2 + ie_length]
+        pos += 2 + ie_length
+        if iei == 0x00 and ie_length >= 3:
+            value = {'reference': value[0], 'parts_count': value[1], 'part_number': value[2]}
+        elif iei == 0x08 and ie_length >= 4:
+            value = {'reference': (value[0] << 8) | value[1], 'parts_count': value[2], 'part_number': value[3]}
+        else:
+            value = bytes(value).hex().upper()
+        elements.append({'iei': iei, 'length': ie_length, 'data': value})
+    return {'length': length, 'elements': elements}
+
+
+def _user_data(buf, pos, udhi, encoding):
+    udl = buf[pos]
+    data = buf[pos + 1:]
+    header, header_length = None, 0
+    if udhi:
+        header = _user_data_header(data)
+        header_length = header['length'] + 1
+    if encoding == 'gsm':
+        # UDL 单位为 septet，UDH 之后补齐到 septet 边界
+        text = _unpack_gsm7(data[:(udl * 7 + 7) // 8], udl, (header_length * 8 + 6) // 7)
+    elif encoding == 'ucs2':
+        text = bytes(data[header_length:udl]).decode('utf-16-be', errors='replace')
+    else:
+        text = bytes(data[header_length:udl])
+    return {'header': header, 'data': text}
+
+
+def _first_octet(octet):
+    mti = MTI.get(octet & 0b11)
+    if mti is None:
+        raise ValueError("Invalid Message Type Indicator")
+    return mti
+
+
+def decode_deliver(buf):
+    """
+    解码 SMS-DELIVER，结构同 smspdudecoder.fields.SMSDeliver.decode
+
+    :param buf: PDU 字节（bytes / bytearray / memoryview），包含 SMSC 信息
+    """
+    buf = memoryview(buf)
+    smsc, pos = _smsc(buf)
+    octet = buf[pos]
+    header = {
+        'rp': bool(octet & 0x80), 'udhi': bool(octet & 0x40), 'sri': bool(octet & 0x20),
+        'lp': bool(octet & 0x08), 'mms': bool(octet & 0x04), 'mti': _first_octet(octet),
+    }
+    sender, pos = _address(buf, pos + 1)
+    pid = buf[pos]
+    encoding = _ENCODINGS[buf[pos + 1]]
+    return {
+        'smsc': smsc,
+        'header': header,
+        'sender': sender,
+        'pid': pid,
+        'dcs': {'encoding': encoding},
+        'scts': _timestamp(buf, pos + 2),
+        'user_data': _user_data(buf, pos + 9, header['udhi'], encoding),
+    }
+
+
+def decode_status_report(buf):
+    """
+    解码 SMS-STATUS-REPORT（短信回执）
+
+    :return: {'smsc', 'header', 'message_ref', 'recipient', 'scts', 'discharge_time', 'status'}，
+             status 为 TP-ST，0x00-0x1F 表示已送达
+    """
+    buf = memoryview(buf)
+    smsc, pos = _smsc(buf)
+    octet = buf[pos]
+    header = {
+        'udhi': bool(octet & 0x40), 'srq': bool(octet & 0x20), 'lp': bool(octet & 0x08),
+        'mms': bool(octet & 0x04), 'mti': _first_octet(octet),
+    }
+    message_ref = buf[pos + 1]
+    recipient, pos = _address(buf, pos + 2)
+    return {
+        'smsc': smsc,
+        'header': header,
+        'message_ref': message_ref,
+        'recipient': recipient,
+        'scts': _timestamp(buf, pos),
+        'discharge_time': _timestamp(buf, pos + 7),
+        'status': buf[pos + 14],
+    }
+
+
+def decode_pdu(pdu):
+    """
+    按 TP-MTI 解码模块上报或 AT+CMGL/AT+CMGR 返回的 PDU 十六进制字符串
+
+    :raises ValueError: PDU 不完整或格式错误
+    """
+    buf = bytes.fromhex(pdu.strip()) if isinstance(pdu, str) else bytes(pdu)
+    try:
+        mti = MTI.get(buf[1 + buf[0]] & 0b11)
+        if mti == 'status-report':
+            return decode_status_report(buf)
+        return decode_deliver(buf)
+    except IndexError:
+        raise ValueError(f"Truncated PDU: {buf.hex().upper()}") from None
+
+
+if __name__ == "__main__":
+    # 对比 smspdudecoder 与本模块的解码结果和耗时
+    import timeit
+    from io import StringIO
+
+    from smspdudecoder.fields import SMSDeliver
+
+    samples = [
+        # sms.py __main__ 中的示例
+        '0791448720003023240DD0E474D81C0EBB010000111011315214000BE474D81C0EBB5DE3771B',
+        '07917238010010F5040BC87238880900F100009930925161958003C16010',
+        '07915862337418F62410D0C3B0FC5D9F97D96C0000320113324282238CC3B0FC5D9F97D96CD0F04D2EBB40CEB2BD2C07CDD1617919947FD7E5A0F19B5C06DDD3743428ECCEBFDD65500B340CCBDFF57999CD0695DB70F63B5F2ECF41F7349B0D7297ED6539283C5F83CC6F39284D7781B2EFBA1C347E93CBA0F41C24A3C1702E50920E4ACF41F6303B4D0699DF72900CD44EBBEBF4F2DC05',
+        '07912180958739F1040B917120069876F000009140503223218A21D4F29C0E6A97E7F3F0B90CA2BF41412A68F86EB7C36E32885A9ED3CB72',
+        # UCS2 长短信分段
+        '0891683108200805F0640D91683118601060F10008425001317052230E0500030A020160A8597D4E16754C',
+    ]
+    for pdu in samples:
+        expected = SMSDeliver.decode(StringIO(pdu))
+        actual = decode_pdu(pdu)
+        status = 'same' if actual == expected else 'DIFF'
+        print(f"{status}: {actual['sender']['number']!r} {actual['user_data']['data'][:40]!r}")
+        if actual != expected:
+            for key in expected:
+                if actual[key] != expected[key]:
+                    print(f"  {key}: smspdudecoder={expected[key]!r} ours={actual[key]!r}")
+
+    # 模拟 AT+CMGL=4 读出一张存满的 SIM 卡（50 条）
+    sweep = (samples * 10)[:50]
+    number = 200
+    legacy = timeit.timeit(lambda: [SMSDeliver.decode(StringIO(pdu)) for pdu in sweep], number=number)
+    current = timeit.timeit(lambda: [decode_pdu(pdu) for pdu in sweep], number=number)
+    per_legacy = legacy / number / len(sweep) * 1e6
+    per_current = current / number / len(sweep) * 1e6
+    print(f"{len(sweep)}-message sweep: smspdudecoder {per_legacy:.1f} us/msg, "
+          f"decode_pdu {per_current:.1f} us/msg ({per_legacy / per_current:.0f}x)")
+    for pdu in samples:
+        legacy = timeit.timeit(lambda: SMSDeliver.decode(StringIO(pdu)), number=number) / number * 1e6
+        current = timeit.timeit(lambda: decode_pdu(pdu), number=number) / number * 1e6
+        print(f"  {len(pdu) // 2:3d} bytes: smspdudecoder {legacy:.1f} us, decode_pdu {current:.1f} us")
@@ -3,18 +3,34 @@ import logging
 
 import serial
 
-from services import serial_lock
+from . import metrics
+from .at_parser import ATResponseParser
 from .config_parser import config
 
 logger = logging.getLogger("PyAirLink")
 
 
 class SerialManager:
-    def __init__(self):
-        self.port = config.serial().get('port')
-        self.rate = config.serial().get('rate')
-        self.timeout = config.serial().get('timeout')
+    """
+    串口读写，本身不加锁，应只在 ModemSession 的工作线程中使用。
+    """
+    # 等待响应时单次阻塞读取的最长秒数：数据一到 read 立即返回，这个值只限制超过截止时间的最大延迟
+    READ_SLICE = 0.1
+
+    def __init__(self, port=None, settings=None, retries=120):
+        """
+        :param settings: SerialSettings，默认为 [SERIAL] 中的配置
+        :param retries: 串口异常时默认的重连次数，每次间隔 1 秒
+        """
+        serial_settings = settings or config.serial()
+        self.port = port or serial_settings.port
+        self.rate = serial_settings.rate
+        self.timeout = serial_settings.timeout
+        self.retries = retries
         self._ser = None
+        # 收到 URC 时的回调，签名为 callback(line, pdu)，pdu 仅 +CMT/+CDS 有值
+        self.urc_callback = None
+        self._parser = ATResponseParser(urc_callback=self._on_urc)
 
     def open(self):
         """
@@ -50,58 +66,117 @@ class SerialManager:
             finally:
                 self._ser = None
 
-    def send_at_command(self, command, keywords=None, timeout=3, retries=120):
+    def send_at_command(self, command, keywords=None, timeout=3, retries=None):
         """
         发送AT指令并等待响应，支持自动重连机制。
 
         :param command: 要发送的AT指令字符串
         :param keywords: 判断响应成功的关键字列表
         :param timeout: 等待响应的超时时间(秒)
-        :param retries: 最大重试次数
+        :param retries: 最大重试次数，默认为 self.retries
         :return: 命令响应字符串，或None表示失败
         """
         if not keywords:
             keywords = ['OK', 'ERROR']
         if isinstance(keywords, str):
             keywords = [keywords]
+        response = self.execute(command, keywords=keywords, timeout=timeout, retries=retries)
+        if response is None or not (response.lines or response.complete):
+            return None
+        return response.text
 
+    def execute(self, command, keywords=None, timeout=3, retries=None):
+        """
+        发送AT指令并返回结构化响应 ATResponse。
+        收到最终结果码（或 '>' 提示符）即返回；给出 keywords 时，某一行命中关键字后也会继续读到最终结果码，
+        避免残留的 OK 被下一条指令误读，超时前已命中关键字则视为完成。
+
+        :return: ATResponse，串口异常重试耗尽或发生其它错误时返回 None
+        """
+        retries = self.retries if retries is None else retries
         attempt = 0  # 当前重试次数
+        name = metrics.command_name(command)
 
         while attempt < retries:
-            with serial_lock:
-                try:
-                    # 检查串口是否已打开
-                    if self._ser is None or not self._ser.is_open:
-                        logger.warning("The serial port is not open, trying to open...")
-                        self.open()
-
-                    logger.debug(f"Sending command: {command}")
-                    self._ser.write(command)
-                    self._ser.flush()
-                    response = ''
-                    start_time = time.time()
-                    while time.time() - start_time < timeout:
-                        if self._ser.in_waiting:
-                            data = self._ser.read(self._ser.in_waiting).decode(errors='ignore')
-                            response += data
-                            for kw in keywords:
-                                if kw in response:
-                                    logger.debug(f"Matched keyword '{kw}' in response: {response}")
-                                    return response
-                        time.sleep(0.1)
-                    logger.debug(f"Waiting for keywords {keywords} Timed out: {response}")
-                    return response if response else None
-                except (serial.SerialException, serial.SerialTimeoutException, OSError) as e:
-                    logger.error(f"Serial communication error: {e}")
-                    # 尝试重连
-                    attempt += 1
-                    logger.info(f"Trying to reconnect to the serial port ({attempt} times)")
-                    self.close()  # 关闭串口，准备重新打开
-                    time.sleep(1)  # 等待一段时间再尝试
-                    continue  # 继续下一次重试
-                except Exception as e:
-                    logger.error(f"send_at_command error: {e}")
-                    return None
+            try:
+                # 检查串口是否已打开
+                if self._ser is None or not self._ser.is_open:
+                    logger.warning("The serial port is not open, trying to open...")
+                    self.open()
+
+                logger.debug(f"Sending command: {command}")
+                started = time.perf_counter()
+                response = self._parser.begin()
+                self._ser.write(command)
+                self._ser.flush()
+                matched = None
+                deadline = time.monotonic() + timeout
+                # 每条指令最多设置一次读超时；pyserial 每次修改 timeout 都会重新配置串口（tcsetattr），
+                # 不能在每次读取前按剩余时间设置
+                read_timeout = min(timeout, self.READ_SLICE)
+                if self._ser.timeout != read_timeout:
+                    self._ser.timeout = read_timeout
+                while not response.complete:
+                    if time.monotonic() >= deadline:
+                        break
+                    # 阻塞读取直到有数据或 read_timeout 到期，数据一到立即返回，不再按固定间隔轮询
+                    data = self._ser.read(self._ser.in_waiting or 1)
+                    if not data:
+                        continue
+                    # 只检查新解析出的完整行，不再对整段响应反复查找
+                    for line in self._parser.feed(data):
+                        if matched is None and keywords:
+                            matched = next((kw for kw in keywords if kw in line), None)
+                self._parser.end()
+                metrics.at_command_duration.labels(name).observe(time.perf_counter() - started)
+                if matched is not None:
+                    logger.debug(f"Matched keyword '{matched}' in response: {response}")
+                elif not response.complete:
+                    logger.debug(f"Waiting for response of {command} timed out: {response}")
+                if response.error:
+                    result = 'error'
+                elif response.complete or matched is not None:
+                    result = 'ok'
+                else:
+                    result = 'timeout'
+                metrics.at_command_results.labels(name, result).inc()
+                return response
+            except (serial.SerialException, serial.SerialTimeoutException, OSError) as e:
+                self._parser.end()
+                logger.error(f"Serial communication error: {e}")
+                metrics.serial_reconnects.labels(self.port).inc()
+                # 尝试重连
+                attempt += 1
+                logger.info(f"Trying to reconnect to the serial port ({attempt} times)")
+                self.close()  # 关闭串口，准备重新打开
+                time.sleep(1)  # 等待一段时间再尝试
+                continue  # 继续下一次重试
+            except Exception as e:
+                self._parser.end()
+                logger.error(f"send_at_command error: {e}")
+                metrics.at_command_results.labels(name, 'failed').inc()
+                return None
 
         logger.error(f"Unable to complete command send after {retries} attempts: {command}")
-        return None
\ No newline at end of file
+        metrics.at_command_results.labels(name, 'failed').inc()
+        return None
+
+    def read_unsolicited(self):
+        """
+        读取串口空闲时模块主动上报的数据，其中的 URC 交给 urc_callback。
+        不完整的行保留在解析器缓冲区中，下一次读取时继续解析。
+        """
+        if self._ser is None or not self._ser.is_open:
+            return
+        try:
+            waiting = self._ser.in_waiting
+            if not waiting:
+                return
+            self._parser.feed(self._ser.read(waiting))
+        except (serial.SerialException, OSError) as e:
+            logger.error(f"Serial communication error while reading URC: {e}")
+            self.close()
+
+    def _on_urc(self, line, pdu):
+        if self.urc_callback:
+            self.urc_callback(line, pdu)
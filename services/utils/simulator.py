@@ -0,0 +1,310 @@
+import logging
+import os
+import pty
+import random
+import threading
+import time
+import tty
+from collections import deque
+from datetime import datetime, timezone
+
+from .sms import encode_sms
+
+logger = logging.getLogger("PyAirLink")
+
+# PDU 模式下 AT+CMGL / +CMGR 中的短信状态
+STAT_UNREAD, STAT_READ = 0, 1
+
+
+def _swap_bcd(value):
+    return f'{value % 10}{value // 10}'
+
+
+def deliver_pdus(sender, text, scts=None):
+    """
+    把一条短信编码为模块收到时的 SMS-DELIVER PDU 列表，超长时按 UDH 拆分为多段。
+    由 encode_sms 生成的 SMS-SUBMIT 改写而来：去掉 TP-MR，首字节改为 SMS-DELIVER，在 TP-DCS 之后插入 TP-SCTS
+
+    :param sender: 发送方号码，如 '+8613800138000'
+    :param scts: 短信中心时间戳，带时区的 datetime，默认为当前时间
+    """
+    scts = (scts or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    timestamp = ''.join(_swap_bcd(value) for value in (scts.year % 100, scts.month, scts.day,
+                                                       scts.hour, scts.minute, scts.second)) + '00'
+    pdus = []
+    for submit, _ in encode_sms(sender, text):
+        first_octet = '44' if int(submit[2:4], 16) & 0x40 else '04'
+        address_end = 8 + 2 + (int(submit[6:8], 16) + 1) // 2 * 2
+        pdus.append('00' + first_octet + submit[6:address_end + 4] + timestamp + submit[address_end + 4:])
+    return pdus
+
+
+class FakeModem:
+    """
+    基于伪终端（pty）的模块模拟器，应答 ATCommands 中用到的指令子集，并模拟一张 SIM 卡的短信存储。
+    把 SerialManager 的 port 指向 FakeModem.port 即可在没有实体模块时调试和压测，仅支持类 Unix 系统。
+
+    - inject_sms / inject_pdu：模拟收到短信，按 AT+CNMI 的设置存入 SIM 卡并上报 +CMTI，或直接上报 +CMT
+    - inject_urc：上报任意 URC
+    - fail_next / error_rate：让指令返回 +CMS ERROR
+    - capacity：SIM 卡容量，存满后收到的短信被丢弃（计入 rejected），与实体模块一样不会上报
+    """
+
+    def __init__(self, latency=0.0, capacity=50, error_rate=0.0, seed=None):
+        """
+        :param latency: 每条应答前的模拟处理延迟(秒)
+        :param capacity: SIM 卡可存储的短信条数
+        :param error_rate: AT+CMGS 提交 PDU 后随机返回 +CMS ERROR: 500 的概率
+        """
+        self.latency = latency
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sim = {}
+        self.sent = []
+        self.rejected = 0
+        self.new_message_mode = 1
+        self._errors = deque()
+        self._random = random.Random(seed)
+        self._message_ref = 0
+        self._lock = threading.RLock()
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-modem", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def inject_sms(self, sender, text, scts=None):
+        """
+        模拟收到一条短信，长短信的各段依次到达
+
+        :return: 各段在 SIM 卡中的位置，直接上报或 SIM 卡已满时为 None
+        """
+        return [self.inject_pdu(pdu) for pdu in deliver_pdus(sender, text, scts)]
+
+    def inject_pdu(self, pdu):
+        """
+        模拟收到一条 SMS-DELIVER / SMS-STATUS-REPORT PDU
+
+        :return: 在 SIM 卡中的位置，直接上报（AT+CNMI 的 mt=2）或 SIM 卡已满时为 None
+        """
+        with self._lock:
+            if self.new_message_mode == 2:
+                self.inject_urc(f'+CMT: ,{self._tpdu_length(pdu)}', pdu)
+                return None
+            index = next((i for i in range(1, self.capacity + 1) if i not in self.sim), None)
+            if index is None:
+                self.rejected += 1
+                logger.debug("Fake modem SIM storage is full, message rejected")
+                return None
+            self.sim[index] = [STAT_UNREAD, pdu]
+            self.inject_urc(f'+CMTI: "SM",{index}')
+            return index
+
+    def inject_urc(self, line, pdu=None):
+        """
+        上报 URC，pdu 不为空时作为下一行一起上报
+        """
+        data = f'\r\n{line}\r\n' + (f'{pdu}\r\n' if pdu else '')
+        self._write(data.encode(), delay=False)
+
+    def fill_sim(self, count=None):
+        """
+        不经上报直接写入 count 条已读短信（默认写满），用于模拟 SIM 卡已满
+        """
+        with self._lock:
+            for pdu in deliver_pdus('+8610086', 'filler') * (count or self.capacity):
+                index = next((i for i in range(1, self.capacity + 1) if i not in self.sim), None)
+                if index is None:
+                    break
+                self.sim[index] = [STAT_READ, pdu]
+
+    def fail_next(self, command='AT+CMGS', code=500, count=1):
+        """
+        让接下来 count 次以 command 开头的指令返回 +CMS ERROR: code，
+        command 为 'AT+CMGS' 时在提交 PDU 之后返回（与实体模块一致）
+        """
+        with self._lock:
+            self._errors.extend([(command.upper(), code)] * count)
+
+    def _take_error(self, command):
+        with self._lock:
+            for item in self._errors:
+                if command.startswith(item[0]):
+                    self._errors.remove(item)
+                    return item[1]
+        return None
+
+    @staticmethod
+    def _tpdu_length(pdu):
+        return len(pdu) // 2 - 1 - int(pdu[:2], 16)
+
+    def _write(self, data, delay=True):
+        if delay and self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            try:
+                os.write(self._master, data)
+            except OSError:
+                # stop() 之后串口已关闭
+                pass
+
+    def _run(self):
+        buffer = b''
+        while not self._stop_event.is_set():
+            try:
+                buffer += os.read(self._master, 4096)
+            except OSError:
+                return
+            while True:
+                # PDU 数据以 Ctrl+Z 结束，其它指令以 \r 结束
+                ends = [i for i in (buffer.find(b'\x1a'), buffer.find(b'\r')) if i >= 0]
+                if not ends:
+                    break
+                end = min(ends)
+                line, terminator, buffer = buffer[:end], buffer[end:end + 1], buffer[end + 1:]
+                line = line.strip().decode(errors='ignore')
+                if terminator == b'\x1a':
+                    self._write(self._submit(line))
+                elif line:
+                    self._write(self._handle(line))
+
+    def _submit(self, pdu):
+        code = self._take_error('AT+CMGS')
+        if code is None and self.error_rate and self._random.random() < self.error_rate:
+            code = 500
+        if code is not None:
+            return f'\r\n+CMS ERROR: {code}\r\n'.encode()
+        with self._lock:
+            self.sent.append(pdu)
+            self._message_ref = (self._message_ref + 1) % 256
+            return f'\r\n+CMGS: {self._message_ref}\r\n\r\nOK\r\n'.encode()
+
+    def _handle(self, line):
+        """
+        根据指令返回应答字节
+        """
+        command = line.upper()
+        code = self._take_error(command) if not command.startswith('AT+CMGS') else None
+        if code is not None:
+            return f'\r\n+CMS ERROR: {code}\r\n'.encode()
+        if command.startswith('AT+CMGS='):
+            return b'\r\n> '
+        if command == 'AT+CPIN?':
+            return b'\r\n+CPIN: READY\r\n\r\nOK\r\n'
+        if command == 'AT+CGATT?':
+            return b'\r\n+CGATT: 1\r\n\r\nOK\r\n'
+        if command.startswith('AT+CMGL='):
+            return self._list(int(command[8:] or 4))
+        if command.startswith('AT+CMGR='):
+            return self._read(int(command[8:]))
+        if command.startswith('AT+CMGD='):
+            return self._delete(command[8:])
+        if command.startswith(('AT+CPMS', '"AT+CPMS')):
+            with self._lock:
+                used = len(self.sim)
+            return f'\r\n+CPMS: {used},{self.capacity},{used},{self.capacity},{used},{self.capacity}\r\n\r\nOK\r\n'.encode()
+        if command.startswith('AT+CNMI='):
+            params = command[8:].split(',')
+            if len(params) > 1 and params[1].isdigit():
+                self.new_message_mode = int(params[1])
+            return b'\r\nOK\r\n'
+        if command == 'AT' or command.startswith(('AT+CMGF', 'AT+CSCS', 'AT+CMMS', 'AT+RESET')):
+            return b'\r\nOK\r\n'
+        return b'\r\nERROR\r\n'
+
+    def _list(self, stat):
+        lines = []
+        with self._lock:
+            for index in sorted(self.sim):
+                record = self.sim[index]
+                if stat == 4 or record[0] == stat:
+                    lines.append(f'+CMGL: {index},{record[0]},,{self._tpdu_length(record[1])}\r\n{record[1]}\r\n')
+                    record[0] = STAT_READ
+        return ('\r\n' + ''.join(lines) + '\r\nOK\r\n').encode()
+
+    def _read(self, index):
+        with self._lock:
+            record = self.sim.get(index)
+            if record is None:
+                # 321: Invalid memory index
+                return b'\r\n+CMS ERROR: 321\r\n'
+            stat, pdu = record
+            record[0] = STAT_READ
+        return f'\r\n+CMGR: {stat},,{self._tpdu_length(pdu)}\r\n{pdu}\r\n\r\nOK\r\n'.encode()
+
+    def _delete(self, params):
+        params = [int(param) for param in params.split(',') if param.strip().isdigit()]
+        index, delflag = (params + [0, 0])[:2] if params else (0, 0)
+        with self._lock:
+            if delflag == 0:
+                self.sim.pop(index, None)
+            else:
+                # 1 已读，2 已读和已发送，3 已读、已发送和未发送，4 全部；模拟器只存储收到的短信
+                for i in [i for i, record in self.sim.items() if delflag == 4 or record[0] == STAT_READ]:
+                    del self.sim[i]
+        return b'\r\nOK\r\n'
+
+
+if __name__ == "__main__":
+    # 对比旧的 in_waiting + sleep(0.1) 轮询读取与当前按截止时间阻塞读取的往返延迟
+    from statistics import median
+
+    import serial
+
+    from services.utils.commands import at_commands
+    from services.utils.serial_manager import SerialManager
+
+    def legacy_send_at_command(ser, command, keywords, timeout=3):
+        ser.write(command)
+        ser.flush()
+        response = ''
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            if ser.in_waiting:
+                response += ser.read(ser.in_waiting).decode(errors='ignore')
+                if any(kw in response for kw in keywords):
+                    return response
+            time.sleep(0.1)
+        return response
+
+    def send_sms_steps(send):
+        send(at_commands.cmgf(), ['OK', 'ERROR'])
+        send(at_commands.cmgs(20), ['>'])
+        send(b'0001000D91683108108300F0000800044F60597D' + b'\x1A', ['+CMGS:'])
+
+    rounds = 20
+    for latency in (0.0, 0.005, 0.02):
+        with FakeModem(latency=latency) as modem:
+            with serial.Serial(modem.port, 115200, timeout=1) as ser:
+                legacy = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    send_sms_steps(lambda command, keywords: legacy_send_at_command(ser, command, keywords))
+                    legacy.append(time.perf_counter() - start)
+            with SerialManager(port=modem.port) as serial_manager:
+                current = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    send_sms_steps(lambda command, keywords: serial_manager.send_at_command(command, keywords=keywords))
+                    current.append(time.perf_counter() - start)
+        print(f"latency {latency * 1000:.0f} ms, CMGF+CMGS+PDU median: "
+              f"legacy {median(legacy) * 1000:.1f} ms, current {median(current) * 1000:.1f} ms")
@@ -1,34 +1,197 @@
+import itertools
 import logging
+import random
+import threading
+import time
+from collections import OrderedDict
 
-from smspdudecoder.fields import SMSDeliver
-from smspdudecoder.codecs import UCS2
+from smspdudecoder.codecs import GSM
 from smspdudecoder.elements import Number, TypeOfAddress
 
+from .pdu import decode_pdu
 
 logger = logging.getLogger("PyAirLink")
 
 
 def parse_pdu(pdu):
     """
-    简单解析 PDU 格式短信
+    解析 PDU 格式短信（十六进制字符串），SMS-DELIVER 的结构同 smspdudecoder 的 SMSDeliver.decode，
+    短信回执(SMS-STATUS-REPORT)见 decode_status_report
     """
     try:
-        sms_data = SMSDeliver.decode(pdu)
+        sms_data = decode_pdu(pdu)
         return sms_data
     except Exception as e:
         logger.error(f"PDU parsing failed: {e}")
         raise e
 
 
+# 单条短信的用户数据最多 140 字节：GSM 7-bit 为 160 个字符，UCS2 为 70 个字符；
+# 长短信每段需留出 6 字节 UDH，分别为 153 / 67 个字符
+GSM7_SINGLE_SEPTETS = 160
+GSM7_CONCAT_SEPTETS = 153
+UCS2_SINGLE_UNITS = 70
+UCS2_CONCAT_UNITS = 67
+# 长短信最多拆分的段数
+MAX_SEGMENTS = 10
+
+# GSM 7-bit 默认字母表与扩展表的查找表，扩展表字符以 ESC(0x1B) 开头占两个 septet
+_GSM7_BASIC = {char: index for index, char in enumerate(GSM.ALPHABET) if index != GSM.CHAR_EXT}
+_GSM7_EXT = GSM.ALPHABET_EXT_INV
+
+# 长短信参考号，同一条长短信的各段相同，0-255 循环使用
+_concat_ref = itertools.count(random.randrange(256))
+_concat_ref_lock = threading.Lock()
+
+
+def _next_concat_ref():
+    with _concat_ref_lock:
+        return next(_concat_ref) % 256
+
+
+def to_gsm7(message):
+    """
+    转换为 GSM 7-bit 的 septet 列表，含默认字母表和扩展表都无法表示的字符时返回 None
+    """
+    septets = []
+    for char in message:
+        index = _GSM7_BASIC.get(char)
+        if index is not None:
+            septets.append(index)
+            continue
+        index = _GSM7_EXT.get(char)
+        if index is None:
+            return None
+        septets.append(GSM.CHAR_EXT)
+        septets.append(index)
+    return septets
+
+
+def split_gsm7(septets):
+    """
+    按 GSM 7-bit 拆分 septet 列表，不会把扩展字符的 ESC 与字符拆到两段中
+    """
+    if len(septets) <= GSM7_SINGLE_SEPTETS:
+        return [septets]
+    segments = []
+    start = 0
+    while start < len(septets):
+        end = min(start + GSM7_CONCAT_SEPTETS, len(septets))
+        # 默认字母表中不含 ESC，段尾的 ESC 一定是扩展字符的前缀，留给下一段
+        if end < len(septets) and septets[end - 1] == GSM.CHAR_EXT:
+            end -= 1
+        segments.append(septets[start:end])
+        start = end
+    return segments
+
+
+def split_ucs2(message):
+    """
+    按 UCS2 编码拆分短信内容，返回每段的 UTF-16BE 字节，不会把代理对（如 emoji）拆到两段中
+    """
+    data = message.encode('utf-16be')
+    if len(data) <= UCS2_SINGLE_UNITS * 2:
+        return [data]
+    segments = []
+    size = UCS2_CONCAT_UNITS * 2
+    start = 0
+    while start < len(data):
+        end = min(start + size, len(data))
+        # 段尾是高位代理时，把它留给下一段
+        if end < len(data) and 0xD8 <= data[end - 2] <= 0xDB:
+            end -= 2
+        segments.append(data[start:end])
+        start = end
+    return segments
+
+
+def split_sms(message):
+    """
+    选择能表示全部内容且最省段数的编码并拆分：GSM 7-bit（含扩展表）优先，否则使用 UCS2
+
+    :return: (编码 'gsm7' 或 'ucs2', 分段列表)
+    """
+    septets = to_gsm7(message)
+    if septets is not None:
+        return 'gsm7', split_gsm7(septets)
+    return 'ucs2', split_ucs2(message)
+
+
+def count_segments(message):
+    """
+    预估短信的编码与段数
+
+    :return: (编码, 段数)
+    """
+    encoding, segments = split_sms(message)
+    return encoding, len(segments)
+
+
 def encode_pdu(destination_number, message):
-    if len(message) > 70:
+    encoding, segments = split_sms(message)
+    if len(segments) > 1:
         raise ValueError("Message too long")
+    return _encode_segment(destination_number, encoding, segments[0])
 
+
+def encode_sms(destination_number, message):
+    """
+    编码短信，超过单条长度时按 UDH 长短信拆分，各段带相同的参考号与各自的序号
+
+    :return: [(pdu, pdu_length), ...]
+    """
+    encoding, segments = split_sms(message)
+    if len(segments) == 1:
+        return [_encode_segment(destination_number, encoding, segments[0])]
+    if len(segments) > MAX_SEGMENTS:
+        raise ValueError(f"Message too long, more than {MAX_SEGMENTS} segments")
+    ref = _next_concat_ref()
+    total = len(segments)
+    return [
+        # UDH：长度05，IEI 00（8位参考号长短信），IE长度03，参考号，总段数，当前序号
+        _encode_segment(destination_number, encoding, segment, udh=f'050003{ref:02X}{total:02X}{seq:02X}')
+        for seq, segment in enumerate(segments, start=1)
+    ]
+
+
+def _pack_septets(septets, fill_bits=0):
+    """
+    把 septet 按 GSM 03.38 从低位开始打包为字节，fill_bits 为 UDH 之后补齐 septet 边界的填充位数
+    """
+    packed = bytearray()
+    acc = 0
+    bits = fill_bits
+    for septet in septets:
+        acc |= septet << bits
+        bits += 7
+        while bits >= 8:
+            packed.append(acc & 0xFF)
+            acc >>= 8
+            bits -= 8
+    if bits:
+        packed.append(acc & 0xFF)
+    return bytes(packed)
+
+
+def _encode_segment(destination_number, encoding, segment, udh=None):
+    udh = udh or ''
+    if encoding == 'gsm7':
+        # TP-DCS = 00 (GSM 7-bit)，TP-UDL 为 septet 数，UDH 之后要补齐到 septet 边界
+        header_bits = len(udh) // 2 * 8
+        header_septets = (header_bits + 6) // 7
+        user_data = udh + _pack_septets(segment, header_septets * 7 - header_bits).hex().upper()
+        return _encode_submit(destination_number, "00", header_septets + len(segment), user_data, udhi=bool(udh))
+    # TP-DCS = 08 (UCS2编码)，TP-UDL 为 UDH 与内容的字节数
+    user_data = udh + segment.hex().upper()
+    return _encode_submit(destination_number, "08", len(user_data) // 2, user_data, udhi=bool(udh))
+
+
+def _encode_submit(destination_number, tp_dcs, udl, user_data, udhi=False):
     # 假设使用默认SMSC
     smsc_len = "00"
 
-    # First Octet: SMS-SUBMIT，一般为0x11或0x01，如果是11需要做别的改动
-    first_octet = "01"
+    # First Octet: SMS-SUBMIT，0x01；带 UDH 的长短信需置 TP-UDHI 位，为 0x41
+    first_octet = "41" if udhi else "01"
 
     # TP-MR(消息参考号)，可用固定值或计数器
     tp_mr = "00"
@@ -46,12 +209,8 @@ def encode_pdu(destination_number, message):
     # TP-PID = 00（普通SMS）
     tp_pid = "00"
 
-    # TP-DCS = 08 (UCS2编码)
-    tp_dcs = "08"
-
-    # 编码短信内容为UCS2
-    ucs2_data = UCS2.encode(message)
-    ucs2_len = f"{len(ucs2_data) // 2:02X}"
+    # TP-UDL
+    ud_len = f"{udl:02X}"
 
     # 拼接PDU：SMSC + FirstOctet + TP-MR + DA-Length + TOA + DA-Number + TP-PID + TP-DCS + TP-UDL + TP-UD
     pdu = (
@@ -60,7 +219,7 @@ def encode_pdu(destination_number, message):
             tp_mr +
             num_len + toa + encoded_number +
             tp_pid + tp_dcs +
-            ucs2_len + ucs2_data
+            ud_len + user_data
     )
 
     # 计算AT+CMGS中的长度
@@ -70,8 +229,113 @@ def encode_pdu(destination_number, message):
     return pdu, pdu_length
 
 
+def concat_info(sms_data):
+    """
+    取出解析后短信的长短信信息
+
+    :return: (参考号, 总段数, 序号)，不是长短信时返回 None
+    """
+    header = (sms_data.get('user_data') or {}).get('header')
+    if not header:
+        return None
+    for element in header.get('elements', []):
+        if element.get('iei') in (0x00, 0x08) and isinstance(element.get('data'), dict):
+            data = element['data']
+            return data['reference'], data['parts_count'], data['part_number']
+    return None
+
+
+class SMSReassembler:
+    """
+    长短信重组缓冲区。
+    分段按 (发送方, 参考号) 归组，收齐后合并为一条短信返回；缓冲区最多保留 max_entries 组，
+    超过 max_age 秒仍未收齐或因容量被挤出的分组，按已收到的分段合并后返回，避免内容丢失。
+    """
+
+    def __init__(self, max_entries=64, max_age=300):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._groups = OrderedDict()
+
+    def add(self, sms_data):
+        """
+        加入一条解析后的短信
+
+        :return: 可以推送的短信列表，普通短信原样返回，长短信只有收齐（或过期）时才返回合并结果
+        """
+        info = concat_info(sms_data)
+        if info is None:
+            return [sms_data]
+        ref, total, seq = info
+        if total <= 1:
+            return [sms_data]
+        key = (sms_data.get('sender', {}).get('number'), ref, total)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {'created': time.monotonic(), 'total': total, 'parts': {}}
+        group['parts'][seq] = sms_data
+        ready = []
+        if len(group['parts']) == total:
+            del self._groups[key]
+            ready.extend(self._flush(group))
+        while len(self._groups) > self.max_entries:
+            _, evicted = self._groups.popitem(last=False)
+            logger.warning(f"Concatenated SMS buffer is full, forwarding incomplete message "
+                           f"({len(evicted['parts'])}/{evicted['total']} parts)")
+            ready.extend(self._flush(evicted))
+        return ready
+
+    def expire(self):
+        """
+        取出已超过 max_age 的未完成分组，需定期调用
+        """
+        now = time.monotonic()
+        ready = []
+        for key in [key for key, group in self._groups.items() if now - group['created'] > self.max_age]:
+            group = self._groups.pop(key)
+            logger.warning(f"Concatenated SMS timed out, forwarding incomplete message "
+                           f"({len(group['parts'])}/{group['total']} parts)")
+            ready.extend(self._flush(group))
+        return ready
+
+    def _flush(self, group):
+        """
+        合并分组，合并失败时记录日志并把各分段原样返回，分组已从缓冲区取出，不能因异常丢失
+        """
+        try:
+            return [self._merge(group)]
+        except Exception as e:
+            logger.error(f"Unable to merge concatenated SMS, forwarding {len(group['parts'])} part(s) separately: {e}")
+            return [group['parts'][seq] for seq in sorted(group['parts'])]
+
+    @staticmethod
+    def _merge(group):
+        parts = [group['parts'][seq] for seq in sorted(group['parts'])]
+        merged = dict(parts[0])
+        merged['user_data'] = dict(parts[0]['user_data'])
+        data = [part['user_data']['data'] for part in parts]
+        if any(isinstance(item, bytes) for item in data):
+            # 8-bit 编码（二进制）的长短信，各分段为 bytes
+            merged['user_data']['data'] = b''.join(item if isinstance(item, bytes) else (item or '').encode()
+                                                   for item in data)
+        else:
+            merged['user_data']['data'] = ''.join(item or '' for item in data)
+        if any(part.get('pdu') for part in parts):
+            merged['pdu'] = '\n'.join(part.get('pdu') or '' for part in parts)
+        merged['indexes'] = [part['index'] for part in parts if part.get('index') is not None]
+        return merged
+
+
+def sms_indexes(sms_data):
+    """
+    短信在 SIM 卡中的位置列表：合并后的长短信为各分段的位置，直接上报（+CMT）的短信为空列表
+    """
+    if 'indexes' in sms_data:
+        return sms_data['indexes']
+    return [sms_data['index']] if sms_data.get('index') is not None else []
+
+
 if __name__ == "__main__":
-    from io import StringIO
     test = [
         '0791448720003023240DD0E474D81C0EBB010000111011315214000BE474D81C0EBB5DE3771B',
         '07917238010010F5040BC87238880900F100009930925161958003C16010',
@@ -79,4 +343,20 @@ if __name__ == "__main__":
         '07912180958739F1040B917120069876F000009140503223218A21D4F29C0E6A97E7F3F0B90CA2BF41412A68F86EB7C36E32885A9ED3CB72',
     ]
     for t in test:
-        print(parse_pdu(StringIO(t)))
\ No newline at end of file
+        print(parse_pdu(t))
+
+    # 编码吞吐与段数：纯 ASCII 告警自动选择 GSM 7-bit，对比强制 UCS2 的结果
+    import timeit
+
+    samples = {
+        'ascii alert': '[ALERT] disk usage on db-01 is 91%, threshold 90%. Check /var/lib/postgresql {ref #4711}',
+        'ascii long': 'Your verification code is 123456. It expires in 5 minutes. ' * 4,
+        'chinese': '您的验证码为123456，5分钟内有效，请勿泄露给他人。' * 2,
+    }
+    for name, text in samples.items():
+        encoding, segments = count_segments(text)
+        ucs2_segments = len(split_ucs2(text))
+        number = 2000
+        seconds = timeit.timeit(lambda: encode_sms('+8613800138000', text), number=number)
+        print(f"{name}: {len(text)} chars, {encoding} {segments} segment(s) (ucs2 would need {ucs2_segments}), "
+              f"{number / seconds:.0f} messages/s")
\ No newline at end of file
@@ -0,0 +1,69 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("PyAirLink")
+
+
+class TokenProvider:
+    """
+    带有效期的访问令牌缓存，适用于企业微信 access_token 这类需先换取令牌再调用接口的渠道。
+
+    fetch() 返回 (token, expires_in秒)。令牌在到期前 refresh_margin 秒进入刷新窗口：
+    此时只有一个线程去刷新，其余线程继续使用当前仍有效的令牌；令牌已过期或不存在时，
+    其余线程等待正在进行的那一次获取，不会同时请求令牌接口（single-flight）。
+    """
+
+    def __init__(self, fetch, refresh_margin=300, name='token'):
+        self.name = name
+        self.refresh_margin = refresh_margin
+        self._fetch = fetch
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        token, expires_at = self._token, self._expires_at
+        now = time.monotonic()
+        if token and now < self._refresh_at:
+            return token
+        if token and now < expires_at:
+            # 即将过期：抢到锁的线程提前刷新，其它线程直接使用当前令牌
+            if self._lock.acquire(blocking=False):
+                try:
+                    if self._token == token:
+                        self._refresh()
+                except Exception as e:
+                    logger.warning(f"{self.name}: proactive token refresh failed, keep using current token: {e}")
+                finally:
+                    self._lock.release()
+            return self._token or token
+        with self._lock:
+            # 等锁期间其它线程可能已经获取到新令牌
+            if self._token and time.monotonic() < self._expires_at:
+                return self._token
+            self._refresh()
+            return self._token
+
+    def invalidate(self, token=None):
+        """
+        令牌被服务端判定无效或过期时调用；传入 token 时只有它仍是当前令牌才作废，避免误删刚刷新的令牌
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+                self._refresh_at = 0.0
+
+    def _refresh(self):
+        token, expires_in = self._fetch()
+        if not token:
+            raise ValueError(f"{self.name}: empty token returned")
+        expires_in = int(expires_in)
+        now = time.monotonic()
+        self._token = token
+        self._expires_at = now + expires_in
+        # 有效期很短时，最晚在有效期过半时开始刷新
+        self._refresh_at = now + max(expires_in - self.refresh_margin, expires_in / 2)
+        logger.info(f"{self.name}: token refreshed, expires in {expires_in}s")